@@ -0,0 +1,75 @@
+"""
+Benchmarks of the scanner and the Dash hot paths, run with pytest-benchmark:
+
+    python -m pytest benchmarks --benchmark-autosave
+
+The results are stored as JSON in .benchmarks/ and can be compared across commits
+with --benchmark-compare or pytest-benchmark compare. Use --benchmark-json=<file>
+to write them to a specific file instead.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from molecule_scanner.buried_volume import read_xyz
+
+pytest.importorskip("pytest_benchmark")
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "data"
+)
+MOLECULES = ["mad25_p", "GC1", "nhc"]
+
+# number of copies along each axis of the synthetic clusters
+CLUSTER_SIZES = [2, 3]
+
+ATOM_IDS = dict(
+    sphere_center_atom_ids=[1],
+    z_ax_atom_ids=[2],
+    xz_plane_atoms_ids=[1, 3, 9],
+    atoms_to_delete_ids=[1],
+)
+
+
+def write_cluster(filename, copies, xyz_filepath=None):
+    """Write a cubic cluster of copies**3 translated copies of a molecule.
+
+    The first copy is the original molecule, so the atom IDs of the bundled
+    molecule can be used for the cluster as well.
+    """
+    if xyz_filepath is None:
+        xyz_filepath = os.path.join(DATA_DIR, "mad25_p.xyz")
+    elements, coords = read_xyz(xyz_filepath)
+    spacing = np.ptp(coords, axis=0) + 2.0
+    shifts = [
+        np.array([i, j, k]) * spacing
+        for i in range(copies)
+        for j in range(copies)
+        for k in range(copies)
+    ]
+    with open(filename, "w") as file:
+        file.write(f"{len(elements) * len(shifts)}\n")
+        file.write(f"cluster of {len(shifts)} copies of {xyz_filepath}\n")
+        for shift in shifts:
+            for element, coord in zip(elements, coords + shift):
+                file.write(
+                    f"{element:<3}{coord[0]:16.8f}{coord[1]:16.8f}{coord[2]:16.8f}\n"
+                )
+    return filename
+
+
+@pytest.fixture(scope="session")
+def cluster_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("clusters")
+    return {
+        copies: write_cluster(str(directory / f"cluster_{copies}.xyz"), copies)
+        for copies in CLUSTER_SIZES
+    }
+
+
+@pytest.fixture(params=MOLECULES + [f"cluster_{copies}" for copies in CLUSTER_SIZES])
+def xyz_filepath(request, cluster_files):
+    if request.param.startswith("cluster_"):
+        return cluster_files[int(request.param.split("_")[1])]
+    return os.path.join(DATA_DIR, f"{request.param}.xyz")
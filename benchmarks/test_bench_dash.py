@@ -0,0 +1,50 @@
+import pytest
+import xyz_py as xyzp
+
+from molecule_scanner.bonds import find_bonds
+from molecule_scanner.buried_volume import read_xyz
+from molecule_scanner.scanner import MoleculeScanner as msc
+
+from .conftest import ATOM_IDS, DATA_DIR
+
+dash_app = pytest.importorskip("molecule_scanner.dash_app")
+
+
+def test_create_3d_viewer(benchmark, xyz_filepath):
+    benchmark.extra_info["molecule"] = xyz_filepath
+
+    def create_uncached():
+        dash_app._viewer_models.clear()
+        return dash_app.create_3d_viewer(xyz_filepath)
+
+    benchmark.pedantic(create_uncached, rounds=3)
+
+
+def test_find_bonds(benchmark, xyz_filepath):
+    labels, coords = xyzp.load_xyz(xyz_filepath, add_indices=True)
+    benchmark.extra_info["molecule"] = xyz_filepath
+    benchmark.pedantic(
+        xyzp.find_bonds, args=(labels, coords), kwargs=dict(style="indices"), rounds=3
+    )
+
+
+def test_find_bonds_cell_grid(benchmark, xyz_filepath):
+    elements, coords = read_xyz(xyz_filepath)
+    benchmark.extra_info["molecule"] = xyz_filepath
+    benchmark(find_bonds, elements, coords)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+@pytest.mark.parametrize("name", ["Top", "3D"])
+def test_cavity_figure(benchmark, name, cached):
+    msc_test = msc(f"{DATA_DIR}/mad25_p.xyz", backend="numpy", **ATOM_IDS)
+    cavity_map = dash_app.freeze_arrays(msc_test.steric_map(3.5, 0.05))
+
+    def display():
+        if not cached:
+            dash_app.clear_figures("cavity")
+        return dash_app.get_figure(
+            ("cavity", "bench", name), dash_app.build_cavity_figure, cavity_map, name
+        )
+
+    benchmark(display)
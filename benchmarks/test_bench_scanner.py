@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from molecule_scanner import buried_volume
+from molecule_scanner.scanner import MoleculeScanner as msc
+from molecule_scanner.spatial_index import CellList
+
+from .conftest import ATOM_IDS, DATA_DIR
+
+MAD25_P = os.path.join(DATA_DIR, "mad25_p.xyz")
+
+
+@pytest.mark.parametrize("backend", ["sambvca", "numpy"])
+def test_run_single(benchmark, xyz_filepath, backend):
+    msc_test = msc(xyz_filepath=xyz_filepath, backend=backend, **ATOM_IDS)
+    benchmark.extra_info["molecule"] = xyz_filepath
+    benchmark(msc_test.run_single, sphere_radius=3.5, write_surf_files=False)
+
+
+@pytest.mark.parametrize("executor", ["threads", "processes"])
+@pytest.mark.parametrize("nsteps", [10, 50])
+@pytest.mark.parametrize("backend", ["sambvca", "numpy"])
+def test_run_range(benchmark, backend, nsteps, executor):
+    msc_test = msc(xyz_filepath=MAD25_P, backend=backend, **ATOM_IDS)
+    benchmark.pedantic(
+        msc_test.run_range,
+        kwargs=dict(
+            r_min=2,
+            r_max=7,
+            nsteps=nsteps,
+            write_surf_files=False,
+            executor=executor,
+        ),
+        rounds=3,
+    )
+
+
+@pytest.mark.parametrize("nsteps", [50, 1000])
+def test_run_range_sweep(benchmark, nsteps):
+    msc_test = msc(xyz_filepath=MAD25_P, backend="numpy", **ATOM_IDS)
+    benchmark.pedantic(
+        msc_test.run_range,
+        kwargs=dict(r_min=2, r_max=7, nsteps=nsteps, sweep=True),
+        rounds=3,
+    )
+
+
+@pytest.mark.parametrize("mesh_size", [0.2, 0.1, 0.05])
+@pytest.mark.parametrize("backend", ["sambvca", "numpy"])
+def test_generate_cavity(benchmark, backend, mesh_size):
+    msc_test = msc(xyz_filepath=MAD25_P, backend=backend, **ATOM_IDS)
+    benchmark.pedantic(msc_test.generate_cavity, args=(3.5, mesh_size), rounds=3)
+
+
+@pytest.mark.parametrize("mesh_size", [0.2, 0.1, 0.05])
+def test_reshape_data(benchmark, mesh_size):
+    msc_test = msc(xyz_filepath=MAD25_P, backend="numpy", **ATOM_IDS)
+    df_cavity = msc_test.generate_cavity(3.5, mesh_size)
+    benchmark(msc_test.reshape_data, df_cavity)
+
+
+@pytest.mark.parametrize("mesh_size", [0.2, 0.1, 0.05])
+def test_steric_map(benchmark, mesh_size):
+    msc_test = msc(xyz_filepath=MAD25_P, backend="numpy", **ATOM_IDS)
+    benchmark.pedantic(msc_test.steric_map, args=(3.5, mesh_size), rounds=3)
+
+
+def test_cell_list(benchmark, xyz_filepath):
+    msc_test = msc(xyz_filepath=xyz_filepath, backend="numpy", **ATOM_IDS)
+    coords, radii = msc_test._prepare_atoms(0.0, True, True, "default")
+    benchmark.extra_info["molecule"] = xyz_filepath
+    benchmark(CellList, coords, radii)
+
+
+@pytest.fixture(scope="module")
+def surface_file():
+    msc_test = msc(xyz_filepath=MAD25_P, backend="numpy", **ATOM_IDS)
+    top_file, _, _ = msc_test.run_single(3.5, mesh_size=0.05, return_surface_files=True)
+    return top_file
+
+
+@pytest.mark.parametrize("parser", ["frombuffer", "loadtxt"])
+def test_parse_surface_file(benchmark, surface_file, parser):
+    if parser == "loadtxt":
+        # the previous line by line parser, for comparison
+        benchmark(np.loadtxt, surface_file, usecols=(0, 1, 2), ndmin=2)
+    else:
+        benchmark(buried_volume.parse_surface_file, surface_file)
@@ -0,0 +1,96 @@
+"""
+Bond perception from covalent radii on a uniform cell grid.
+
+Two atoms are bonded if their distance is below the sum of their covalent
+radii plus a tolerance, the same criterion as the ASE neighbor list used by
+xyz_py.find_bonds. Atoms are binned into cells of the largest possible bond
+length, so only atoms in neighboring cells are compared and the cost grows
+linearly with the number of atoms.
+"""
+import re
+
+import numpy as np
+from ase.data import atomic_numbers, covalent_radii
+
+# xyz_py builds the ASE neighbor list with a skin of 0.3 Angstrom per atom
+BOND_TOLERANCE = 0.6
+
+# the 13 neighbor cells in one half space plus the cell itself
+_HALF_SHELL = np.array(
+    [(0, 0, 0)]
+    + [
+        (i, j, k)
+        for i in (-1, 0, 1)
+        for j in (-1, 0, 1)
+        for k in (-1, 0, 1)
+        if (i, j, k) > (0, 0, 0)
+    ]
+)
+
+
+def element_symbol(label):
+    """Element symbol of an atom label, e.g. "Ru01" -> "Ru"."""
+    return re.sub(r"[^A-Za-z]", "", label).capitalize()
+
+
+def get_covalent_radii(elements):
+    """Covalent radii in Angstrom of the given element symbols or atom labels."""
+    try:
+        return np.array(
+            [
+                covalent_radii[atomic_numbers[element_symbol(label)]]
+                for label in elements
+            ]
+        )
+    except KeyError as e:
+        raise ValueError(f"No covalent radius is known for element {e}.") from None
+
+
+def find_bonds(elements, coords, tolerance=BOND_TOLERANCE):
+    """Find all bonded atom pairs.
+
+    Args:
+        elements (list): Element symbols or atom labels.
+        coords (numpy.ndarray): (n_atoms, 3) coordinates in Angstrom.
+        tolerance (float): Added to the sum of the covalent radii (default 0.6)
+
+    Returns:
+        numpy.ndarray: (n_bonds, 2) atom indices with the lower index first, sorted.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    if len(coords) < 2:
+        return np.zeros((0, 2), dtype=int)
+    radii = get_covalent_radii(elements)
+    cell_size = 2.0 * radii.max() + tolerance
+
+    cell = np.floor((coords - coords.min(axis=0)) / cell_size).astype(int)
+    # one padding cell on every side, so neighbor cells never wrap around
+    shape = cell.max(axis=0) + 3
+    cell_ids = np.ravel_multi_index((cell + 1).T, shape)
+
+    order = np.argsort(cell_ids, kind="stable")
+    counts = np.bincount(cell_ids, minlength=np.prod(shape))
+    starts = np.concatenate([[0], np.cumsum(counts)])
+
+    pairs = []
+    center = np.ravel_multi_index((1, 1, 1), shape)
+    for offset in _HALF_SHELL:
+        neighbor = cell_ids + np.ravel_multi_index(tuple(offset + 1), shape) - center
+        n_candidates = counts[neighbor]
+        first = np.repeat(np.arange(len(coords)), n_candidates)
+        # position of every candidate within the atoms of its cell
+        within = np.arange(n_candidates.sum()) - np.repeat(
+            np.cumsum(n_candidates) - n_candidates, n_candidates
+        )
+        second = order[np.repeat(starts[neighbor], n_candidates) + within]
+        if not offset.any():
+            keep = first < second
+            first, second = first[keep], second[keep]
+        pairs.append(np.stack([first, second], axis=1))
+    pairs = np.concatenate(pairs)
+
+    delta = coords[pairs[:, 0]] - coords[pairs[:, 1]]
+    distance2 = np.einsum("ij,ij->i", delta, delta)
+    cutoff = radii[pairs[:, 0]] + radii[pairs[:, 1]] + tolerance
+    bonds = np.sort(pairs[distance2 < cutoff * cutoff], axis=1)
+    return bonds[np.lexsort((bonds[:, 1], bonds[:, 0]))]
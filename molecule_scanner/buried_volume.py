@@ -0,0 +1,618 @@
+"""
+In-process NumPy implementation of the sambvca21 buried volume calculation.
+
+The functions in this module mirror the steps of the Fortran program:
+the molecule is oriented along the given axes, the deleted and (optionally)
+hydrogen atoms are removed and a cubic voxel mesh inside the sphere is tested
+against the scaled atom radii. The results use the same dictionary layout as
+py2sambvca.parse_output.
+"""
+import os
+import re
+
+import numpy as np
+from py2sambvca.radii_tables import table_lookup
+
+
+QUADRANT_NAMES = ["SW", "NW", "NE", "SE"]
+OCTANT_NAMES = ["SW-z", "NW-z", "NE-z", "SE-z", "SW+z", "NW+z", "NE+z", "SE+z"]
+
+# (x side, y side) of the quadrants in the order above, 0 = negative, 1 = positive
+_QUADRANT_SIDES = [(0, 0), (0, 1), (1, 1), (1, 0)]
+
+# upper bound for the number of voxels held in memory at once
+_MAX_SLAB_VOXELS = 2_000_000
+
+# names of the surface files written by sambvca21 for the py2sambvca input
+TOP_SURFACE_FILE = "py2sambvca_input-TopSurface.dat"
+BOTTOM_SURFACE_FILE = "py2sambvca_input-BotSurface.dat"
+
+
+def _read_xyz_frame(file):
+    """Read the next frame from an open .xyz file, None at the end of the file."""
+    header = file.readline()
+    while header and not header.strip():
+        header = file.readline()
+    if not header:
+        return None
+    n_atoms = int(header.split()[0])
+    comment = file.readline().rstrip("\n")
+    elements = []
+    coords = []
+    for _ in range(n_atoms):
+        line = file.readline().split()
+        if len(line) < 4:
+            raise ValueError(
+                f"Incomplete frame in .xyz file, expected {n_atoms} atoms."
+            )
+        elements.append(line[0])
+        coords.append([float(value) for value in line[1:4]])
+    return np.asarray(elements), np.asarray(coords, dtype=float), comment
+
+
+def read_xyz(xyz_filepath):
+    """Read the first frame of a .xyz file.
+
+    Args:
+        xyz_filepath (str): Location of the .xyz file.
+
+    Returns:
+        tuple: numpy arrays with the element symbols and the (n_atoms, 3) coordinates.
+    """
+    with open(xyz_filepath, "r") as file:
+        elements, coords, _ = _read_xyz_frame(file)
+    return elements, coords
+
+
+def iter_xyz_frames(xyz_filepath):
+    """Read the frames of a multi-frame .xyz file one at a time.
+
+    Args:
+        xyz_filepath (str): Location of the .xyz file.
+
+    Yields:
+        tuple: element symbols, (n_atoms, 3) coordinates and the comment line of a frame.
+    """
+    with open(xyz_filepath, "r") as file:
+        while True:
+            frame = _read_xyz_frame(file)
+            if frame is None:
+                return
+            yield frame
+
+
+def write_xyz(xyz_filepath, elements, coords, comment=""):
+    """Write a single frame .xyz file."""
+    with open(xyz_filepath, "w") as file:
+        file.write(f"{len(elements)}\n{comment}\n")
+        for element, (x, y, z) in zip(elements, coords):
+            file.write(f"{element:<4} {x:16.8f} {y:16.8f} {z:16.8f}\n")
+
+
+def get_atom_radii(elements, radii_table="default"):
+    """Look up the sphere radius for every atom.
+
+    Args:
+        elements (array): Element symbols of the atoms.
+        radii_table (dict or str): "default", "vdw" or a mapping of element symbols to radii.
+
+    Returns:
+        numpy.ndarray: The radius of each atom in Angstrom.
+    """
+    if isinstance(radii_table, str):
+        radii_table = table_lookup[radii_table]
+    # sambvca only receives the radii with two decimals
+    radii_table = {
+        element.upper(): round(radius, 2) for element, radius in radii_table.items()
+    }
+    try:
+        return np.array([radii_table[element.upper()] for element in elements])
+    except KeyError as e:
+        raise ValueError(f"Can't find atom type for atom {e.args[0]}") from e
+
+
+def _mean_position(coords, atom_ids, name):
+    atom_ids = np.asarray(atom_ids, dtype=int)
+    if np.any(atom_ids < 1) or np.any(atom_ids > len(coords)):
+        raise ValueError(f"wrong atoms to define {name}")
+    return coords[atom_ids - 1].mean(axis=0)
+
+
+def _unit(vector):
+    return vector / np.linalg.norm(vector)
+
+
+def orient_coordinates(
+    coords,
+    sphere_center_atom_ids,
+    z_ax_atom_ids,
+    xz_plane_atoms_ids,
+    orient_z=True,
+    displacement=0.0,
+):
+    """Move the sphere center to the origin and rotate the molecule onto the given axes.
+
+    Args:
+        coords (numpy.ndarray): (n_atoms, 3) atom coordinates.
+        sphere_center_atom_ids (list): ID of atoms defining the sphere center (starting at 1)
+        z_ax_atom_ids (list): ID of atoms for z-axis
+        xz_plane_atoms_ids (list): ID of atoms for xz-plane
+        orient_z (bool): Molecule oriented along positive/negative Z-axis (default True)
+        displacement (float): Displacement of oriented molecule from sphere center in Angstrom (default 0.0)
+
+    Returns:
+        numpy.ndarray: The oriented coordinates.
+    """
+    center = _mean_position(coords, sphere_center_atom_ids, "geometry center")
+    z_axis = _unit(_mean_position(coords, z_ax_atom_ids, "z_axis") - center)
+    xz_vector = _unit(_mean_position(coords, xz_plane_atoms_ids, "x-z plane") - center)
+    y_axis = _unit(np.cross(z_axis, xz_vector))
+    x_axis = _unit(np.cross(y_axis, z_axis))
+
+    rotation = np.stack([x_axis, y_axis, z_axis])
+    if not orient_z:
+        # sambvca turns the molecule by 180 degrees around the x-axis
+        rotation[1:] *= -1
+
+    oriented = (coords - center) @ rotation.T
+    if displacement:
+        oriented[:, 2] += displacement if orient_z else -displacement
+    return oriented
+
+
+def select_atoms(elements, atoms_to_delete_ids=None, remove_H=True):
+    """Get a mask of the atoms that take part in the buried volume calculation.
+
+    Args:
+        elements (array): Element symbols of the atoms.
+        atoms_to_delete_ids (list): ID of atoms to be deleted (default None)
+        remove_H (bool): Remove H atoms from Vbur calculation (default True)
+
+    Returns:
+        numpy.ndarray: Boolean mask over the atoms.
+    """
+    mask = np.ones(len(elements), dtype=bool)
+    if atoms_to_delete_ids is not None and len(atoms_to_delete_ids) > 0:
+        mask[np.asarray(atoms_to_delete_ids, dtype=int) - 1] = False
+    if remove_H:
+        mask &= np.asarray(elements) != "H"
+    return mask
+
+
+def mesh_axis(sphere_radius, mesh_size):
+    """Grid coordinates along one axis, identical to the sambvca21 mesh."""
+    n_points = int(2.0 * sphere_radius / mesh_size + 1.0)
+    return -sphere_radius + np.arange(n_points) * mesh_size
+
+
+def side_shares(axis, mesh_size):
+    """Share of every grid plane that counts towards the negative and positive half space.
+
+    Points on a coordinate plane are split evenly between both halves.
+
+    Returns:
+        numpy.ndarray: (2, n_points) array with the negative and positive shares.
+    """
+    negative = np.where(np.abs(axis) < 0.25 * mesh_size, 0.5, (axis < 0) * 1.0)
+    return np.stack([negative, 1.0 - negative])
+
+
+def mark_buried(buried, x_axis, y_axis, z_axis, coords, radii):
+    """Flag all grid points of a block that lie inside any atom sphere.
+
+    Args:
+        buried (numpy.ndarray): Boolean array of shape (len(x_axis), len(y_axis), len(z_axis)), updated in place.
+        x_axis, y_axis, z_axis (numpy.ndarray): Sorted grid coordinates of the block.
+        coords (numpy.ndarray): (n_atoms, 3) atom coordinates.
+        radii (numpy.ndarray): Atom radii.
+    """
+    for (x, y, z), radius in zip(coords, radii):
+        i0, i1 = np.searchsorted(x_axis, [x - radius, x + radius], side="right")
+        j0, j1 = np.searchsorted(y_axis, [y - radius, y + radius], side="right")
+        k0, k1 = np.searchsorted(z_axis, [z - radius, z + radius], side="right")
+        if i0 == i1 or j0 == j1 or k0 == k1:
+            continue
+        dx = x_axis[i0:i1, None, None] - x
+        dy = y_axis[None, j0:j1, None] - y
+        dz = z_axis[None, None, k0:k1] - z
+        buried[i0:i1, j0:j1, k0:k1] |= dx * dx + dy * dy + dz * dz < radius * radius
+
+
+def _near_atoms(coords, radii, reach, index):
+    # atoms which can not reach into the sphere are skipped, the index selects per block
+    if index is not None:
+        return coords, radii
+    near = np.linalg.norm(coords, axis=1) < reach + radii
+    return coords[near], radii[near]
+
+
+def _mark_block(buried, x_axis, y_axis, z_axis, coords, radii, index):
+    if index is None:
+        mark_buried(buried, x_axis, y_axis, z_axis, coords, radii)
+    else:
+        index.mark_block(buried, x_axis, y_axis, z_axis)
+
+
+def integrate_sphere(
+    coords, radii, sphere_radius, mesh_size, return_surfaces=False, index=None
+):
+    """Integrate the free and buried volume inside the sphere around the origin.
+
+    Args:
+        coords (numpy.ndarray): (n_atoms, 3) oriented atom coordinates.
+        radii (numpy.ndarray): Atom radii.
+        sphere_radius (float): The radius of the sphere.
+        mesh_size (float): Mesh size for numerical integration.
+        return_surfaces (bool): Also return the top and bottom surface of the buried volume.
+        index (CellList): Spatial index of the same atoms, see molecule_scanner.spatial_index.
+            Reused across calls it avoids testing atoms far from the mesh blocks. (default None)
+
+    Returns:
+        tuple: free and buried volume split into (x side, y side, z side) as (2, 2, 2) arrays,
+        the exact sphere volume and, if requested, the grid axis with the top and bottom surfaces.
+    """
+    axis = mesh_axis(sphere_radius, mesh_size)
+    n_points = len(axis)
+    radius2 = sphere_radius * sphere_radius + 0.0001 * mesh_size * mesh_size
+    voxel_volume = mesh_size**3
+    shares = side_shares(axis, mesh_size)
+
+    coords, radii = _near_atoms(coords, radii, sphere_radius + mesh_size, index)
+
+    free = np.zeros((2, 2, 2))
+    buried_volume = np.zeros((2, 2, 2))
+    if return_surfaces:
+        z_top = np.full((n_points, n_points), -2.0 * sphere_radius)
+        z_bottom = np.full((n_points, n_points), 2.0 * sphere_radius)
+
+    slab_size = max(1, _MAX_SLAB_VOXELS // (n_points * n_points))
+    for start in range(0, n_points, slab_size):
+        x_slab = axis[start : start + slab_size]
+        dist2 = (
+            x_slab[:, None, None] ** 2
+            + axis[None, :, None] ** 2
+            + axis[None, None, :] ** 2
+        )
+        inside = dist2 <= radius2
+        # points on the sphere surface only count half
+        weight = np.where(np.abs(dist2 - radius2) < 0.01 * mesh_size, 0.5, 1.0)
+        weight *= inside * voxel_volume
+
+        buried = np.zeros(dist2.shape, dtype=bool)
+        _mark_block(buried, x_slab, axis, axis, coords, radii, index)
+        buried &= inside
+
+        x_shares = shares[:, start : start + slab_size]
+        for result, selection in ((buried_volume, buried), (free, ~buried)):
+            per_column = (weight * selection) @ shares.T
+            result += np.einsum("ijc,ai,bj->abc", per_column, x_shares, shares)
+
+        if return_surfaces:
+            any_buried = buried.any(axis=2)
+            top = np.where(buried, axis, -np.inf).max(axis=2)
+            bottom = np.where(buried, axis, np.inf).min(axis=2)
+            z_top[start : start + slab_size][any_buried] = top[any_buried]
+            z_bottom[start : start + slab_size][any_buried] = bottom[any_buried]
+
+    exact_volume = sphere_radius * radius2 * np.pi * 4.0 / 3.0
+    if return_surfaces:
+        return free, buried_volume, exact_volume, (axis, z_top, z_bottom)
+    return free, buried_volume, exact_volume
+
+
+def steric_map(coords, radii, sphere_radius, mesh_size, index=None):
+    """Top and bottom height field of the buried volume inside the sphere.
+
+    Args:
+        coords (numpy.ndarray): (n_atoms, 3) oriented atom coordinates.
+        radii (numpy.ndarray): Atom radii.
+        sphere_radius (float): The radius of the sphere.
+        mesh_size (float): Mesh size of the grid.
+        index (CellList): Spatial index of the same atoms (default None)
+
+    Returns:
+        tuple: the grid axis and the top and bottom surfaces as (x, y) float32 arrays,
+        NaN where no buried point lies above the grid point.
+    """
+    *_, (axis, z_top, z_bottom) = integrate_sphere(
+        coords, radii, sphere_radius, mesh_size, return_surfaces=True, index=index
+    )
+    # columns without buried points keep the initial top < bottom
+    empty = z_top < z_bottom
+    z_top = z_top.astype(np.float32)
+    z_bottom = z_bottom.astype(np.float32)
+    z_top[empty] = np.nan
+    z_bottom[empty] = np.nan
+    return axis.astype(np.float32), z_top, z_bottom
+
+
+def integrate_sphere_range(coords, radii, sphere_radii, mesh_size, index=None):
+    """Integrate the free and buried volume for many sphere radii in a single pass.
+
+    The mesh is built once for the largest radius on a grid centered at the origin.
+    Every voxel is binned by its squared distance from the center (in units of mesh_size**2,
+    which is an integer on this grid), so the volumes of all nested spheres follow from
+    cumulative sums of these histograms.
+    Because the grid is centered at the origin instead of at -sphere_radius, the results
+    can differ from integrate_sphere within the mesh tolerance.
+
+    Args:
+        coords (numpy.ndarray): (n_atoms, 3) oriented atom coordinates.
+        radii (numpy.ndarray): Atom radii.
+        sphere_radii (array): The sphere radii to evaluate.
+        mesh_size (float): Mesh size for numerical integration.
+        index (CellList): Spatial index of the same atoms (default None)
+
+    Returns:
+        tuple: free and buried volume as (n_radii, 2, 2, 2) arrays split into
+        (x side, y side, z side) and the exact sphere volumes.
+    """
+    sphere_radii = np.asarray(sphere_radii, dtype=float)
+    r_max = sphere_radii.max()
+    n_half = int(r_max / mesh_size + 1.0)
+    steps = np.arange(-n_half, n_half + 1)
+    axis = steps * mesh_size
+    shares = side_shares(axis, mesh_size)
+    n_bins = 3 * n_half * n_half + 1
+
+    coords, radii = _near_atoms(coords, radii, r_max + mesh_size, index)
+
+    # histograms over the squared distance for every combination of sides
+    all_hist = np.zeros((2, 2, 2, n_bins))
+    buried_hist = np.zeros((2, 2, 2, n_bins))
+    yz_steps2 = steps[:, None] ** 2 + steps[None, :] ** 2
+
+    slab_size = max(1, _MAX_SLAB_VOXELS // (len(axis) * len(axis)))
+    for start in range(0, len(axis), slab_size):
+        x_slab = axis[start : start + slab_size]
+        n_dist = (steps[start : start + slab_size, None, None] ** 2 + yz_steps2).ravel()
+
+        buried = np.zeros((len(x_slab), len(axis), len(axis)), dtype=bool)
+        _mark_block(buried, x_slab, axis, axis, coords, radii, index)
+        buried = buried.ravel()
+
+        x_shares = shares[:, start : start + slab_size]
+        for a in range(2):
+            for b in range(2):
+                for c in range(2):
+                    side_weight = (
+                        x_shares[a][:, None, None]
+                        * shares[b][None, :, None]
+                        * shares[c][None, None, :]
+                    ).ravel()
+                    all_hist[a, b, c] += np.bincount(
+                        n_dist, weights=side_weight, minlength=n_bins
+                    )[:n_bins]
+                    buried_hist[a, b, c] += np.bincount(
+                        n_dist[buried], weights=side_weight[buried], minlength=n_bins
+                    )[:n_bins]
+
+    # cumulative sums with a leading zero, so index i holds all bins below i
+    all_cum = np.concatenate([np.zeros((2, 2, 2, 1)), np.cumsum(all_hist, axis=-1)], -1)
+    buried_cum = np.concatenate(
+        [np.zeros((2, 2, 2, 1)), np.cumsum(buried_hist, axis=-1)], -1
+    )
+
+    mesh2 = mesh_size * mesh_size
+    radius2 = sphere_radii * sphere_radii + 0.0001 * mesh2
+    # voxels with radius2 - 0.01 * mesh_size < dist2 <= radius2 only count half
+    upper = np.clip(np.floor(radius2 / mesh2).astype(int) + 1, 0, n_bins)
+    lower = np.clip(
+        np.floor((radius2 - 0.01 * mesh_size) / mesh2).astype(int) + 1, 0, n_bins
+    )
+
+    voxel_volume = mesh_size**3
+    all_volume = 0.5 * (all_cum[..., upper] + all_cum[..., lower]) * voxel_volume
+    buried_volume = (
+        0.5 * (buried_cum[..., upper] + buried_cum[..., lower]) * voxel_volume
+    )
+
+    free = np.moveaxis(all_volume - buried_volume, -1, 0)
+    buried_volume = np.moveaxis(buried_volume, -1, 0)
+    exact_volume = sphere_radii * radius2 * np.pi * 4.0 / 3.0
+    return free, buried_volume, exact_volume
+
+
+def total_metrics(free, buried, exact_volume):
+    """Unrounded total volumes and percentages of an integration.
+
+    Args:
+        free (numpy.ndarray): Free volume split into (x side, y side, z side).
+        buried (numpy.ndarray): Buried volume split into (x side, y side, z side).
+        exact_volume (float): Analytic volume of the sphere.
+
+    Returns:
+        dict: the keys of the total results of format_results as floats.
+    """
+    free_total = free.sum()
+    buried_total = buried.sum()
+    volume_total = free_total + buried_total
+    metrics = {
+        "free_volume": free_total,
+        "buried_volume": buried_total,
+        "total_volume": volume_total,
+        "exact_volume": exact_volume,
+        "percent_buried_volume": 100.0 * buried_total / volume_total,
+        "percent_free_volume": 100.0 * free_total / volume_total,
+        "percent_total_volume": 100.0 * volume_total / exact_volume,
+    }
+    return {key: float(value) for key, value in metrics.items()}
+
+
+def format_results(free, buried, exact_volume):
+    """Build the total, quadrant and octant result dictionaries.
+
+    The values are rounded to one decimal like in the sambvca21 output.
+
+    Args:
+        free (numpy.ndarray): Free volume split into (x side, y side, z side).
+        buried (numpy.ndarray): Buried volume split into (x side, y side, z side).
+        exact_volume (float): Analytic volume of the sphere.
+
+    Returns:
+        list: a list of the three dictionaries for the total result, quadrant results and octant results.
+    """
+    total_results = {
+        key: round(value, 1)
+        for key, value in total_metrics(free, buried, exact_volume).items()
+    }
+
+    quadrants = [
+        (name, free[x, y].sum(), buried[x, y].sum())
+        for name, (x, y) in zip(QUADRANT_NAMES, _QUADRANT_SIDES)
+    ]
+    octants = [
+        (name, free[x, y, z], buried[x, y, z])
+        for z in (0, 1)
+        for name, (x, y) in zip(OCTANT_NAMES[4 * z : 4 * z + 4], _QUADRANT_SIDES)
+    ]
+
+    region_results = []
+    for regions in (quadrants, octants):
+        results = {
+            "free_volume": {},
+            "buried_volume": {},
+            "total_volume": {},
+            "percent_free_volume": {},
+            "percent_buried_volume": {},
+        }
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for name, region_free, region_buried in regions:
+                region_total = region_free + region_buried
+                results["free_volume"][name] = round(float(region_free), 1)
+                results["buried_volume"][name] = round(float(region_buried), 1)
+                results["total_volume"][name] = round(float(region_total), 1)
+                results["percent_free_volume"][name] = round(
+                    float(100.0 * region_free / region_total), 1
+                )
+                results["percent_buried_volume"][name] = round(
+                    float(100.0 * region_buried / region_total), 1
+                )
+        region_results.append(results)
+
+    return total_results, region_results[0], region_results[1]
+
+
+def write_surface_files(surfaces, top_file, bottom_file):
+    """Write the top and bottom surface in the sambvca21 .dat format."""
+    axis, z_top, z_bottom = surfaces
+    x, y = np.meshgrid(axis, axis, indexing="ij")
+    for filename, z in ((top_file, z_top), (bottom_file, z_bottom)):
+        np.savetxt(
+            filename,
+            np.column_stack([x.ravel(), y.ravel(), z.ravel()]),
+            fmt="%8.2f",
+            delimiter="",
+        )
+
+
+def grid_shape(x):
+    """Shape of the surface grid from the x column of a surface file.
+
+    The files are written with x as the slow index, so the y axis is complete
+    as soon as x changes for the first time.
+
+    Args:
+        x (numpy.ndarray): x coordinates of the grid points in file order.
+
+    Returns:
+        tuple: (number of x values, number of y values)
+    """
+    changes = np.flatnonzero(x != x[0])
+    n_y = changes[0] if len(changes) else len(x)
+    if len(x) % n_y != 0:
+        raise ValueError(f"{len(x)} grid points do not form a grid with {n_y} columns.")
+    return len(x) // n_y, n_y
+
+
+def surface_array_path(filename, key=None):
+    """Location of the persisted arrays of a surface file.
+
+    Args:
+        filename (str): Location of the .dat surface file.
+        key (str): Digest of the run parameters of the surface, arrays of other
+            parameters are stored under a different name. (default None)
+    """
+    base = os.path.splitext(filename)[0]
+    if key is None:
+        return base + ".npy"
+    return f"{base}-{key}.npy"
+
+
+def parse_surface_file(filename):
+    """Parse the x, y and z columns of a surface file in a single pass.
+
+    Both backends write the columns with a fixed width and number of decimals,
+    so the bytes of the file are decoded at once with numpy instead of being
+    split line by line. Files without fixed columns are read with np.loadtxt.
+
+    Args:
+        filename (str): Location of the .dat surface file.
+
+    Returns:
+        numpy.ndarray: (number of points, 3) array of the x, y and z columns.
+    """
+    with open(filename, "rb") as file:
+        data = file.read()
+    width = data.find(b"\n") + 1
+    fields = list(re.finditer(rb"\S+", data[:width]))[:3]
+    chars = np.frombuffer(data, dtype=np.uint8)
+    if width == 0 or len(fields) < 3 or chars.size % width != 0:
+        return np.loadtxt(filename, usecols=(0, 1, 2), ndmin=2)
+    chars = chars.reshape(-1, width)
+
+    # place value of every digit column and the columns of the signs per field
+    weights = np.zeros((width, 3))
+    sign_columns = np.zeros((width, 3), dtype=np.float32)
+    scales = np.ones(3)
+    start = 0
+    for column, field in enumerate(fields):
+        end = field.end()
+        point = data.find(b".", field.start(), end)
+        if point < 0 or np.any(chars[:, point] != ord(".")):
+            return np.loadtxt(filename, usecols=(0, 1, 2), ndmin=2)
+        weights[start:point, column] = 10.0 ** np.arange(
+            end - start - 2, end - point - 2, -1
+        )
+        weights[point + 1 : end, column] = 10.0 ** np.arange(end - point - 2, -1, -1)
+        sign_columns[start:end, column] = 1
+        scales[column] = 10.0 ** (end - point - 1)
+        start = end
+    if np.any(chars[:, -1] != ord("\n")):
+        return np.loadtxt(filename, usecols=(0, 1, 2), ndmin=2)
+
+    # spaces, signs and points are below "0" and count as zero digits
+    digits = np.maximum(chars, ord("0")).astype(float) @ weights
+    digits -= ord("0") * weights.sum(axis=0)
+    negative = (chars == ord("-")).astype(np.float32) @ sign_columns > 0
+    # integers divided by the power of ten round like parsing the decimals
+    return np.where(negative, -digits, digits) / scales
+
+
+def read_surface_file(filename, persist=False, key=None):
+    """Read a sambvca21 surface file into preshaped arrays.
+
+    If persisted arrays of the same key which are not older than the file exist
+    beside it, they are memory-mapped instead of parsing the text file.
+
+    Args:
+        filename (str): Location of the .dat surface file.
+        persist (bool): Save the parsed grid as .npy beside the file (default False)
+        key (str): Digest of the run parameters of the surface, see surface_array_path. (default None)
+
+    Returns:
+        tuple: x and y axis and the surface as (x, y) array.
+    """
+    array_path = surface_array_path(filename, key)
+    if os.path.exists(array_path) and (
+        not os.path.exists(filename)
+        or os.path.getmtime(array_path) >= os.path.getmtime(filename)
+    ):
+        grid = np.load(array_path, mmap_mode="r")
+    else:
+        points = parse_surface_file(filename)
+        shape = grid_shape(points[:, 0])
+        grid = np.ascontiguousarray(points.T).reshape((3,) + shape)
+        if persist:
+            np.save(array_path, grid)
+    return grid[0, :, 0], grid[1, 0, :], grid[2]
@@ -0,0 +1,143 @@
+"""
+Persistent on-disk cache for buried volume results.
+
+Results are stored in a SQLite database and addressed by a digest of the molecule
+and all run parameters, so they can be reused across sessions and processes.
+The least recently used entries are evicted once the size limits are exceeded.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import numpy as np
+
+# access counter, a clock could give the same value to several entries
+_NEXT_ACCESS = "(SELECT COALESCE(MAX(last_access), 0) + 1 FROM results)"
+
+
+def file_digest(filepath):
+    """Return the sha256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(value):
+    # make the key independent of numpy types and of float noise from np.linspace
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 6)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    return value
+
+
+def make_key(**parts):
+    """Build a content-addressed key from the given parts.
+
+    Args:
+        parts: molecule digest, atom IDs and run parameters.
+
+    Returns:
+        str: hex digest identifying the parts.
+    """
+    serialized = json.dumps(_normalize(parts), sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf8")).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache for run results backed by a SQLite database.
+    """
+
+    def __init__(self, cache_dir, max_entries=100000, max_size_mb=512):
+        """
+        Args:
+        cache_dir (str): Directory in which the database file is stored. Created if needed.
+        max_entries (int): Maximum number of stored results (default 100000)
+        max_size_mb (float): Maximum size of the stored results in MB (default 512)
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "results.sqlite")
+        self.max_entries = max_entries
+        self.max_size = int(max_size_mb * 1024 * 1024)
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access INTEGER)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS last_access_index ON results (last_access)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # one connection per call keeps the cache usable from threads and processes
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key, default=None):
+        """Return the stored value for key and mark it as recently used."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default
+            connection.execute(
+                f"UPDATE results SET last_access = {_NEXT_ACCESS} WHERE key = ?", (key,)
+            )
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Store a JSON serializable value and evict old entries if necessary."""
+        serialized = json.dumps(value)
+        with self._connect() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO results VALUES (?, ?, ?, {_NEXT_ACCESS})",
+                (key, serialized, len(serialized)),
+            )
+            self._evict(connection)
+
+    def _evict(self, connection):
+        connection.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        connection.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM (SELECT key, SUM(size) OVER "
+            "(ORDER BY last_access DESC, key) AS total FROM results) WHERE total > ?)",
+            (self.max_size,),
+        )
+
+    def clear(self):
+        """Remove all stored results."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM results")
+
+    def __contains__(self, key):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
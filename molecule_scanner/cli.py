@@ -0,0 +1,424 @@
+"""
+Headless command line interface for buried volume scans, cavities and library screens.
+
+    cbvs scan molecule.xyz --center 1 --z-axis 2 --xz-plane 1,3,9 --r-min 2 --r-max 5
+    cbvs cavity molecule.xyz --center 1 --z-axis 2 --xz-plane 1,3,9 --radius 3.5 -o map.npz
+    cbvs batch manifest.csv --radii 3,3.5,4 --workers 16 --cache-dir cache -o results.parquet
+    cbvs batch manifest.csv --radii 3,3.5,4 --ledger screen.sqlite -o results.parquet
+
+With --ledger the tasks are recorded in a job ledger, running the same command
+again after an interruption only runs the unfinished tasks, and machines sharing
+the ledger file work on the same sweep. Atom IDs start at 1 as in the .xyz file.
+The command only imports the scanner and its numeric dependencies, never Dash or
+plotly, so it starts quickly on compute nodes.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from molecule_scanner.execution import EXECUTORS
+from molecule_scanner.ledger import JobLedger, run_ledger
+from molecule_scanner.library import scan_library
+from molecule_scanner.result_store import CAVITY_KEYS, ResultStore
+from molecule_scanner.scanner import MoleculeScanner
+
+TABLE_FORMATS = {
+    ".csv": "csv",
+    ".json": "json",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+CAVITY_FORMATS = {".npz": "npz", ".csv": "csv"}
+
+
+def parse_ids(value):
+    """Parse "1,2,3" or "1 2 3" into a list of atom IDs."""
+    try:
+        return [int(item) for item in value.replace(",", " ").split()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid atom IDs '{value}'.")
+
+
+def parse_radii(value):
+    """Parse "3,3.5,4" into a list of radii."""
+    try:
+        return [float(item) for item in value.replace(",", " ").split()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid radii '{value}'.")
+
+
+def output_format(path, chosen, formats):
+    """Format of an output file, given explicitly or by its extension."""
+    if chosen is not None:
+        return chosen
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in formats:
+        raise ValueError(
+            f"Can not tell the format of {path}, use --format or one of "
+            f"{', '.join(formats)}."
+        )
+    return formats[extension]
+
+
+def write_table(df, path, table_format):
+    """Write a result table, to stdout as csv if path is None or "-"."""
+    if path is None or path == "-":
+        df.to_csv(sys.stdout, index=False)
+    elif table_format == "csv":
+        df.to_csv(path, index=False)
+    elif table_format == "json":
+        df.to_json(path, orient="records", indent=1)
+    elif table_format == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        # the feather v2 format is the Arrow IPC file format
+        df.reset_index(drop=True).to_feather(path)
+
+
+def _add_molecule_arguments(parser):
+    parser.add_argument("xyz_filepath", help=".xyz file of the molecule")
+    parser.add_argument(
+        "--center", type=parse_ids, required=True, help="atom IDs of the sphere center"
+    )
+    parser.add_argument(
+        "--z-axis", type=parse_ids, required=True, help="atom IDs of the z axis"
+    )
+    parser.add_argument(
+        "--xz-plane", type=parse_ids, required=True, help="atom IDs of the xz plane"
+    )
+    parser.add_argument(
+        "--delete", type=parse_ids, default=None, help="atom IDs to leave out"
+    )
+
+
+def _add_run_arguments(parser, mesh_size=0.10):
+    parser.add_argument("--mesh-size", type=float, default=mesh_size)
+    parser.add_argument(
+        "--keep-h",
+        action="store_true",
+        help="include the hydrogen atoms in the buried volume",
+    )
+    parser.add_argument(
+        "--radii-table",
+        choices=["default", "vdw"],
+        default="default",
+        help="atom radii table of py2sambvca",
+    )
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="append the results to the result store in this directory",
+    )
+
+
+def _add_backend_arguments(parser):
+    # the steric map is calculated in-process, only scans use these
+    parser.add_argument("--backend", choices=["sambvca", "numpy"], default="sambvca")
+    parser.add_argument(
+        "--cache-dir", default=None, help="directory of a persistent result cache"
+    )
+    parser.add_argument(
+        "--working-dir", default=None, help="directory for the sambvca files"
+    )
+
+
+def _add_ledger_arguments(parser):
+    parser.add_argument(
+        "--ledger",
+        default=None,
+        help="job ledger database, a rerun only runs the unfinished tasks",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="run the failed tasks of the ledger again",
+    )
+    parser.add_argument(
+        "--lease-timeout",
+        type=float,
+        default=None,
+        help="seconds after which running tasks of other machines are run again",
+    )
+
+
+def _add_output_arguments(parser, formats):
+    parser.add_argument(
+        "-o", "--output", default=None, help="output file, csv to stdout if not given"
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(set(formats.values())),
+        default=None,
+        help="output format, by default taken from the file extension",
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cbvs",
+        description="Headless catalyst buried volume scanner.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan = subparsers.add_parser("scan", help="scan a range of sphere radii")
+    _add_molecule_arguments(scan)
+    scan.add_argument("--r-min", type=float, required=True)
+    scan.add_argument("--r-max", type=float, required=True)
+    scan.add_argument("--steps", type=int, default=50)
+    _add_run_arguments(scan)
+    _add_backend_arguments(scan)
+    scan.add_argument(
+        "-j", "--workers", type=int, default=-1, help="-1 to use all CPUs (default)"
+    )
+    scan.add_argument("--executor", choices=EXECUTORS, default="threads")
+    scan.add_argument(
+        "--sweep",
+        action="store_true",
+        help="calculate all radii from one voxel pass with the numpy backend",
+    )
+    scan.add_argument(
+        "--all-levels",
+        action="store_true",
+        help="include the quadrant and octant results",
+    )
+    _add_ledger_arguments(scan)
+    _add_output_arguments(scan, TABLE_FORMATS)
+
+    cavity = subparsers.add_parser("cavity", help="calculate the steric map")
+    _add_molecule_arguments(cavity)
+    cavity.add_argument("--radius", type=float, required=True)
+    _add_run_arguments(cavity)
+    _add_output_arguments(cavity, CAVITY_FORMATS)
+
+    batch = subparsers.add_parser("batch", help="screen the molecules of a manifest")
+    batch.add_argument(
+        "manifest", help=".csv or .json manifest, see molecule_scanner.library"
+    )
+    batch.add_argument(
+        "--radii", type=parse_radii, required=True, help='sphere radii, e.g. "3,3.5,4"'
+    )
+    _add_run_arguments(batch)
+    _add_backend_arguments(batch)
+    batch.add_argument(
+        "-j", "--workers", type=int, default=-1, help="-1 to use all CPUs (default)"
+    )
+    _add_ledger_arguments(batch)
+    _add_output_arguments(batch, TABLE_FORMATS)
+    return parser
+
+
+def _scanner(args):
+    return MoleculeScanner(
+        args.xyz_filepath,
+        args.center,
+        args.z_axis,
+        args.xz_plane,
+        atoms_to_delete_ids=args.delete,
+        working_dir=args.working_dir,
+        verbose=0,
+        backend=args.backend,
+        cache_dir=args.cache_dir,
+    )
+
+
+def _store(args):
+    if args.store is None:
+        return None
+    return ResultStore(args.store)
+
+
+def _run_parameters(args):
+    return dict(
+        mesh_size=args.mesh_size,
+        remove_H=not args.keep_h,
+        radii_table=args.radii_table,
+    )
+
+
+def _run_ledger(args, ledger):
+    """Run the unfinished tasks of the ledger, return 1 if some tasks failed."""
+    counts = run_ledger(
+        args.ledger,
+        n_workers=args.workers,
+        working_dir=args.working_dir,
+        cache_dir=args.cache_dir,
+        lease_timeout=args.lease_timeout,
+        retry_failed=args.retry_failed,
+    )
+    for molecule, r_current, error in ledger.errors():
+        print(f"Scan of {molecule} at r = {r_current} failed: {error}", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+def _scan_with_ledger(args):
+    if args.sweep or args.all_levels:
+        raise ValueError("--sweep and --all-levels can not be combined with --ledger.")
+    molecule = os.path.splitext(os.path.basename(args.xyz_filepath))[0]
+    ledger = JobLedger(args.ledger)
+    ledger.add_molecule(
+        {
+            "name": molecule,
+            "xyz_filepath": args.xyz_filepath,
+            "sphere_center_atom_ids": args.center,
+            "z_ax_atom_ids": args.z_axis,
+            "xz_plane_atoms_ids": args.xz_plane,
+            "atoms_to_delete_ids": args.delete,
+            "backend": args.backend,
+        },
+        np.linspace(args.r_min, args.r_max, args.steps),
+        **_run_parameters(args),
+    )
+    exit_code = _run_ledger(args, ledger)
+
+    # the wide layout of run_range, one row per radius
+    df_results = ledger.results(molecule, _run_parameters(args))
+    metrics = list(dict.fromkeys(df_results["metric"]))
+    df_scan = df_results.pivot(index="r", columns="metric", values="value")
+    df_scan = df_scan[metrics].reset_index()
+    df_scan.columns.name = None
+    return df_scan, exit_code
+
+
+def run_scan(args):
+    table_format = None
+    if args.output not in (None, "-"):
+        table_format = output_format(args.output, args.format, TABLE_FORMATS)
+    if args.ledger is not None:
+        df_scan, exit_code = _scan_with_ledger(args)
+    else:
+        df_scan, exit_code = _scan(args), 0
+    if df_scan is None or len(df_scan) == 0:
+        print("No results found, please check the atom IDs and radii.", file=sys.stderr)
+        return 1
+
+    store = _store(args)
+    if store is not None:
+        molecule = os.path.splitext(os.path.basename(args.xyz_filepath))[0]
+        store.append_scan(df_scan, molecule=molecule, mesh_size=args.mesh_size)
+    write_table(df_scan, args.output, table_format)
+    return exit_code
+
+
+def _scan(args):
+    scanner = _scanner(args)
+    return scanner.run_range(
+        args.r_min,
+        args.r_max,
+        nsteps=args.steps,
+        mesh_size=args.mesh_size,
+        remove_H=not args.keep_h,
+        write_surf_files=False,
+        n_threads=args.workers,
+        radii_table=args.radii_table,
+        sweep=args.sweep,
+        executor=args.executor,
+        all_levels=args.all_levels,
+    )
+
+
+def run_cavity(args):
+    cavity_format = None
+    if args.output not in (None, "-"):
+        cavity_format = output_format(args.output, args.format, CAVITY_FORMATS)
+    # steric_map does not depend on the backend, numpy needs no sambvca files
+    scanner = MoleculeScanner(
+        args.xyz_filepath,
+        args.center,
+        args.z_axis,
+        args.xz_plane,
+        atoms_to_delete_ids=args.delete,
+        verbose=0,
+        backend="numpy",
+    )
+    cavity_map = scanner.steric_map(
+        args.radius,
+        args.mesh_size,
+        remove_H=not args.keep_h,
+        radii_table=args.radii_table,
+    )
+
+    store = _store(args)
+    if store is not None:
+        molecule = os.path.splitext(os.path.basename(args.xyz_filepath))[0]
+        store.append_cavity(
+            cavity_map,
+            molecule=molecule,
+            sphere_radius=args.radius,
+            mesh_size=args.mesh_size,
+        )
+
+    if cavity_format == "npz":
+        np.savez_compressed(args.output, **dict(zip(CAVITY_KEYS, cavity_map)))
+        return 0
+
+    x_axis, y_axis, z_top, z_bottom = cavity_map
+    X, Y = np.meshgrid(x_axis, y_axis, indexing="ij")
+    df_cavity = pd.DataFrame(
+        {
+            "x": X.ravel(),
+            "y": Y.ravel(),
+            "top": z_top.ravel(),
+            "bottom": z_bottom.ravel(),
+        }
+    )
+    write_table(df_cavity, args.output, "csv")
+    return 0
+
+
+def run_batch(args):
+    table_format = None
+    if args.output not in (None, "-"):
+        table_format = output_format(args.output, args.format, TABLE_FORMATS)
+    if args.ledger is None:
+        df_results = scan_library(
+            args.manifest,
+            args.radii,
+            store=args.store,
+            n_workers=args.workers,
+            working_dir=args.working_dir,
+            cache_dir=args.cache_dir,
+            backend=args.backend,
+            **_run_parameters(args),
+        )
+        write_table(df_results, args.output, table_format)
+        return 0
+
+    ledger = JobLedger(args.ledger)
+    ledger.add_manifest(
+        args.manifest, args.radii, backend=args.backend, **_run_parameters(args)
+    )
+    exit_code = _run_ledger(args, ledger)
+    df_results = ledger.results(parameters=_run_parameters(args))
+    store = _store(args)
+    if store is not None and len(df_results):
+        store.append_scan(df_results)
+    write_table(df_results, args.output, table_format)
+    return exit_code
+
+
+COMMANDS = {"scan": run_scan, "cavity": run_cavity, "batch": run_batch}
+
+
+def main(argv=None):
+    """Entry point of the cbvs command.
+
+    Args:
+        argv (list): Command line arguments (default None, sys.argv)
+
+    Returns:
+        int: exit code.
+    """
+    args = build_parser().parse_args(argv)
+    try:
+        return COMMANDS[args.command](args)
+    except (ValueError, ImportError, FileNotFoundError) as e:
+        print(f"cbvs {args.command}: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,31 @@
-from dash import dcc, html, Dash, dash_table
+from dash import Patch, ctx, dcc, html, no_update, Dash, dash_table
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import os
 import base64
+import json
 from tempfile import mkdtemp
 import pathlib
+import threading
 import plotly.graph_objects as go
 import numpy as np
 import dash_bio as dashbio
 from dash_bio.utils import create_mol3d_style
-import xyz_py as xyzp
-
-from molecule_scanner.scanner import MoleculeScanner as msc
+from collections import OrderedDict
+
+from molecule_scanner.bonds import element_symbol, find_bonds
+from molecule_scanner.buried_volume import read_xyz
+from molecule_scanner.cache import file_digest
+from molecule_scanner.jobs import BackgroundJob, JobManager
+from molecule_scanner.level_of_detail import (
+    decimate_curve,
+    decimate_grid,
+    relayout_ranges,
+)
+from molecule_scanner.profiling import profile_stage
+from molecule_scanner.result_store import ResultStore
+from molecule_scanner.scanner import MoleculeScanner as msc, rows_to_frame
+from molecule_scanner.session_store import SessionStore, new_session_id
 
 # https://github.com/DouwMarx/dash_by_exe
 
@@ -25,7 +40,18 @@ app = Dash(
     external_stylesheets=external_stylesheets,
     suppress_callback_exceptions=True,
 )
-app.molecule_scanner = None
+# scanner, scan table and cavity arrays of every browser tab, the browser only holds the keys
+session_store = SessionStore(spill_dir=os.path.join(working_dir, "sessions"))
+
+# scans and cavities run in the background, the browser polls their progress
+job_manager = JobManager()
+POLL_INTERVAL_MS = 1000
+# sampled points per radius of the Monte Carlo preview
+PREVIEW_SAMPLES = 4096
+# points sent to the browser, about the resolution of the plots
+MAX_CONTOUR_POINTS = 400
+MAX_SURFACE_POINTS = 150
+MAX_LINE_POINTS = 4000
 
 
 @app.callback(
@@ -33,11 +59,14 @@ app.molecule_scanner = None
     Output("3dmol_div", "children"),
     Input("upload-data", "filename"),
     Input("upload-data", "contents"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def update_upload_label(filename, file_content):
+def update_upload_label(filename, file_content, session_id):
     data = file_content.encode("utf8").split(b";base64,")[1]
-    filename_complete = os.path.join(working_dir, filename)
+    filename_complete = os.path.join(
+        session_dir(session_id), os.path.basename(filename)
+    )
 
     with open(filename_complete, "wb") as fp:
         fp.write(base64.decodebytes(data))
@@ -49,58 +78,158 @@ def update_upload_label(filename, file_content):
     )
 
 
-def create_3d_viewer(filename):
-    def _get_3d_color_map():
-
-        ATOM_COLORS = {
-            "C": "#c8c8c8",
-            "H": "#ffffff",
-            "N": "#8f8fff",
-            "S": "#ffc832",
-            "O": "#f00000",
-            "F": "#ffff00",
-            "P": "#ffa500",
-            "K": "#42f4ee",
-            "G": "#3f3f3f",
-            "Au": "#ffd700",
-            "Cl": "#008000",
-        }
+def molecule_name(scanner):
+    """Name of the scanned molecule, the name of its .xyz file."""
+    return os.path.splitext(os.path.basename(scanner.xyz_filepath))[0]
 
-        return ATOM_COLORS
 
-    # get coordinates and atom labels
-    atom_list_indices, atom_coords = xyzp.load_xyz(filename, add_indices=True)
-    atom_list_no_indices = xyzp.load_xyz(filename, add_indices=False)[0]
+def session_dir(session_id):
+    """Directory for the uploads and outputs of a session, created if needed."""
+    if session_id not in session_store:
+        session_store.set(session_id, "created", True)
+    directory = os.path.join(working_dir, session_id)
+    os.makedirs(directory, exist_ok=True)
+    return directory
 
-    # get bonds
 
-    bonds_list = xyzp.find_bonds(atom_list_indices, atom_coords, style="indices")[0]
+def store_result(session_id, job_id, kind, result):
+    """Append a finished scan or cavity once to the result store of the session, if it has one."""
+    store = session_store.get(session_id, "result_store")
+    stored_job_ids = session_store.get(session_id, "stored_job_ids", set())
+    if store is None or job_id in stored_job_ids:
+        return
+    labels = session_store.get(session_id, f"{kind}_parameters", {})
+    try:
+        if kind == "scan":
+            store.append_scan(result, **labels)
+        else:
+            store.append_cavity(result, **labels)
+    except (ImportError, OSError) as e:
+        print(f"Could not store the {kind} results: {e}")
+    session_store.set(session_id, "stored_job_ids", stored_job_ids | {job_id})
+
+
+def session_profiler(session_id):
+    """Profiler of the session's scanner, None if there is none."""
+    scanner = session_store.get(session_id, "scanner")
+    if scanner is None:
+        return None
+    return scanner.profiler
+
+
+# viewer models of the uploaded molecules by file digest
+_viewer_models = OrderedDict()
+# waitress serves the callbacks from several threads
+_viewer_models_lock = threading.Lock()
+MAX_VIEWER_MODELS = 16
+
+# finished figures by (result kind, result ID, view), see get_figure
+_figures = OrderedDict()
+# waitress serves the callbacks from several threads
+_figures_lock = threading.Lock()
+MAX_FIGURES = 32
+
+
+def get_figure(key, build, *args, profiler=None):
+    """Figure for key, built with build(*args) on the first request and memoized after that.
+
+    The first two entries of key name the kind of result, "scan" or "cavity", and its
+    job ID, so the figures of a result can be dropped with clear_figures when a new one
+    is started. The build is recorded as a stage of profiler if given.
+    """
+    with _figures_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key]
+
+    # built outside of the lock, so that other figures are served in the meantime
+    with profile_stage(profiler, build.__name__):
+        fig = build(*args)
+    with _figures_lock:
+        # a concurrent request may have built the same figure, keep the first one
+        fig = _figures.setdefault(key, fig)
+        _figures.move_to_end(key)
+        while len(_figures) > MAX_FIGURES:
+            _figures.popitem(last=False)
+    return fig
 
-    # transform to dash bio data
-    data_3d = {"atoms": [], "bonds": []}
-    for i, (atom_ind, atom_label, atom_coord) in enumerate(
-        zip(atom_list_indices, atom_list_no_indices, atom_coords)
-    ):
-        new_atom = {
-            "serial": i,
-            "name": atom_label,
-            "elem": atom_label,
-            "positions": [atom_coord[0], atom_coord[1], atom_coord[2]],
-        }
-        data_3d["atoms"].append(new_atom)
 
-    for bond in bonds_list:
-        new_bond = {"atom1_index": bond[0], "atom2_index": bond[1], "bond_order": 1}
-        data_3d["bonds"].append(new_bond)
+def clear_figures(kind, job_id=None):
+    """Forget the memoized figures of a job or, without job_id, of all results of the given kind."""
+    with _figures_lock:
+        for key in [
+            key
+            for key in _figures
+            if key[0] == kind and (job_id is None or key[1] == job_id)
+        ]:
+            del _figures[key]
+
+
+def freeze_arrays(arrays):
+    """Mark the arrays read-only, so the cached figures can not drift from their data."""
+    for array in arrays:
+        array.setflags(write=False)
+    return arrays
+
+
+ATOM_COLORS = {
+    "C": "#c8c8c8",
+    "H": "#ffffff",
+    "N": "#8f8fff",
+    "S": "#ffc832",
+    "O": "#f00000",
+    "F": "#ffff00",
+    "P": "#ffa500",
+    "K": "#42f4ee",
+    "G": "#3f3f3f",
+    "Au": "#ffd700",
+    "Cl": "#008000",
+}
+
+
+def get_viewer_model(filename):
+    """Model data and styles of the Molecule3dViewer, memoized by the file content."""
+    digest = file_digest(filename)
+    with _viewer_models_lock:
+        if digest in _viewer_models:
+            _viewer_models.move_to_end(digest)
+            return _viewer_models[digest]
+
+    labels, coords = read_xyz(filename)
+    elements = [element_symbol(label) for label in labels]
+
+    # transform to dash bio data
+    data_3d = {
+        "atoms": [
+            {"serial": i, "name": element, "elem": element, "positions": position}
+            for i, (element, position) in enumerate(zip(elements, coords.tolist()))
+        ],
+        "bonds": [
+            {"atom1_index": atom1, "atom2_index": atom2, "bond_order": 1}
+            for atom1, atom2 in find_bonds(elements, coords).tolist()
+        ],
+    }
 
     # set style
     styles = create_mol3d_style(
         data_3d["atoms"],
         visualization_type="stick",
         color_element="atom",
-        color_scheme=_get_3d_color_map(),
+        color_scheme=ATOM_COLORS,
     )
 
+    with _viewer_models_lock:
+        # a concurrent request may have built the same model, keep the first one
+        model = _viewer_models.setdefault(digest, (data_3d, styles))
+        _viewer_models.move_to_end(digest)
+        while len(_viewer_models) > MAX_VIEWER_MODELS:
+            _viewer_models.popitem(last=False)
+    return model
+
+
+def create_3d_viewer(filename):
+    data_3d, styles = get_viewer_model(filename)
+
     output = [
         dashbio.Molecule3dViewer(
             id="molecule3d-viewer",
@@ -197,6 +326,9 @@ def create_main_page():
                         "Leave empty to save in a tmp directory and not save the entire generated dataset."
                     ),
                     html.P("Can be absolute or relative to the working directory"),
+                    html.P(
+                        "Finished scans and cavities are also appended to a Parquet and .npz result store in its results folder."
+                    ),
                     dcc.Input(
                         id="output_save_path",
                         type="text",
@@ -334,23 +466,32 @@ def create_2d_tab():
                                 id="input_remove_h",
                             )
                         ),
+                        # checklist monte carlo preview
+                        html.Div(
+                            dcc.Checklist(
+                                ["quick Monte Carlo preview"],
+                                [],
+                                id="input_monte_carlo",
+                            )
+                        ),
                     ]
                 ),
                 # start 2d calculation
                 html.Div(
-                    dcc.Loading(
-                        id="loading_scan2d",
-                        children=html.Div(
-                            [
-                                html.Button(
-                                    id="scan_start_button",
-                                    n_clicks=0,
-                                    children="Start Scan",
-                                ),
-                                html.Div(id="scan_plot_div"),
-                            ]
+                    [
+                        html.Button(
+                            id="scan_start_button",
+                            n_clicks=0,
+                            children="Start Scan",
                         ),
-                    ),
+                        html.Div(id="scan_plot_div"),
+                        dcc.Store(id="scan_job_id"),
+                        dcc.Interval(
+                            id="scan_interval",
+                            interval=POLL_INTERVAL_MS,
+                            disabled=True,
+                        ),
+                    ]
                 ),
             ]
         ),
@@ -413,19 +554,20 @@ def create_3d_tab():
                 ),
                 # start 3d calculation
                 html.Div(
-                    dcc.Loading(
-                        id="loading_scan3d",
-                        children=html.Div(
-                            [
-                                html.Button(
-                                    id="3d_start_button",
-                                    n_clicks=0,
-                                    children="Calculate Cavity",
-                                ),
-                                html.Div(id="3d_plot_div"),
-                            ]
+                    [
+                        html.Button(
+                            id="3d_start_button",
+                            n_clicks=0,
+                            children="Calculate Cavity",
                         ),
-                    )
+                        html.Div(id="3d_plot_div"),
+                        dcc.Store(id="cavity_job_id"),
+                        dcc.Interval(
+                            id="cavity_interval",
+                            interval=POLL_INTERVAL_MS,
+                            disabled=True,
+                        ),
+                    ]
                 ),
             ]
         ),
@@ -442,17 +584,22 @@ def create_3d_tab():
     State("input_xz_plane_atoms_ids", "value"),
     State("input_atoms_to_delete_ids", "value"),
     State("output_save_path", "value"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def start_init(n_clicks, filename, center_id, z_id, xz_id, del_id, output_path):
+def start_init(
+    n_clicks, filename, center_id, z_id, xz_id, del_id, output_path, session_id
+):
 
     if n_clicks and filename and center_id and z_id and xz_id and del_id:
-        # setup molecule scanner as part of the app object
+        # setup molecule scanner as part of the session
+        result_store = None
         if output_path:
             output_path = pathlib.Path(output_path)
             output_path.mkdir(parents=True, exist_ok=True)
+            result_store = ResultStore(output_path / "results")
         else:
-            output_path = working_dir
+            output_path = session_dir(session_id)
         try:
             # split comma separated strings into list of int
             # we need to add 1 to all atom ids, because the molecule scanner expects indexing starting on 1 but the chemical convention is starting at 0
@@ -461,13 +608,17 @@ def start_init(n_clicks, filename, center_id, z_id, xz_id, del_id, output_path):
             xz_plane_atoms_ids = np.asarray(list(map(int, xz_id.split(",")))) + 1
             atoms_to_delete_ids = np.asarray(list(map(int, del_id.split(",")))) + 1
 
-            app.molecule_scanner = msc(
-                xyz_filepath=os.path.join(working_dir, filename),
+            scanner = msc(
+                xyz_filepath=os.path.join(
+                    session_dir(session_id), os.path.basename(filename)
+                ),
                 sphere_center_atom_ids=sphere_atom_ids,
                 z_ax_atom_ids=z_ax_atom_ids,
                 xz_plane_atoms_ids=xz_plane_atoms_ids,
                 atoms_to_delete_ids=atoms_to_delete_ids,
                 working_dir=output_path,
+                cache_dir=os.path.join(output_path, "cache"),
+                profile=True,
             )
         except ValueError as e:
             if "invalid literal for int() with base 10" in str(e):
@@ -476,6 +627,13 @@ def start_init(n_clicks, filename, center_id, z_id, xz_id, del_id, output_path):
                 )
             else:
                 return html.Div(str(e))
+        session_store.update(
+            session_id,
+            scanner=scanner,
+            df_scan=None,
+            cavity_map=None,
+            result_store=result_store,
+        )
         return html.Div(
             [
                 html.Div("Initializing:"),
@@ -496,6 +654,7 @@ def start_init(n_clicks, filename, center_id, z_id, xz_id, del_id, output_path):
 
 @app.callback(
     Output("scan_plot_div", "children"),
+    Output("scan_job_id", "data"),
     Input("scan_start_button", "n_clicks"),
     State("input_r_min", "value"),
     State("input_r_max", "value"),
@@ -503,38 +662,75 @@ def start_init(n_clicks, filename, center_id, z_id, xz_id, del_id, output_path):
     State("input_mesh_size", "value"),
     State("input_remove_h", "value"),
     State("input_radii_scale", "value"),
+    State("input_monte_carlo", "value"),
+    State("scan_job_id", "data"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def run_scan(n_clicks, r_min, r_max, nsteps, mesh_size, remove_h, radii_table):
-    # generate table
-
-    if app.molecule_scanner is None:
-        return html.Div("Please finish the setup first.")
-
-    app.df_scan = app.molecule_scanner.run_range(
-        r_min=r_min,
-        r_max=r_max,
-        nsteps=nsteps,
-        mesh_size=mesh_size,
-        remove_H=bool(remove_h),
-        write_surf_files=False,
-        radii_table=radii_table,
-    )
-
-    if app.df_scan is None:
-        return html.Div(
-            "No results found, please check that all your given indices are correct."
+def run_scan(
+    n_clicks,
+    r_min,
+    r_max,
+    nsteps,
+    mesh_size,
+    remove_h,
+    radii_table,
+    monte_carlo,
+    old_job_id,
+    session_id,
+):
+    # start the scan in the background, update_scan_progress shows the results
+    scanner = session_store.get(session_id, "scanner")
+    if scanner is None:
+        return html.Div("Please finish the setup first."), None
+
+    if old_job_id is not None:
+        job_manager.remove(old_job_id)
+        clear_figures("scan", old_job_id)
+    if scanner.profiler is not None:
+        scanner.profiler.clear()
+
+    if monte_carlo:
+        # estimated curve with standard errors in a fraction of the time of a mesh scan
+        job_id = job_manager.submit_scan(
+            scanner,
+            r_min=r_min,
+            r_max=r_max,
+            nsteps=nsteps,
+            monte_carlo=True,
+            n_samples=PREVIEW_SAMPLES,
+            remove_H=bool(remove_h),
+            radii_table=radii_table,
+        )
+    else:
+        job_id = job_manager.submit_scan(
+            scanner,
+            r_min=r_min,
+            r_max=r_max,
+            nsteps=nsteps,
+            mesh_size=mesh_size,
+            remove_H=bool(remove_h),
+            write_surf_files=False,
+            radii_table=radii_table,
+            ordered=False,
         )
+    session_store.update(
+        session_id,
+        df_scan=None,
+        scan_job_id=job_id,
+        scan_rows_sent=0,
+        scan_parameters=dict(
+            molecule=molecule_name(scanner),
+            mesh_size=None if monte_carlo else mesh_size,
+            monte_carlo=bool(monte_carlo),
+            remove_H=bool(remove_h),
+            radii_table=radii_table,
+        ),
+    )
 
     # plot config
-    plot_names = list(app.df_scan.keys())
-    plot_names.remove("r")
-
-    margin = dict(l=65, r=50, b=65, t=90, pad=10)
-
     width = 1000
     height = 500
-    fontsize = 18
     config = {
         "toImageButtonOptions": {
             "format": "png",  # one of png, svg, jpeg, webp
@@ -547,8 +743,21 @@ def run_scan(n_clicks, r_min, r_max, nsteps, mesh_size, remove_h, radii_table):
 
     scan_result_display = html.Div(
         [
+            html.Div(
+                [
+                    html.Div(id="scan_progress", style={"marginRight": "20px"}),
+                    html.Button(
+                        id="scan_cancel_button", n_clicks=0, children="Cancel Scan"
+                    ),
+                ],
+                style={"display": "flex", "flex-direction": "row"},
+            ),
             dash_table.DataTable(
-                data=app.df_scan.round(4).to_dict("records"),
+                id="scan_table",
+                data=[],
+                # the rows are appended in the order the radii finish
+                sort_action="native",
+                sort_by=[{"column_id": "r", "direction": "asc"}],
                 page_size=10,
                 export_format="csv",
                 export_headers="display",
@@ -557,7 +766,7 @@ def run_scan(n_clicks, r_min, r_max, nsteps, mesh_size, remove_h, radii_table):
             html.P("Choose a feature to plot over r"),
             dcc.Dropdown(
                 id="dropdown",
-                options=plot_names,
+                options=["percent_buried_volume"],
                 value="percent_buried_volume",
                 clearable=False,
             ),
@@ -566,35 +775,197 @@ def run_scan(n_clicks, r_min, r_max, nsteps, mesh_size, remove_h, radii_table):
         style={"width": "40%", "marginTop": "20px"},
     )
 
-    return scan_result_display
+    return scan_result_display, job_id
+
+
+def format_progress(progress, unit):
+    """Progress line of a background job for the status display."""
+    done_text = f"{progress['done']}/{progress['total']} {unit} done"
+    if progress["status"] == "pending":
+        return "Waiting for a free worker..."
+    if progress["status"] == "running":
+        if progress["eta"] is None:
+            return f"Running: {done_text}"
+        return f"Running: {done_text}, about {progress['eta']:.0f} s remaining"
+    if progress["status"] == "cancelled":
+        return f"Cancelled after {progress['elapsed']:.1f} s: {done_text}"
+    if progress["status"] == "failed":
+        return f"Failed after {progress['elapsed']:.1f} s: {done_text}"
+    return f"Finished in {progress['elapsed']:.1f} s: {done_text}"
+
+
+@app.callback(
+    Output("scan_progress", "children"),
+    Output("scan_table", "data"),
+    Output("dropdown", "options"),
+    Output("scan_interval", "disabled"),
+    Input("scan_interval", "n_intervals"),
+    Input("scan_job_id", "data"),
+    State("session_id", "data"),
+    prevent_initial_call=True,
+)
+def update_scan_progress(n_intervals, job_id, session_id):
+    job = job_manager.get(job_id)
+    # only the session which started a job can see it
+    if job is None or session_store.get(session_id, "scan_job_id") != job_id:
+        raise PreventUpdate
+
+    progress = job.progress()
+    # a finished job only needs one last update
+    running = not job.finished_running
+
+    # only the rows finished since the last poll are sent and appended to the table
+    offset = session_store.get(session_id, "scan_rows_sent", 0)
+    rows, new_offset = job.rows_since(offset)
+    table_data = no_update
+    plot_names = no_update
+    if rows:
+        session_store.set(session_id, "scan_rows_sent", new_offset)
+        table_data = Patch()
+        table_data.extend(rows_to_frame(rows).round(4).to_dict("records"))
+        if offset == 0:
+            plot_names = [name for name in rows[0] if name != "r"]
+
+    if not running:
+        # the complete table is only built once, for the plot and the result store
+        df_scan = job.frame()
+        session_store.set(session_id, "df_scan", df_scan)
+        if df_scan is None:
+            return (
+                "No results found, please check that all your given indices are correct.",
+                [],
+                ["percent_buried_volume"],
+                True,
+            )
+        if job.status == "done":
+            store_result(session_id, job_id, "scan", df_scan)
+
+    return format_progress(progress, "radii"), table_data, plot_names, not running
+
+
+@app.callback(
+    Output("scan_cancel_button", "disabled"),
+    Input("scan_cancel_button", "n_clicks"),
+    State("scan_job_id", "data"),
+    prevent_initial_call=True,
+)
+def cancel_scan(n_clicks, job_id):
+    # the results of the finished radii are kept
+    job_manager.cancel(job_id)
+    return True
 
 
 @app.callback(
     Output("graph", "figure"),
     Input("dropdown", "value"),
+    Input("scan_table", "data"),
+    Input("graph", "relayoutData"),
+    State("scan_job_id", "data"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def display_plot(name):
+def display_plot(name, table_data, relayout_data, job_id, session_id):
+    ranges = None
+    if ctx.triggered_id == "graph":
+        # zoomed: refine the decimated curve to the visible radii
+        ranges = relayout_ranges(relayout_data)
+        if ranges is None:
+            raise PreventUpdate
+    return scan_figure(session_id, job_id, name, ranges)
+
+
+def scan_figure(session_id, job_id, name, ranges=None):
+    """Memoized figure of a metric of the session's scan, decimated to the visible radii."""
+    if session_store.get(session_id, "scan_job_id") != job_id:
+        raise PreventUpdate
+    df_scan = session_store.get(session_id, "df_scan")
+    if df_scan is not None:
+        n_rows, source = len(df_scan), df_scan
+    else:
+        # a running scan, its table is only built when the figure is not cached
+        job = job_manager.get(job_id)
+        if job is None or job.n_rows == 0:
+            raise PreventUpdate
+        n_rows, source = job.n_rows, job
+
+    r_range = None if ranges is None else ranges["x"]
+    # the rows of a running scan grow, every partial result gets its own figures
+    return get_figure(
+        ("scan", job_id, n_rows, name, _range_key(r_range)),
+        build_scan_source_figure,
+        source,
+        name,
+        r_range,
+        profiler=session_profiler(session_id),
+    )
+
+
+def build_scan_source_figure(source, name, r_range):
+    df_scan = source.frame() if isinstance(source, BackgroundJob) else source
+    if name not in df_scan:
+        raise PreventUpdate
+    return build_scan_figure(df_scan, name, r_range)
+
+
+def _range_key(axis_range):
+    # zoom ranges differing by less than a pixel share their figure
+    if axis_range is None:
+        return None
+    return tuple(round(value, 3) for value in axis_range)
+
+
+def build_scan_figure(df_scan, name, r_range=None):
     margin = dict(l=65, r=50, b=65, t=90, pad=10)
 
     width = 1000
     height = 500
     fontsize = 18
 
+    columns = [df_scan[name].to_numpy(dtype=float)]
+    has_error = f"{name}_error" in df_scan
+    if has_error:
+        columns.append(df_scan[f"{name}_error"].to_numpy(dtype=float))
+    r = df_scan["r"].to_numpy(dtype=float)
+
+    if len(r) > MAX_LINE_POINTS:
+        # min/max per bucket keeps the peaks, WebGL draws long curves faster
+        scatter = go.Scattergl
+        r, columns = decimate_curve(r, columns, MAX_LINE_POINTS // 2, r_range)
+    else:
+        scatter = go.Scatter
+        r = r.astype(np.float32)
+        columns = [column.astype(np.float32) for column in columns]
+
     fig = go.Figure(
-        data=go.Scatter(
-            x=app.df_scan["r"].values,
-            y=app.df_scan[name].values,
+        data=scatter(
+            x=r,
+            y=columns[0],
             mode="lines",
             name=name,
         )
     )
+    if has_error:
+        # two standard errors of the Monte Carlo preview
+        value, error = columns[0], 2 * columns[1]
+        fig.add_trace(
+            scatter(
+                x=np.concatenate([r, r[::-1]]),
+                y=np.concatenate([value + error, (value - error)[::-1]]),
+                fill="toself",
+                line=dict(width=0),
+                opacity=0.3,
+                hoverinfo="skip",
+                name="2 standard errors",
+            )
+        )
 
     fig.update_layout(
         autosize=True,
         width=width,
         height=height,
         margin=margin,
+        # keeps the zoom of the user when the refined figure arrives
+        uirevision=name,
         yaxis=dict(
             ticksuffix="   ",
             tickfont_size=fontsize,
@@ -604,21 +975,93 @@ def display_plot(name):
             ticksuffix="   ", tickfont_size=fontsize, title_text="Sphere radius"
         ),
     )
+    if r_range is not None:
+        fig.update_xaxes(range=list(r_range))
     return fig
 
 
 @app.callback(
     Output("3d_plot_div", "children"),
+    Output("cavity_job_id", "data"),
     Input("3d_start_button", "n_clicks"),
     State("input_sphere_radius_3d", "value"),
     State("input_mesh_size_3d", "value"),
     State("input_remove_h_3d", "value"),
+    State("cavity_job_id", "data"),
+    State("session_id", "data"),
 )
-def visualize_cavity(n_clicks, radius, mesh_size, remove_H):
-    if app.molecule_scanner is None:
-        return html.Div("")
+def visualize_cavity(n_clicks, radius, mesh_size, remove_H, old_job_id, session_id):
+    scanner = session_store.get(session_id, "scanner")
+    if scanner is None:
+        return html.Div(""), None
+
+    if old_job_id is not None:
+        job_manager.remove(old_job_id)
+        clear_figures("cavity", old_job_id)
+    if scanner.profiler is not None:
+        scanner.profiler.clear()
+
+    job_id = job_manager.submit(
+        scanner.steric_map,
+        radius,
+        mesh_size,
+        remove_H=bool(remove_H),
+    )
+    session_store.update(
+        session_id,
+        cavity_map=None,
+        cavity_job_id=job_id,
+        cavity_parameters=dict(
+            molecule=molecule_name(scanner),
+            sphere_radius=radius,
+            mesh_size=mesh_size,
+            remove_H=bool(remove_H),
+        ),
+    )
+
+    cavity_status = html.Div(
+        [
+            html.Div(
+                [
+                    html.Div(id="cavity_progress", style={"marginRight": "20px"}),
+                    html.Button(
+                        id="cavity_cancel_button",
+                        n_clicks=0,
+                        children="Cancel Cavity",
+                    ),
+                ],
+                style={"display": "flex", "flex-direction": "row"},
+            ),
+            html.Div(id="cavity_result_div"),
+        ]
+    )
+    return cavity_status, job_id
 
-    app.df_cavity = app.molecule_scanner.generate_cavity(radius, mesh_size)
+
+@app.callback(
+    Output("cavity_progress", "children"),
+    Output("cavity_result_div", "children"),
+    Output("cavity_interval", "disabled"),
+    Input("cavity_interval", "n_intervals"),
+    Input("cavity_job_id", "data"),
+    State("session_id", "data"),
+    prevent_initial_call=True,
+)
+def update_cavity_progress(n_intervals, job_id, session_id):
+    job = job_manager.get(job_id)
+    if job is None or session_store.get(session_id, "cavity_job_id") != job_id:
+        raise PreventUpdate
+
+    progress = job.progress()
+    if not job.finished_running:
+        return format_progress(progress, "cavities"), None, False
+    if job.status == "failed":
+        return f"Calculation failed: {job.error}", None, True
+    if job.status == "cancelled" or job.result is None:
+        return format_progress(progress, "cavities"), None, True
+
+    session_store.set(session_id, "cavity_map", freeze_arrays(job.result))
+    store_result(session_id, job_id, "cavity", job.result)
 
     mesh_names = ["Top", "Bottom", "Top+Bottom", "3D"]
 
@@ -644,16 +1087,59 @@ def visualize_cavity(n_clicks, radius, mesh_size, remove_H):
         ],
         style={"width": "40%", "marginTop": "20px"},
     )
-    return results_display_3d
+    return format_progress(progress, "cavities"), results_display_3d, True
+
+
+@app.callback(
+    Output("cavity_cancel_button", "disabled"),
+    Input("cavity_cancel_button", "n_clicks"),
+    State("cavity_job_id", "data"),
+    prevent_initial_call=True,
+)
+def cancel_cavity(n_clicks, job_id):
+    # a running cavity calculation is finished, but its result is discarded
+    job_manager.cancel(job_id)
+    return True
 
 
 @app.callback(
     Output("graph_3d", "figure"),
     Input("dropdown_3d", "value"),
+    Input("graph_3d", "relayoutData"),
+    State("cavity_job_id", "data"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def display_mesh(name):
+def display_mesh(name, relayout_data, job_id, session_id):
+    ranges = None
+    if ctx.triggered_id == "graph_3d":
+        # zoomed into a contour: refine it to the visible part, 3D camera moves are ignored
+        ranges = relayout_ranges(relayout_data)
+        if ranges is None or name == "3D":
+            raise PreventUpdate
+    return cavity_figure(session_id, job_id, name, ranges)
+
+
+def cavity_figure(session_id, job_id, name, ranges=None):
+    """Memoized figure of a view of the session's cavity, decimated to the visible part."""
+    cavity_map = session_store.get(session_id, "cavity_map")
+    if cavity_map is None:
+        raise PreventUpdate
+
+    range_key = None
+    if ranges is not None:
+        range_key = (_range_key(ranges["x"]), _range_key(ranges["y"]))
+    return get_figure(
+        ("cavity", job_id, name, range_key),
+        build_cavity_figure,
+        cavity_map,
+        name,
+        ranges,
+        profiler=session_profiler(session_id),
+    )
+
 
+def build_cavity_figure(cavity_map, name, ranges=None):
     margin = dict(l=65, r=50, b=65, t=90, pad=10)
 
     contours_coloring = "heatmap"
@@ -662,52 +1148,45 @@ def display_mesh(name):
     height = 500
     fontsize = 18
     line_smoothing = 0
-    X, Y, Z_top, Z_bottom, Z_both = app.molecule_scanner.reshape_data(app.df_cavity)
-    Z_top[Z_top == np.min(Z_top)] = np.nan
-    Z_bottom[Z_bottom == np.max(Z_bottom)] = np.nan
-
-    if name == "Top":
+    x, y, Z_top, Z_bottom = cavity_map
 
+    if name == "3D":
+        # z is indexed [x, y], plotly surfaces expect rows along y
+        x_3d, y_3d, Z_top_3d = decimate_grid(x, y, Z_top, MAX_SURFACE_POINTS)
+        _, _, Z_bottom_3d = decimate_grid(x, y, Z_bottom, MAX_SURFACE_POINTS)
         fig = go.Figure(
-            data=go.Contour(
-                z=Z_top,
-                x=np.unique(X),
-                y=np.unique(Y),
-                line_smoothing=line_smoothing,
-                contours=contours_dict,
-                contours_coloring=contours_coloring,
-            ),
+            data=[
+                go.Surface(z=Z_top_3d.T, x=x_3d, y=y_3d),
+                go.Surface(z=Z_bottom_3d.T, x=x_3d, y=y_3d, showscale=False),
+            ]
         )
-
-    elif name == "Bottom":
-        fig = go.Figure(
-            data=go.Contour(
-                z=Z_bottom,
-                x=np.unique(X),
-                y=np.unique(Y),
-                line_smoothing=line_smoothing,
-                contours=contours_dict,
-                contours_coloring=contours_coloring,
+    else:
+        # the rows of the contours, the first grid index, are drawn along the vertical axis
+        row_range = column_range = None
+        if ranges is not None:
+            row_range, column_range = ranges["y"], ranges["x"]
+        Z = {"Top": Z_top, "Bottom": Z_bottom}
+        if name == "Top+Bottom":
+            rows, columns, Z_top_2d = decimate_grid(
+                x, y, Z_top, MAX_CONTOUR_POINTS, row_range, column_range
+            )
+            _, _, Z_bottom_2d = decimate_grid(
+                x, y, Z_bottom, MAX_CONTOUR_POINTS, row_range, column_range
+            )
+            Z_2d = Z_top_2d + Z_bottom_2d
+        else:
+            rows, columns, Z_2d = decimate_grid(
+                x, y, Z[name], MAX_CONTOUR_POINTS, row_range, column_range
             )
-        )
-    elif name == "Top+Bottom":
         fig = go.Figure(
             data=go.Contour(
-                z=Z_both,
-                x=np.unique(X),
-                y=np.unique(Y),
+                z=Z_2d,
+                x=columns,
+                y=rows,
                 line_smoothing=line_smoothing,
                 contours=contours_dict,
                 contours_coloring=contours_coloring,
-            )
-        )
-
-    elif name == "3D":
-        fig = go.Figure(
-            data=[
-                go.Surface(z=Z_top, x=X, y=Y),
-                go.Surface(z=Z_bottom, x=X, y=Y, showscale=False),
-            ]
+            ),
         )
 
     fig.update_layout(
@@ -715,26 +1194,141 @@ def display_mesh(name):
         width=width,
         height=height,
         margin=margin,
+        uirevision=name,
         yaxis=dict(ticksuffix="   ", tickfont_size=fontsize),
         xaxis=dict(ticksuffix="   ", tickfont_size=fontsize),
     )
+    if ranges is not None:
+        if ranges["x"] is not None:
+            fig.update_xaxes(range=list(ranges["x"]))
+        if ranges["y"] is not None:
+            fig.update_yaxes(range=list(ranges["y"]))
     return fig
 
 
-app.layout = html.Div(
-    [
-        dcc.Tabs(
-            children=[
-                dcc.Tab(create_main_page(), id="main_tab", label="Setup"),
-                dcc.Tab(label="Radii-Scan", children=create_2d_tab()),
-                # setup the 3d page
-                dcc.Tab(label="3D-Image", children=create_3d_tab()),
-            ],
-            id="main_tabs",
-        ),
-    ],
-    id="layout",
+def create_performance_tab():
+    tab_performance = html.Div(
+        [
+            html.H5(
+                children="Time and memory per stage of the last calculation",
+                style={"marginTop": "20px"},
+            ),
+            html.Div(
+                [
+                    html.Button(
+                        id="performance_refresh_button", n_clicks=0, children="Refresh"
+                    ),
+                    html.Button(
+                        id="performance_download_button",
+                        n_clicks=0,
+                        children="Download Chrome trace",
+                        style={"margin-left": "0.5%"},
+                    ),
+                ]
+            ),
+            dcc.Download(id="performance_download"),
+            html.Div(id="performance_div"),
+        ]
+    )
+    return tab_performance
+
+
+@app.callback(
+    Output("performance_div", "children"),
+    Input("performance_refresh_button", "n_clicks"),
+    State("session_id", "data"),
 )
+def display_performance(n_clicks, session_id):
+    profiler = session_profiler(session_id)
+    if profiler is None:
+        return html.Div("Please finish the setup first.")
+
+    df_records = profiler.to_frame()
+    if len(df_records) == 0:
+        return html.Div("No calculation has been recorded yet.")
+    df_summary = profiler.summary()
+
+    fig_stages = go.Figure(
+        data=[
+            go.Bar(x=df_summary["stage"], y=df_summary[column], name=column)
+            for column in ["wall_time", "cpu_time", "child_cpu_time"]
+        ]
+    )
+    fig_stages.update_layout(
+        barmode="group", yaxis=dict(title_text="time in s"), width=1000, height=400
+    )
+
+    # run_single contains the other stages of a radius
+    df_radii = df_records[
+        df_records["radius"].notna() & (df_records["stage"] != "run_single")
+    ]
+    df_radii = df_radii.pivot_table(
+        index="radius", columns="stage", values="wall_time", aggfunc="sum"
+    )
+    fig_radii = go.Figure(
+        data=[
+            go.Bar(x=df_radii.index, y=df_radii[stage], name=stage)
+            for stage in df_radii.columns
+        ]
+    )
+    fig_radii.update_layout(
+        barmode="stack",
+        xaxis=dict(title_text="Sphere radius"),
+        yaxis=dict(title_text="wall time in s"),
+        width=1000,
+        height=400,
+    )
+
+    return html.Div(
+        [
+            dash_table.DataTable(
+                data=df_summary.round(4).to_dict("records"),
+                page_size=20,
+                export_format="csv",
+                export_headers="display",
+            ),
+            dcc.Graph(figure=fig_stages),
+            dcc.Graph(figure=fig_radii),
+        ],
+        style={"width": "60%", "marginTop": "20px"},
+    )
+
+
+@app.callback(
+    Output("performance_download", "data"),
+    Input("performance_download_button", "n_clicks"),
+    State("session_id", "data"),
+    prevent_initial_call=True,
+)
+def download_performance_trace(n_clicks, session_id):
+    profiler = session_profiler(session_id)
+    if profiler is None:
+        raise PreventUpdate
+    trace = profiler.to_chrome_trace()
+    return dcc.send_string(json.dumps(trace), "scan_trace.json")
+
+
+def serve_layout():
+    # a new session for every page load, so browser tabs do not share their results
+    return html.Div(
+        [
+            dcc.Store(id="session_id", data=new_session_id()),
+            dcc.Tabs(
+                children=[
+                    dcc.Tab(create_main_page(), id="main_tab", label="Setup"),
+                    dcc.Tab(label="Radii-Scan", children=create_2d_tab()),
+                    # setup the 3d page
+                    dcc.Tab(label="3D-Image", children=create_3d_tab()),
+                    dcc.Tab(label="Performance", children=create_performance_tab()),
+                ],
+                id="main_tabs",
+            ),
+        ],
+        id="layout",
+    )
+
+
+app.layout = serve_layout
 
 
 if __name__ == "__main__":
@@ -743,4 +1337,4 @@ if __name__ == "__main__":
     port = 8012
     webbrowser.open_new(f"http://127.0.0.1:{port}/")
 
-    app.run_server(debug=True, port=port)
+    app.run(debug=True, port=port)
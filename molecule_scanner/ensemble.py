@@ -0,0 +1,379 @@
+"""
+Buried volume scans of conformer ensembles and trajectories in multi-frame .xyz files.
+
+The frames are streamed from the file and handed to a worker pool with a bounded
+number of pending frames, so only a few frames are held in memory at any time.
+Every frame is scanned with the atom IDs of the ensemble and the per-frame results
+are combined into uniformly or Boltzmann weighted ensemble statistics. The numpy
+backend integrates the frame coordinates directly, sambvca21 needs a file per frame.
+"""
+import os
+import re
+import shutil
+import sys
+from tempfile import mkdtemp
+
+import numpy as np
+import pandas as pd
+
+from molecule_scanner import buried_volume
+from molecule_scanner.execution import check_executor, get_n_workers, iter_jobs
+from molecule_scanner.paths import locate_file
+from molecule_scanner.scanner import MoleculeScanner, _results_to_row
+from molecule_scanner.spatial_index import CellList
+
+# Boltzmann constant per Kelvin in the supported energy units
+BOLTZMANN_CONSTANTS = {
+    "hartree": 3.166811563e-6,
+    "eV": 8.617333262e-5,
+    "kcal/mol": 1.987204259e-3,
+    "kJ/mol": 8.314462618e-3,
+}
+WEIGHTINGS = ("uniform", "boltzmann")
+
+# number after an energy key of the comment line, e.g. "energy: -45.12 gnorm: 0.0004"
+# of xtb and CREST, "E=-1.5" or "SCF Done: -3672.22033654 A.U."
+ENERGY_PATTERN = re.compile(
+    r"(?<!\w)(?:energy|E|SCF Done)\s*[:=]\s*([-+]?\d+\.?\d*(?:[eE][-+]?\d+)?)",
+    re.IGNORECASE,
+)
+
+_FRAME_COLUMNS = ["frame", "energy"]
+
+
+def parse_energy(comment, pattern=None):
+    """Energy in the comment line of a frame.
+
+    Args:
+        comment (str): Comment line of the frame.
+        pattern (str): Regular expression of the energy, its first group or else the
+            whole match is read. (default None, the number after an "energy", "E" or
+            "SCF Done" key followed by ":" or "=")
+
+    Returns:
+        float: the energy, None if the pattern is not found.
+    """
+    match = re.search(ENERGY_PATTERN if pattern is None else pattern, comment)
+    if match is None:
+        return None
+    return float(match.group(1) if match.re.groups else match.group())
+
+
+def boltzmann_weights(energies, temperature=298.15, energy_unit="hartree"):
+    """Normalized Boltzmann weights of the given energies.
+
+    Args:
+        energies (array): Energies of the frames.
+        temperature (float): Temperature in Kelvin (default 298.15)
+        energy_unit (str): "hartree", "eV", "kcal/mol" or "kJ/mol" (default "hartree")
+
+    Returns:
+        numpy.ndarray: weights summing up to one.
+    """
+    if energy_unit not in BOLTZMANN_CONSTANTS:
+        raise ValueError(
+            f"Unknown energy unit '{energy_unit}', choose one of {', '.join(BOLTZMANN_CONSTANTS)}."
+        )
+    if temperature <= 0:
+        raise ValueError("The temperature has to be positive.")
+    energies = np.asarray(energies, dtype=float)
+    # relative to the lowest energy to avoid an overflow of the exponential
+    exponent = -(energies - energies.min()) / (
+        BOLTZMANN_CONSTANTS[energy_unit] * temperature
+    )
+    weights = np.exp(exponent)
+    return weights / weights.sum()
+
+
+def weighted_statistics(values, weights):
+    """Weighted mean, standard deviation and range of the columns of a frame.
+
+    Args:
+        values (pandas.DataFrame): One row per frame.
+        weights (array): Weight of every row, normalized to one.
+
+    Returns:
+        pandas.DataFrame: one row per column of values with mean, std, min and max.
+    """
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum()
+    data = values.to_numpy(dtype=float)
+    mean = weights @ data
+    std = np.sqrt(weights @ (data - mean) ** 2)
+    return pd.DataFrame(
+        {
+            "metric": values.columns,
+            "mean": mean,
+            "std": std,
+            "min": data.min(axis=0),
+            "max": data.max(axis=0),
+        }
+    )
+
+
+def _scan_frame_numpy(coords, ensemble, atoms, radii, parameters):
+    # the atom selection and radii of the ensemble are reused, only the frame is oriented
+    mask, atom_radii = atoms
+    oriented = buried_volume.orient_coordinates(
+        coords,
+        ensemble["sphere_center_atom_ids"],
+        ensemble["z_ax_atom_ids"],
+        ensemble["xz_plane_atoms_ids"],
+        orient_z=parameters["orient_z"],
+        displacement=parameters["displacement"],
+    )[mask]
+    index = CellList(oriented, atom_radii)
+    rows = []
+    for r_current in radii:
+        free, buried, exact_volume = buried_volume.integrate_sphere(
+            oriented, atom_radii, r_current, parameters["mesh_size"], index=index
+        )
+        if free.sum() + buried.sum() == 0:
+            rows.append(None)
+            continue
+        results = buried_volume.format_results(free, buried, exact_volume)
+        rows.append(_results_to_row(r_current, results, all_levels=False))
+    return rows
+
+
+def _scan_frame(
+    frame_id, elements, coords, comment, ensemble, atoms, radii, parameters
+):
+    # module level so that it can be sent to worker processes
+    if atoms is not None:
+        return _scan_frame_numpy(coords, ensemble, atoms, radii, parameters)
+    frame_dir = os.path.join(ensemble["working_dir"], f"frame_{frame_id}")
+    os.makedirs(frame_dir, exist_ok=True)
+    try:
+        xyz_filepath = os.path.join(frame_dir, "frame.xyz")
+        buried_volume.write_xyz(xyz_filepath, elements, coords, comment)
+        scanner = MoleculeScanner(
+            xyz_filepath,
+            ensemble["sphere_center_atom_ids"],
+            ensemble["z_ax_atom_ids"],
+            ensemble["xz_plane_atoms_ids"],
+            atoms_to_delete_ids=ensemble["atoms_to_delete_ids"],
+            working_dir=frame_dir,
+            verbose=0,
+            backend=ensemble["backend"],
+            cache_dir=ensemble["cache_dir"],
+        )
+        rows = []
+        for r_current in radii:
+            results = scanner.run_single(
+                r_current, write_surf_files=False, **parameters
+            )
+            rows.append(_results_to_row(r_current, results, all_levels=False))
+        return rows
+    finally:
+        shutil.rmtree(frame_dir, ignore_errors=True)
+
+
+class EnsembleScanner:
+    """
+    Buried volume scanner for all frames of a multi-frame .xyz file.
+    """
+
+    def __init__(
+        self,
+        xyz_filepath,
+        sphere_center_atom_ids,
+        z_ax_atom_ids,
+        xz_plane_atoms_ids,
+        atoms_to_delete_ids=None,
+        working_dir=None,
+        backend="sambvca",
+        cache_dir=None,
+    ):
+        """
+        Every frame has to contain the same atoms in the same order, so the atom IDs
+        apply to all frames.
+
+        Args:
+        xyz_filepath (str): Location of the multi-frame .xyz file, e.g. a conformer
+            search or MD trajectory.
+        sphere_center_atom_ids, z_ax_atom_ids, xz_plane_atoms_ids, atoms_to_delete_ids:
+            Atom IDs as for MoleculeScanner, used for every frame.
+        working_dir (str): Directory for the temporary frame files of sambvca21
+            (default None, a new temporary directory)
+        backend (str): "sambvca" or "numpy", see MoleculeScanner. The numpy backend scans
+            the frames in memory without frame files. (default "sambvca")
+        cache_dir (str): Directory of a persistent result cache shared by all frames,
+            only used by sambvca21 (default None)
+        """
+        self.xyz_filepath = locate_file(xyz_filepath)
+        self.sphere_center_atom_ids = sphere_center_atom_ids
+        self.z_ax_atom_ids = z_ax_atom_ids
+        self.xz_plane_atoms_ids = xz_plane_atoms_ids
+        self.atoms_to_delete_ids = atoms_to_delete_ids
+        if backend not in ("sambvca", "numpy"):
+            raise ValueError(
+                f"Unknown backend '{backend}', choose either 'sambvca' or 'numpy'."
+            )
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.working_dir = mkdtemp() if working_dir is None else working_dir
+        # the first frame defines the atoms of the ensemble
+        self.elements, _ = buried_volume.read_xyz(self.xyz_filepath)
+
+    def iter_frames(self):
+        """Yield the element symbols, coordinates and comment line of every frame.
+
+        Raises:
+            ValueError: if a frame does not contain the atoms of the first frame.
+        """
+        for frame_id, (elements, coords, comment) in enumerate(
+            buried_volume.iter_xyz_frames(self.xyz_filepath)
+        ):
+            if len(elements) != len(self.elements) or np.any(elements != self.elements):
+                raise ValueError(
+                    f"Frame {frame_id} does not contain the same atoms as the first frame."
+                )
+            yield elements, coords, comment
+
+    def _numpy_atoms(self, remove_H, radii_table):
+        """Mask and radii of the atoms used for Vbur, the same for every frame."""
+        if self.backend != "numpy":
+            return None
+        mask = buried_volume.select_atoms(
+            self.elements, self.atoms_to_delete_ids, remove_H=remove_H
+        )
+        return mask, buried_volume.get_atom_radii(self.elements[mask], radii_table)
+
+    def _ensemble_parameters(self):
+        return {
+            "sphere_center_atom_ids": self.sphere_center_atom_ids,
+            "z_ax_atom_ids": self.z_ax_atom_ids,
+            "xz_plane_atoms_ids": self.xz_plane_atoms_ids,
+            "atoms_to_delete_ids": self.atoms_to_delete_ids,
+            "backend": self.backend,
+            "cache_dir": self.cache_dir,
+            "working_dir": self.working_dir,
+        }
+
+    def run(
+        self,
+        sphere_radius,
+        weighting="uniform",
+        temperature=298.15,
+        energy_unit="hartree",
+        energies=None,
+        energy_pattern=None,
+        displacement=0.0,
+        mesh_size=0.10,
+        remove_H=True,
+        orient_z=True,
+        radii_table="default",
+        n_threads=-1,
+        executor="processes",
+        max_pending=None,
+    ):
+        """
+        Scan every frame and combine the results into ensemble statistics.
+        Args:
+            sphere_radius (float or list): Sphere radius or several radii scanned for every frame.
+            weighting (str): "uniform" or "boltzmann" (default "uniform")
+            temperature (float): Temperature of the Boltzmann weights in Kelvin (default 298.15)
+            energy_unit (str): Unit of the energies, see boltzmann_weights (default "hartree")
+            energies (list): Energy of every frame. None reads the energies from the comment
+                lines of the frames, see parse_energy. (default None)
+            energy_pattern (str): Regular expression of the energy in the comment lines,
+                see parse_energy (default None, the number after an energy key)
+            displacement, mesh_size, remove_H, orient_z, radii_table: see MoleculeScanner.run_single
+            n_threads (int): Number of workers, limited to the number of CPUs. -1 to use all CPUs. (default -1)
+            executor (str): "processes", "threads" or "serial" (default "processes")
+            max_pending (int): Maximum number of frames read ahead of the finished ones
+                (default None, four per worker)
+        Returns:
+            tuple: pandas.DataFrame with one row per frame and radius, including the energy
+            and weight of the frame, and pandas.DataFrame with the weighted mean, standard
+            deviation and range of every result per radius.
+        """
+        check_executor(executor)
+        if weighting not in WEIGHTINGS:
+            raise ValueError(
+                f"Unknown weighting '{weighting}', choose one of {', '.join(WEIGHTINGS)}."
+            )
+        if max_pending is None:
+            max_pending = 4 * get_n_workers(n_threads, os.cpu_count() or 1)
+        radii = [float(r_current) for r_current in np.atleast_1d(sphere_radius)]
+        parameters = dict(
+            displacement=displacement,
+            mesh_size=mesh_size,
+            remove_H=remove_H,
+            orient_z=orient_z,
+            radii_table=radii_table,
+        )
+        ensemble = self._ensemble_parameters()
+        atoms = self._numpy_atoms(remove_H, radii_table)
+
+        def jobs():
+            for frame_id, (elements, coords, comment) in enumerate(self.iter_frames()):
+                yield frame_id, elements, coords, comment, ensemble, atoms, radii, parameters
+
+        rows = []
+        for job, frame_rows, error in iter_jobs(
+            _scan_frame,
+            jobs(),
+            executor,
+            n_threads,
+            ordered=True,
+            max_pending=max_pending,
+        ):
+            frame_id, comment = job[0], job[3]
+            if error is not None:
+                print(
+                    f"Calculation for frame {frame_id} failed: {error}", file=sys.stderr
+                )
+                continue
+            if energies is not None:
+                energy = float(energies[frame_id])
+            else:
+                energy = parse_energy(comment, energy_pattern)
+            for row in frame_rows:
+                if row is not None:
+                    rows.append({"frame": frame_id, "energy": energy, **row})
+
+        df_frames = pd.DataFrame(rows)
+        if df_frames.empty:
+            return df_frames, pd.DataFrame()
+        df_frames["weight"] = self._frame_weights(
+            df_frames, weighting, temperature, energy_unit
+        )
+        return df_frames, self._statistics(df_frames)
+
+    def _frame_weights(self, df_frames, weighting, temperature, energy_unit):
+        """Normalized weight of every row, computed per radius over the scanned frames."""
+        weights = pd.Series(0.0, index=df_frames.index)
+        for _, df_radius in df_frames.groupby("r"):
+            if weighting == "uniform":
+                weights[df_radius.index] = 1.0 / len(df_radius)
+                continue
+            if df_radius["energy"].isna().any():
+                raise ValueError(
+                    "Boltzmann weighting needs the energy of every frame, pass energies "
+                    "or write them to the comment lines of the .xyz file."
+                )
+            weights[df_radius.index] = boltzmann_weights(
+                df_radius["energy"], temperature, energy_unit
+            )
+        return weights
+
+    def _statistics(self, df_frames):
+        """Weighted statistics of all result columns per radius."""
+        result_columns = [
+            column
+            for column in df_frames.columns
+            if column not in _FRAME_COLUMNS + ["r", "weight"]
+        ]
+        statistics = []
+        for r_current, df_radius in df_frames.groupby("r"):
+            df_statistics = weighted_statistics(
+                df_radius[result_columns], df_radius["weight"]
+            )
+            df_statistics.insert(0, "r", r_current)
+            df_statistics["n_frames"] = len(df_radius)
+            # Kish effective sample size of the weights
+            df_statistics["n_effective"] = 1.0 / np.sum(df_radius["weight"] ** 2)
+            statistics.append(df_statistics)
+        return pd.concat(statistics, ignore_index=True)
@@ -0,0 +1,144 @@
+"""
+Helpers to distribute independent jobs over threads or worker processes.
+"""
+import os
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+EXECUTORS = ("threads", "processes", "serial")
+
+
+def check_executor(executor):
+    if executor not in EXECUTORS:
+        raise ValueError(
+            f"Unknown executor '{executor}', choose one of {', '.join(EXECUTORS)}."
+        )
+
+
+def get_n_workers(n_threads, n_jobs):
+    """Number of workers for n_jobs tasks, bounded by the number of CPUs.
+
+    Args:
+        n_threads (int): Requested number of workers, -1 (or None) for one per CPU.
+        n_jobs (int): Number of tasks to distribute.
+
+    Returns:
+        int: the number of workers to start.
+    """
+    cpu_count = os.cpu_count() or 1
+    if n_threads is None or n_threads < 1:
+        n_workers = cpu_count
+    else:
+        n_workers = min(n_threads, cpu_count)
+    return max(1, min(n_workers, n_jobs))
+
+
+def _job_outcome(future, job):
+    try:
+        result = future.result()
+    except Exception as e:
+        return job, None, e
+    return job, result, None
+
+
+def iter_jobs(
+    function,
+    jobs,
+    executor="threads",
+    n_threads=-1,
+    ordered=False,
+    max_pending=None,
+    cancelled=None,
+):
+    """Call function(*job) for every job and yield the results while the pool keeps running.
+
+    A failing job does not stop the other jobs, its exception is yielded instead.
+    Pending jobs are cancelled when the generator is closed early.
+
+    Args:
+        function (callable): Module level function, so it can be sent to worker processes.
+        jobs (iterable): Argument tuples for function.
+        executor (str): "threads", "processes" or "serial" (default "threads")
+        n_threads (int): Number of workers, limited to the number of CPUs. -1 to use all CPUs. (default -1)
+        ordered (bool): Yield in the order of jobs instead of the order of completion. (default False)
+        max_pending (int): Submit at most this many jobs ahead of the yielded results and
+            consume jobs lazily, so a generator of large jobs is never held in memory at
+            once. None submits all jobs at once. (default None)
+        cancelled (callable): Checked before every job is submitted, no further jobs are
+            started once it returns True. The running jobs are still yielded. Without
+            max_pending only one job per worker is submitted ahead. (default None)
+
+    Yields:
+        tuple: (job, result, error) with error being None or the raised exception.
+    """
+    check_executor(executor)
+    if max_pending is None:
+        jobs = list(jobs)
+        n_workers = get_n_workers(n_threads, len(jobs))
+        if cancelled is not None:
+            # nothing waits in the pool queue, so a cancel stops all jobs not yet running
+            max_pending = n_workers
+    else:
+        if max_pending < 1:
+            raise ValueError("max_pending has to be at least 1.")
+        n_workers = get_n_workers(n_threads, max_pending)
+
+    if executor == "serial" or n_workers == 1:
+        for job in jobs:
+            if cancelled is not None and cancelled():
+                return
+            try:
+                result = function(*job)
+            except Exception as e:
+                yield job, None, e
+            else:
+                yield job, result, None
+        return
+
+    pool_class = ThreadPoolExecutor if executor == "threads" else ProcessPoolExecutor
+    pool = pool_class(max_workers=n_workers)
+    if max_pending is None:
+        futures = {pool.submit(function, *job): job for job in jobs}
+    else:
+        futures = {}
+    try:
+        if max_pending is None:
+            for future in futures if ordered else as_completed(futures):
+                yield _job_outcome(future, futures[future])
+            return
+
+        jobs = iter(jobs)
+        submitted = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(futures) < max_pending:
+                if cancelled is not None and cancelled():
+                    exhausted = True
+                    break
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                future = pool.submit(function, *job)
+                futures[future] = job
+                if ordered:
+                    submitted.append(future)
+            if not futures:
+                return
+            if ordered:
+                done = [submitted.popleft()]
+                wait(done)
+            else:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _job_outcome(future, futures.pop(future))
+    finally:
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
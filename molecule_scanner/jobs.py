@@ -0,0 +1,243 @@
+"""
+Local background jobs for long running scans.
+
+A job runs in a worker thread of the JobManager, so that a caller (e.g. a Dash
+callback) can return immediately and poll the progress, the partial results
+and the final result of the job by its ID. Jobs can be cancelled while running.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from molecule_scanner.scanner import rows_to_frame
+
+JOB_STATES = ("pending", "running", "done", "cancelled", "failed")
+
+
+class BackgroundJob:
+    """
+    State of one background job, shared between the worker thread and the pollers.
+    """
+
+    def __init__(self, total):
+        """
+        Args:
+        total (int): Number of steps of the job, e.g. the number of radii.
+        """
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.done = 0
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._rows = []
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished_running(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    def cancel(self):
+        """Ask the job to stop, steps which are already running are finished first."""
+        self._cancel_event.set()
+        if self.status == "pending":
+            self._finish("cancelled")
+
+    def add_row(self, row):
+        """Count one finished step and keep its row (None for steps without result)."""
+        with self._lock:
+            self.done += 1
+            if row is not None:
+                self._rows.append(row)
+
+    def rows(self):
+        """Copy of the rows collected so far."""
+        with self._lock:
+            return list(self._rows)
+
+    @property
+    def n_rows(self):
+        with self._lock:
+            return len(self._rows)
+
+    def rows_since(self, offset):
+        """Rows collected after the first offset rows, e.g. the ones a poller has not seen yet.
+
+        Returns:
+            tuple: the new rows and the offset for the next call.
+        """
+        with self._lock:
+            return self._rows[offset:], len(self._rows)
+
+    def frame(self):
+        """Partial or final scan results as a DataFrame sorted by r, None without results."""
+        rows = self.rows()
+        if len(rows) == 0:
+            return None
+        return rows_to_frame(rows).sort_values(by="r").reset_index(drop=True)
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def eta(self):
+        """Estimated remaining seconds from the mean time per step, None before the first step."""
+        if self.done == 0 or self.finished_running:
+            return None
+        return self.elapsed() / self.done * (self.total - self.done)
+
+    def progress(self):
+        """Snapshot of the job state for pollers.
+
+        Returns:
+            dict: status, done, total, elapsed and eta (seconds) of the job.
+        """
+        return {
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": self.elapsed(),
+            "eta": self.eta(),
+        }
+
+    def _start(self):
+        self.status = "running"
+        self.started = time.perf_counter()
+
+    def _finish(self, status, result=None, error=None):
+        self.result = result
+        self.error = error
+        if self.started is not None:
+            self.finished = time.perf_counter()
+        self.status = status
+
+
+class JobManager:
+    """
+    Runs scans in background threads and keeps their state until they are removed.
+    """
+
+    def __init__(self, max_workers=2):
+        """
+        Args:
+        max_workers (int): Number of jobs running at the same time,
+            further jobs wait until a worker is free. (default 2)
+        """
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="scan_job"
+        )
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _submit(self, job, target, *args):
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, target, *args)
+        return job.id
+
+    @staticmethod
+    def _run(job, target, *args):
+        if job.cancel_requested:
+            return
+        job._start()
+        try:
+            result = target(job, *args)
+        except Exception as e:
+            job._finish("failed", error=e)
+        else:
+            job._finish("cancelled" if job.cancel_requested else "done", result)
+
+    def submit_scan(
+        self, scanner, r_min, r_max, nsteps=50, monte_carlo=False, **parameters
+    ):
+        """Start MoleculeScanner.iter_range in the background.
+
+        The rows are collected as the radii finish, job.frame() returns the partial
+        results while the scan is running and job.result the final DataFrame.
+
+        Args:
+            scanner (MoleculeScanner): Initialized scanner.
+            r_min, r_max, nsteps: Radii as in run_range.
+            monte_carlo (bool): Run the quick Monte Carlo estimate of
+                iter_range_monte_carlo instead. (default False)
+            parameters: Further arguments for iter_range or iter_range_monte_carlo.
+
+        Returns:
+            str: the job ID.
+        """
+        job = BackgroundJob(total=nsteps)
+        return self._submit(
+            job, self._scan, scanner, (r_min, r_max, nsteps), monte_carlo, parameters
+        )
+
+    @staticmethod
+    def _scan(job, scanner, radii, monte_carlo, parameters):
+        if monte_carlo:
+            rows = scanner.iter_range_monte_carlo(*radii, **parameters)
+        else:
+            # no further radius is started once the job is cancelled
+            rows = scanner.iter_range(
+                *radii,
+                include_missing=True,
+                cancelled=job._cancel_event.is_set,
+                **parameters,
+            )
+        try:
+            for row in rows:
+                job.add_row(row)
+                if job.cancel_requested:
+                    break
+        finally:
+            # cancels the radii which have not been started yet
+            rows.close()
+        return job.frame()
+
+    def submit(self, function, *args, **kwargs):
+        """Start function(*args, **kwargs) as a single step job, e.g. generate_cavity.
+
+        Returns:
+            str: the job ID, job.result holds the return value once finished.
+        """
+        job = BackgroundJob(total=1)
+        return self._submit(job, self._call, function, args, kwargs)
+
+    @staticmethod
+    def _call(job, function, args, kwargs):
+        result = function(*args, **kwargs)
+        job.add_row(None)
+        return result
+
+    def get(self, job_id):
+        """Return the job with the given ID or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel the job with the given ID, returns False if it does not exist."""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def remove(self, job_id):
+        """Cancel the job and forget its state."""
+        self.cancel(job_id)
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._pool.shutdown(wait=wait)
@@ -17,4 +17,4 @@ def open_browser():
 
 print("Starting app...")
 Timer(1, open_browser).start()
-app.run_server(debug=True, port=port)
+app.run(debug=True, port=port)
@@ -0,0 +1,446 @@
+"""
+Resumable sweeps over molecules and sphere radii with a SQLite job ledger.
+
+Every (molecule, parameters, radius) task is a row of the ledger with the status
+pending, running, done or failed and, once finished, its result. Workers claim
+pending tasks atomically, so several processes, or several machines sharing the
+ledger file, can work on one sweep. Adding the same tasks again does not repeat
+them, a restarted sweep only runs the tasks which are not finished.
+Tasks of workers which died on this machine, e.g. after a Ctrl-C or running out
+of memory, are claimed again. Tasks of other machines are claimed again once
+their lease has expired.
+"""
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+from molecule_scanner.cache import file_digest, make_key
+from molecule_scanner.execution import get_n_workers, iter_jobs
+from molecule_scanner.scanner import MoleculeScanner
+
+STATUSES = ("pending", "running", "done", "failed")
+MOLECULE_KEYS = [
+    "xyz_filepath",
+    "sphere_center_atom_ids",
+    "z_ax_atom_ids",
+    "xz_plane_atoms_ids",
+    "atoms_to_delete_ids",
+]
+
+
+def worker_id():
+    """ID of the current process, its host name and process ID."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _process_alive(pid):
+    if os.name == "nt":
+        # os.kill terminates processes on Windows, rely on the lease there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running under another user
+        return True
+    return True
+
+
+def _parameters_json(parameters):
+    parameters = dict(parameters)
+    parameters.setdefault("write_surf_files", False)
+    return json.dumps(parameters, sort_keys=True)
+
+
+def _to_ids(ids):
+    if ids is None:
+        return None
+    return [int(atom_id) for atom_id in ids]
+
+
+class JobLedger:
+    """
+    SQLite table of the tasks of a sweep, safe to use from several processes.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+        path (str): Location of the ledger database, created if needed.
+        """
+        self.path = str(path)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id INTEGER PRIMARY KEY, key TEXT UNIQUE, molecule TEXT, spec TEXT, "
+                "parameters TEXT, r REAL, status TEXT, worker TEXT, claim TEXT, "
+                "claimed_at REAL, attempts INTEGER, result TEXT, error TEXT)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS status_index ON tasks (status)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS claim_index ON tasks (claim)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # one connection per call keeps the ledger usable from threads and processes
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add_molecule(self, molecule, radii, **parameters):
+        """Add the tasks of one molecule.
+
+        Tasks which are already in the ledger are kept as they are.
+
+        Args:
+            molecule (dict): xyz_filepath, the atom IDs of MoleculeScanner and
+                optionally name and backend, e.g. an entry of library.load_manifest.
+            radii (list): Sphere radii to calculate.
+            parameters: Further arguments for MoleculeScanner.run_single,
+                e.g. mesh_size.
+
+        Returns:
+            int: number of new tasks.
+        """
+        spec = {key: molecule.get(key) for key in MOLECULE_KEYS}
+        spec["xyz_filepath"] = os.path.abspath(spec["xyz_filepath"])
+        for key in MOLECULE_KEYS[1:]:
+            spec[key] = _to_ids(spec[key])
+        spec["backend"] = molecule.get("backend", "sambvca")
+        name = molecule.get("name")
+        if name is None:
+            name = os.path.splitext(os.path.basename(spec["xyz_filepath"]))[0]
+        parameters = _parameters_json(parameters)
+
+        # the same molecule has the same tasks wherever its file is
+        molecule_key = dict(spec, xyz_filepath=file_digest(spec["xyz_filepath"]))
+        rows = [
+            (
+                make_key(molecule=molecule_key, parameters=parameters, r=float(r)),
+                name,
+                json.dumps(spec),
+                parameters,
+                float(r),
+            )
+            for r in radii
+        ]
+        with self._connect() as connection:
+            n_before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (key, molecule, spec, parameters, r, "
+                "status, attempts) VALUES (?, ?, ?, ?, ?, 'pending', 0)",
+                rows,
+            )
+            return connection.total_changes - n_before
+
+    def add_manifest(self, manifest, radii, backend="sambvca", **parameters):
+        """Add the tasks of all molecules of a library manifest.
+
+        Args:
+            manifest (str or list): Manifest, see library.load_manifest.
+            radii (list): Sphere radii to calculate for every molecule.
+            backend (str): "sambvca" or "numpy" (default "sambvca")
+            parameters: Further arguments for MoleculeScanner.run_single.
+
+        Returns:
+            int: number of new tasks.
+        """
+        from molecule_scanner.library import load_manifest
+
+        return sum(
+            self.add_molecule(dict(molecule, backend=backend), radii, **parameters)
+            for molecule in load_manifest(manifest)
+        )
+
+    def claim(self, worker=None, lease_timeout=None):
+        """Mark the next pending task as running for a worker.
+
+        Args:
+            worker (str): ID of the worker (default None, the ID of this process)
+            lease_timeout (float): Running tasks claimed more than this many seconds
+                ago are claimed again, e.g. from a machine which went down.
+                (default None, never)
+
+        Returns:
+            dict: id, claim token, molecule, spec, parameters and r of the task,
+            None if there is none left.
+        """
+        worker = worker_id() if worker is None else worker
+        claim = uuid.uuid4().hex
+        now = time.time()
+        expired = -1.0 if lease_timeout is None else now - lease_timeout
+        with self._connect() as connection:
+            # a single statement, so two workers can never claim the same task
+            connection.execute(
+                "UPDATE tasks SET status = 'running', worker = ?, claim = ?, "
+                "claimed_at = ?, attempts = attempts + 1 WHERE id = ("
+                "SELECT id FROM tasks WHERE status = 'pending' "
+                "OR (status = 'running' AND claimed_at < ?) ORDER BY id LIMIT 1)",
+                (worker, claim, now, expired),
+            )
+            row = connection.execute(
+                "SELECT id, molecule, spec, parameters, r FROM tasks WHERE claim = ?",
+                (claim,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "claim": claim,
+            "molecule": row[1],
+            "spec": json.loads(row[2]),
+            "parameters": json.loads(row[3]),
+            "r": row[4],
+        }
+
+    def complete(self, task_id, claim, result):
+        """Store the JSON serializable result of a task and mark it as done.
+
+        Args:
+            task_id (int): ID of the task.
+            claim (str): Claim token returned with the task by claim.
+            result (list): Results of MoleculeScanner.run_single.
+
+        Returns:
+            bool: False if the task was claimed again in the meantime, e.g. after
+            its lease expired, the result of the new claim is kept then.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL "
+                "WHERE id = ? AND claim = ?",
+                (json.dumps(result), task_id, claim),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id, claim, error):
+        """Mark a task as failed with an error message.
+
+        Args:
+            task_id (int): ID of the task.
+            claim (str): Claim token returned with the task by claim.
+            error (str): Error message.
+
+        Returns:
+            bool: False if the task was claimed again in the meantime.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'failed', error = ? "
+                "WHERE id = ? AND claim = ?",
+                (str(error), task_id, claim),
+            )
+            return cursor.rowcount == 1
+
+    def recover(self):
+        """Set the running tasks of dead worker processes on this machine to pending.
+
+        Returns:
+            int: number of recovered tasks.
+        """
+        host = socket.gethostname()
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, worker FROM tasks WHERE status = 'running'"
+            ).fetchall()
+            dead = []
+            for task_id, worker in rows:
+                worker_host, _, pid = worker.rpartition(":")
+                if (
+                    worker_host == host
+                    and pid.isdigit()
+                    and not _process_alive(int(pid))
+                ):
+                    dead.append((task_id,))
+            connection.executemany(
+                "UPDATE tasks SET status = 'pending', worker = NULL, claim = NULL "
+                "WHERE id = ?",
+                dead,
+            )
+        return len(dead)
+
+    def reset(self, statuses=("failed",)):
+        """Set all tasks with the given statuses back to pending.
+
+        Used e.g. to retry the failed tasks.
+
+        Returns:
+            int: number of reset tasks.
+        """
+        for status in statuses:
+            if status not in STATUSES:
+                raise ValueError(
+                    f"Unknown status '{status}', choose from {', '.join(STATUSES)}."
+                )
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'pending', worker = NULL, claim = NULL "
+                f"WHERE status IN ({', '.join('?' for _ in statuses)})",
+                tuple(statuses),
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """Number of tasks per status."""
+        counts = dict.fromkeys(STATUSES, 0)
+        with self._connect() as connection:
+            for status, count in connection.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ):
+                counts[status] = count
+        return counts
+
+    def errors(self):
+        """Molecule, radius and error message of every failed task."""
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT molecule, r, error FROM tasks WHERE status = 'failed' "
+                "ORDER BY id"
+            ).fetchall()
+
+    def results(self, molecule=None, parameters=None):
+        """Total results of the finished tasks.
+
+        Args:
+            molecule (str): Only the tasks of this molecule (default None, all)
+            parameters (dict): Only the tasks added with these run_single arguments
+                (default None, all)
+
+        Returns:
+            pandas.DataFrame: the columns molecule, r, metric and value, the long
+            format of library.scan_library.
+        """
+        import pandas as pd
+
+        query = "SELECT molecule, r, result FROM tasks WHERE status = 'done'"
+        arguments = ()
+        if molecule is not None:
+            query += " AND molecule = ?"
+            arguments += (molecule,)
+        if parameters is not None:
+            query += " AND parameters = ?"
+            arguments += (_parameters_json(parameters),)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY id", arguments).fetchall()
+
+        long_rows = [
+            {"molecule": name, "r": r, "metric": key, "value": value}
+            for name, r, result in rows
+            for key, value in json.loads(result)[0].items()
+        ]
+        df_results = pd.DataFrame(
+            long_rows, columns=["molecule", "r", "metric", "value"]
+        )
+        return df_results.sort_values(by=["molecule", "r"], kind="stable").reset_index(
+            drop=True
+        )
+
+
+def work(
+    ledger_path, working_dir=None, cache_dir=None, lease_timeout=None, max_tasks=None
+):
+    """Claim and run tasks of a ledger until none are left.
+
+    Module level, so that it can be started in worker processes or on other machines.
+
+    Args:
+        ledger_path (str): Location of the ledger database.
+        working_dir (str): Directory for the sambvca files
+            (default None, a temporary directory)
+        cache_dir (str): Directory of a persistent result cache (default None)
+        lease_timeout (float): See JobLedger.claim (default None)
+        max_tasks (int): Stop after this many tasks (default None, no limit)
+
+    Returns:
+        int: number of tasks run by this worker.
+    """
+    ledger = JobLedger(ledger_path)
+    scanners = {}
+    n_tasks = 0
+    while max_tasks is None or n_tasks < max_tasks:
+        task = ledger.claim(lease_timeout=lease_timeout)
+        if task is None:
+            break
+        n_tasks += 1
+        try:
+            spec_key = json.dumps(task["spec"], sort_keys=True)
+            if spec_key not in scanners:
+                scanners[spec_key] = MoleculeScanner(
+                    **task["spec"],
+                    working_dir=working_dir,
+                    verbose=0,
+                    cache_dir=cache_dir,
+                )
+            results = scanners[spec_key].run_single(task["r"], **task["parameters"])
+        except Exception as e:
+            ledger.fail(task["id"], task["claim"], f"{type(e).__name__}: {e}")
+            continue
+        if results is None or results[0] is None:
+            ledger.fail(
+                task["id"],
+                task["claim"],
+                "No results, the radius may be too big or too small.",
+            )
+        else:
+            # a stale worker whose task was claimed again does not overwrite it
+            ledger.complete(task["id"], task["claim"], list(results))
+    return n_tasks
+
+
+def run_ledger(
+    ledger_path,
+    n_workers=-1,
+    working_dir=None,
+    cache_dir=None,
+    lease_timeout=None,
+    retry_failed=False,
+):
+    """Run the unfinished tasks of a ledger in local worker processes.
+
+    Tasks of dead workers on this machine are run again. Other machines sharing the
+    ledger file can call run_ledger or work at the same time.
+
+    Args:
+        ledger_path (str): Location of the ledger database.
+        n_workers (int): Number of worker processes, limited to the number of CPUs.
+            -1 to use all CPUs. (default -1)
+        working_dir (str): Directory for the sambvca files
+            (default None, a temporary directory)
+        cache_dir (str): Directory of a persistent result cache (default None)
+        lease_timeout (float): See JobLedger.claim (default None)
+        retry_failed (bool): Run the failed tasks again (default False)
+
+    Returns:
+        dict: number of tasks per status after the run.
+    """
+    ledger = JobLedger(ledger_path)
+    ledger.recover()
+    if retry_failed:
+        ledger.reset(["failed"])
+
+    n_pending = ledger.counts()["pending"]
+    n_workers = get_n_workers(n_workers, max(n_pending, 1))
+    worker_args = (str(ledger_path), working_dir, cache_dir, lease_timeout)
+    if n_workers == 1:
+        work(*worker_args)
+    else:
+        for _, _, error in iter_jobs(
+            work, [worker_args] * n_workers, executor="processes", n_threads=n_workers
+        ):
+            if error is not None:
+                print(f"A ledger worker failed: {error}", file=sys.stderr)
+    return ledger.counts()
@@ -0,0 +1,138 @@
+"""
+Server-side decimation of grids and curves for the Dash figures.
+
+The browser only needs about as many points as the plot has pixels, so height
+fields are thinned to a maximum number of points per axis and long curves are
+reduced to the minimum and maximum of every bucket, which keeps their peaks.
+Zooming in crops the data to the visible range first, so the detail comes back.
+"""
+import math
+
+import numpy as np
+
+
+def axis_indices(axis, axis_range=None, max_points=None):
+    """Indices of a sorted axis covering axis_range with at most about max_points points.
+
+    Args:
+        axis (numpy.ndarray): Sorted coordinates.
+        axis_range (tuple): (lower, upper) visible range, None for the whole axis. (default None)
+        max_points (int): Maximum number of points, None for no limit. (default None)
+
+    Returns:
+        numpy.ndarray: evenly spaced indices. One point beyond the range is kept on
+        both sides and the last point is always included, so lines reach the border.
+    """
+    start, stop = 0, len(axis)
+    if axis_range is not None:
+        lower, upper = sorted(axis_range)
+        start = max(0, int(np.searchsorted(axis, lower, side="left")) - 1)
+        stop = min(len(axis), int(np.searchsorted(axis, upper, side="right")) + 1)
+    step = 1
+    if max_points is not None and stop - start > max_points:
+        step = math.ceil((stop - start - 1) / (max_points - 1))
+    indices = np.arange(start, stop, step)
+    if len(indices) and indices[-1] != stop - 1:
+        indices = np.append(indices, stop - 1)
+    return indices
+
+
+def decimate_grid(x_axis, y_axis, z, max_points, x_range=None, y_range=None):
+    """Crop a height field to the visible ranges and thin it to about max_points per axis.
+
+    Args:
+        x_axis, y_axis (numpy.ndarray): Sorted grid coordinates.
+        z (numpy.ndarray): Heights of shape (len(x_axis), len(y_axis)).
+        max_points (int): Maximum number of points per axis.
+        x_range, y_range (tuple): Visible (lower, upper) ranges, None for the whole axis.
+
+    Returns:
+        tuple: the decimated x axis, y axis and heights as float32.
+    """
+    x_indices = axis_indices(x_axis, x_range, max_points)
+    y_indices = axis_indices(y_axis, y_range, max_points)
+    return (
+        np.asarray(x_axis[x_indices], dtype=np.float32),
+        np.asarray(y_axis[y_indices], dtype=np.float32),
+        np.asarray(z[np.ix_(x_indices, y_indices)], dtype=np.float32),
+    )
+
+
+def minmax_indices(values, n_buckets):
+    """Indices of the minimum and maximum of every bucket of a curve, in their original order.
+
+    Args:
+        values (numpy.ndarray): The y values of the curve.
+        n_buckets (int): Number of consecutive buckets of about equal size.
+
+    Returns:
+        numpy.ndarray: sorted indices, including the first and the last point.
+    """
+    values = np.asarray(values, dtype=float)
+    n_points = len(values)
+    if n_points <= 2 * n_buckets:
+        return np.arange(n_points)
+
+    bucket = np.arange(n_points) * n_buckets // n_points
+    starts = np.searchsorted(bucket, np.arange(n_buckets))
+    # NaN values are never selected unless a bucket has nothing else
+    lowest = np.lexsort((np.where(np.isnan(values), np.inf, values), bucket))
+    highest = np.lexsort((np.where(np.isnan(values), -np.inf, values), bucket))
+    ends = np.append(starts[1:], n_points) - 1
+    indices = np.concatenate([lowest[starts], highest[ends], [0, n_points - 1]])
+    return np.unique(indices)
+
+
+def decimate_curve(x, columns, n_buckets, x_range=None):
+    """Crop a curve to the visible x range and reduce it to the min/max of n_buckets buckets.
+
+    Args:
+        x (numpy.ndarray): Sorted x values.
+        columns (list): Arrays sharing x, the first one selects the kept points.
+        n_buckets (int): Number of buckets, about twice as many points are kept.
+        x_range (tuple): Visible (lower, upper) range, None for the whole curve. (default None)
+
+    Returns:
+        tuple: the decimated x and the decimated columns, all float32.
+    """
+    visible = axis_indices(x, x_range)
+    indices = minmax_indices(np.asarray(columns[0])[visible], n_buckets)
+    indices = indices + visible[0]
+    return np.asarray(x, dtype=np.float32)[indices], [
+        np.asarray(column, dtype=np.float32)[indices] for column in columns
+    ]
+
+
+def relayout_ranges(relayout_data):
+    """Visible axis ranges of a plotly relayout event.
+
+    Args:
+        relayout_data (dict): relayoutData of a dcc.Graph.
+
+    Returns:
+        dict: "x" and "y" mapped to a (lower, upper) range or None for the full axis,
+        or None if the event does not change the axis ranges, e.g. a 3D camera move.
+    """
+    if not relayout_data:
+        return None
+    ranges = {}
+    changed = False
+    for axis in ("x", "y"):
+        key = f"{axis}axis"
+        ranges[axis] = None
+        if f"{key}.range[0]" in relayout_data and f"{key}.range[1]" in relayout_data:
+            ranges[axis] = (
+                float(relayout_data[f"{key}.range[0]"]),
+                float(relayout_data[f"{key}.range[1]"]),
+            )
+            changed = True
+        elif f"{key}.range" in relayout_data:
+            ranges[axis] = tuple(
+                float(value) for value in relayout_data[f"{key}.range"]
+            )
+            changed = True
+        elif f"{key}.autorange" in relayout_data:
+            changed = True
+    if not changed:
+        return None
+    return ranges
@@ -0,0 +1,230 @@
+"""
+Batch screening of many molecules over a set of sphere radii.
+
+The molecules are described in a manifest (csv or json) with the path to the
+.xyz file and the atom ID definitions used by MoleculeScanner.
+Every (molecule, radius) pair is a separate job, the jobs are distributed over a
+process pool and the results are collected in one long-format table.
+"""
+import json
+import os
+import re
+import sys
+from tempfile import mkdtemp
+
+import pandas as pd
+
+from molecule_scanner.execution import get_n_workers, iter_jobs
+from molecule_scanner.result_store import ResultStore
+from molecule_scanner.scanner import MoleculeScanner
+
+ATOM_ID_COLUMNS = [
+    "sphere_center_atom_ids",
+    "z_ax_atom_ids",
+    "xz_plane_atoms_ids",
+    "atoms_to_delete_ids",
+]
+# rows collected before a new partition is written to a result store
+STORE_PARTITION_ROWS = 10000
+
+
+def _parse_atom_ids(value):
+    # csv cells hold the IDs as "1,2,3" or "1 2 3", json files as lists
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, str):
+        value = [item for item in re.split(r"[,;\s]+", value.strip()) if item]
+    elif not isinstance(value, (list, tuple)):
+        value = [value]
+    if len(value) == 0:
+        return None
+    return [int(item) for item in value]
+
+
+def load_manifest(manifest):
+    """Read the molecules to screen.
+
+    Every entry needs the columns xyz_filepath, sphere_center_atom_ids, z_ax_atom_ids
+    and xz_plane_atoms_ids. atoms_to_delete_ids and name are optional.
+    Relative file paths are resolved with respect to the manifest file.
+
+    Args:
+        manifest (str or list): Path to a .csv or .json file or a list of dictionaries.
+
+    Returns:
+        list: one dictionary per molecule with the keyword arguments for MoleculeScanner and its name.
+    """
+    base_dir = os.getcwd()
+    if isinstance(manifest, (str, os.PathLike)):
+        manifest = str(manifest)
+        base_dir = os.path.dirname(os.path.abspath(manifest))
+        if manifest.endswith(".json"):
+            with open(manifest, "r") as file:
+                entries = json.load(file)
+        elif manifest.endswith(".csv"):
+            entries = pd.read_csv(manifest, dtype=str).to_dict("records")
+        else:
+            raise ValueError(
+                f"Unknown manifest format of {manifest}, use a .csv or .json file."
+            )
+    else:
+        entries = list(manifest)
+
+    molecules = []
+    for entry in entries:
+        missing = [
+            key for key in ["xyz_filepath"] + ATOM_ID_COLUMNS[:3] if key not in entry
+        ]
+        if missing:
+            raise ValueError(f"Manifest entry {entry} is missing {', '.join(missing)}.")
+
+        xyz_filepath = os.path.join(base_dir, entry["xyz_filepath"])
+        name = entry.get("name")
+        if name is None or name != name:
+            name = os.path.splitext(os.path.basename(xyz_filepath))[0]
+
+        molecule = {"name": name, "xyz_filepath": xyz_filepath}
+        for key in ATOM_ID_COLUMNS:
+            molecule[key] = _parse_atom_ids(entry.get(key))
+        molecules.append(molecule)
+    return molecules
+
+
+def _to_long_rows(name, r_current, total_results):
+    return [
+        {"molecule": name, "r": r_current, "metric": key, "value": value}
+        for key, value in total_results.items()
+    ]
+
+
+def _run_library_job(scanner, name, r_current, parameters):
+    # module level so that it can be sent to worker processes
+    total_results, _, _ = scanner.run_single(sphere_radius=r_current, **parameters)
+    if total_results is None:
+        return []
+    return _to_long_rows(name, r_current, total_results)
+
+
+def iter_library(
+    manifest,
+    radii,
+    n_workers=-1,
+    working_dir=None,
+    cache_dir=None,
+    backend="sambvca",
+    max_pending=None,
+    **parameters,
+):
+    """Screen all molecules of a manifest and yield the results as the jobs finish.
+
+    Args:
+        manifest (str or list): Path to a .csv or .json manifest or a list of dictionaries, see load_manifest.
+        radii (list): Sphere radii to calculate for every molecule.
+        n_workers (int): Number of worker processes, limited to the number of CPUs. -1 to use all CPUs. (default -1)
+        working_dir (str): Directory shared by all molecules for the sambvca files (default None, a temporary directory)
+        cache_dir (str): Directory of a persistent result cache (default None)
+        backend (str): "sambvca" or "numpy" (default "sambvca")
+        max_pending (int): Maximum number of jobs submitted ahead of the finished ones,
+            the scanners of the molecules are created as their jobs are submitted.
+            (default None, four per worker)
+        parameters: Further arguments for MoleculeScanner.run_single, e.g. mesh_size or radii_table.
+
+    Returns:
+        generator: long-format rows (molecule, r, metric, value) of every finished job.
+
+    Raises:
+        ValueError: if two molecules of the manifest have the same name.
+    """
+    molecules = load_manifest(manifest)
+    names = [molecule["name"] for molecule in molecules]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(
+            f"The manifest contains the molecule names {', '.join(duplicates)} more "
+            "than once, give every molecule a unique name."
+        )
+    if working_dir is None:
+        working_dir = mkdtemp()
+    if max_pending is None:
+        max_pending = 4 * get_n_workers(n_workers, os.cpu_count() or 1)
+    parameters.setdefault("write_surf_files", False)
+
+    def jobs():
+        for molecule in molecules:
+            molecule = dict(molecule)
+            name = molecule.pop("name")
+            scanner = MoleculeScanner(
+                **molecule,
+                working_dir=working_dir,
+                backend=backend,
+                cache_dir=cache_dir,
+            )
+            for r_current in radii:
+                yield scanner, name, float(r_current), parameters
+
+    def results():
+        for (_, name, r_current, _), job_rows, error in iter_jobs(
+            _run_library_job,
+            jobs(),
+            executor="processes",
+            n_threads=n_workers,
+            max_pending=max_pending,
+        ):
+            if error is not None:
+                print(
+                    f"Scan of {name} at r = {r_current} failed: {error}",
+                    file=sys.stderr,
+                )
+            else:
+                yield job_rows
+
+    # the manifest is checked when called, not on the first result
+    return results()
+
+
+def scan_library(manifest, radii, output_file=None, store=None, **kwargs):
+    """Screen all molecules of a manifest over the given radii.
+
+    Args:
+        manifest (str or list): Path to a .csv or .json manifest or a list of dictionaries, see load_manifest.
+        radii (list): Sphere radii to calculate for every molecule.
+        output_file (str): If given, the rows are written to this csv file as soon as a job
+            finishes. An existing file is replaced. (default None)
+        store (str or ResultStore): If given, the rows are appended to this result store in
+            partitions of 10000 rows and once more when the screen is finished. (default None)
+        kwargs: Further arguments for iter_library.
+
+    Returns:
+        pandas.DataFrame: long-format table with the columns molecule, r, metric and value.
+    """
+    if store is not None and not isinstance(store, ResultStore):
+        store = ResultStore(store)
+
+    results = iter_library(manifest, radii, **kwargs)
+    # rows of an earlier screen must not mix with the new ones
+    if output_file is not None and os.path.exists(output_file):
+        os.remove(output_file)
+
+    rows = []
+    unstored_rows = []
+    for job_rows in results:
+        if output_file is not None and job_rows:
+            pd.DataFrame(job_rows).to_csv(
+                output_file,
+                mode="a",
+                index=False,
+                header=not os.path.exists(output_file),
+            )
+        if store is not None:
+            unstored_rows.extend(job_rows)
+            if len(unstored_rows) >= STORE_PARTITION_ROWS:
+                store.append_scan(pd.DataFrame(unstored_rows))
+                unstored_rows = []
+        rows.extend(job_rows)
+    if store is not None and unstored_rows:
+        store.append_scan(pd.DataFrame(unstored_rows))
+
+    df_results = pd.DataFrame(rows, columns=["molecule", "r", "metric", "value"])
+    return df_results.sort_values(by=["molecule", "r"], kind="stable").reset_index(
+        drop=True
+    )
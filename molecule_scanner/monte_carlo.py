@@ -0,0 +1,227 @@
+"""
+Monte Carlo estimate of the buried volume for quick previews.
+
+Points are sampled uniformly inside the sphere, either pseudo-randomly or from
+scrambled Sobol sequences, and tested against the atom spheres with the cell list
+of molecule_scanner.spatial_index. The points are drawn in independent batches,
+the spread of the batch estimates gives the standard errors, so sampling can stop
+after any batch once a sample or time budget is used up.
+"""
+import math
+import time
+
+import numpy as np
+
+from molecule_scanner.buried_volume import OCTANT_NAMES, QUADRANT_NAMES, _QUADRANT_SIDES
+
+SAMPLINGS = ("random", "sobol")
+DEFAULT_SAMPLES = 65536
+DEFAULT_BATCH_SIZE = 1024
+# total results with a standard error in the rows of a range estimate
+ERROR_METRICS = [
+    "free_volume",
+    "buried_volume",
+    "percent_buried_volume",
+    "percent_free_volume",
+]
+# batches needed for a reliable standard error
+_MIN_BATCHES = 8
+
+
+def _load_qmc():
+    # scipy.stats takes most of a second to import, so it is only loaded for Sobol sampling
+    try:
+        from scipy.stats import qmc
+    except ImportError:  # Sobol sampling is optional
+        return None
+    return qmc
+
+
+def check_sampling(sampling):
+    if sampling not in SAMPLINGS:
+        raise ValueError(
+            f"Unknown sampling '{sampling}', choose one of {', '.join(SAMPLINGS)}."
+        )
+    if sampling == "sobol" and _load_qmc() is None:
+        raise ImportError("Sobol sampling requires scipy, please install it.")
+
+
+def unit_ball_points(uniform):
+    """Map points of the unit cube to uniformly distributed points in the unit ball.
+
+    The mapping preserves the low discrepancy of quasi-random points, unlike rejection sampling.
+
+    Args:
+        uniform (numpy.ndarray): (n_points, 3) values in [0, 1).
+
+    Returns:
+        numpy.ndarray: (n_points, 3) points inside the unit ball.
+    """
+    radius = np.cbrt(uniform[:, 0])
+    cos_theta = 1.0 - 2.0 * uniform[:, 1]
+    sin_theta = np.sqrt(1.0 - cos_theta * cos_theta)
+    phi = 2.0 * np.pi * uniform[:, 2]
+    return radius[:, None] * np.stack(
+        [sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta], axis=1
+    )
+
+
+def _draw_uniform(rng, n_points, sampling):
+    if sampling == "random":
+        return rng.random((n_points, 3))
+    # every batch is an independently scrambled sequence, so the batches stay independent
+    sobol = _load_qmc().Sobol(d=3, scramble=True, seed=rng)
+    return sobol.random_base2(int(math.log2(n_points)))
+
+
+def sample_octant_counts(
+    index,
+    sphere_radius,
+    n_samples=None,
+    time_budget=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    sampling="random",
+    seed=None,
+):
+    """Count sampled and buried points per octant of the sphere in batches.
+
+    Sampling stops when n_samples points are drawn or time_budget seconds have passed,
+    whichever comes first, but not before eight batches are finished.
+
+    Args:
+        index (CellList): Spatial index of the oriented atoms.
+        sphere_radius (float): The radius of the sphere.
+        n_samples (int): Sample budget (default None, 65536 if no time budget is given)
+        time_budget (float): Time budget in seconds (default None)
+        batch_size (int): Points per batch, reduced so that the sample budget gives eight
+            batches and rounded up to a power of two for Sobol sampling. (default 1024)
+        sampling (str): "random" or "sobol" (default "random")
+        seed (int): Seed of the random numbers. The same seed gives the same points
+            scaled to every radius, which keeps the differences between radii smooth. (default None)
+
+    Returns:
+        tuple: buried and total point counts, each of shape (n_batches, 2, 2, 2)
+        split into (x side, y side, z side), 0 = negative, 1 = positive.
+    """
+    check_sampling(sampling)
+    if n_samples is None and time_budget is None:
+        n_samples = DEFAULT_SAMPLES
+    if n_samples is not None:
+        batch_size = max(1, min(batch_size, n_samples // _MIN_BATCHES))
+    if sampling == "sobol":
+        batch_size = 2 ** math.ceil(math.log2(batch_size))
+    rng = np.random.default_rng(seed)
+
+    buried_counts = []
+    point_counts = []
+    start = time.perf_counter()
+    while True:
+        points = sphere_radius * unit_ball_points(
+            _draw_uniform(rng, batch_size, sampling)
+        )
+        buried = index.inside_any(points)
+        octant = (points > 0).astype(int)
+        flat = octant[:, 0] * 4 + octant[:, 1] * 2 + octant[:, 2]
+        point_counts.append(np.bincount(flat, minlength=8).reshape(2, 2, 2))
+        buried_counts.append(np.bincount(flat[buried], minlength=8).reshape(2, 2, 2))
+
+        n_batches = len(point_counts)
+        if n_batches < _MIN_BATCHES:
+            continue
+        if n_samples is not None and n_batches * batch_size >= n_samples:
+            break
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            break
+    return np.array(buried_counts), np.array(point_counts)
+
+
+def _ratio_estimate(numerator, denominator):
+    """Ratio of the summed batch values and its batch standard error."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    n_batches = len(numerator)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = numerator.sum() / denominator.sum()
+        residuals = numerator - ratio * denominator
+        error = (
+            np.sqrt((residuals * residuals).sum() / (n_batches * (n_batches - 1)))
+            / denominator.mean()
+        )
+    return float(ratio), float(error)
+
+
+def format_monte_carlo_results(buried_counts, point_counts, sphere_radius):
+    """Build the result dictionaries of run_single and their standard errors from the point counts.
+
+    Args:
+        buried_counts, point_counts (numpy.ndarray): Counts of sample_octant_counts.
+        sphere_radius (float): The radius of the sphere.
+
+    Returns:
+        tuple: the total, quadrant and octant results in the layout of
+        buried_volume.format_results and the standard errors in the same layout.
+    """
+    exact_volume = 4.0 / 3.0 * np.pi * sphere_radius**3
+    batch_points = point_counts.sum(axis=(1, 2, 3))
+
+    def estimate(buried, points):
+        # buried, free and total volume are shares of all points, the percentages of the region
+        buried_share = _ratio_estimate(buried, batch_points)
+        free_share = _ratio_estimate(points - buried, batch_points)
+        total_share = _ratio_estimate(points, batch_points)
+        percent_buried = _ratio_estimate(buried, points)
+        return {
+            "free_volume": [exact_volume * value for value in free_share],
+            "buried_volume": [exact_volume * value for value in buried_share],
+            "total_volume": [exact_volume * value for value in total_share],
+            "percent_buried_volume": [100.0 * value for value in percent_buried],
+            "percent_free_volume": [
+                100.0 * (1.0 - percent_buried[0]),
+                100.0 * percent_buried[1],
+            ],
+        }
+
+    total = estimate(buried_counts.sum(axis=(1, 2, 3)), batch_points)
+    total["exact_volume"] = [exact_volume, 0.0]
+    total["percent_total_volume"] = [100.0, 0.0]
+    total_keys = [
+        "free_volume",
+        "buried_volume",
+        "total_volume",
+        "exact_volume",
+        "percent_buried_volume",
+        "percent_free_volume",
+        "percent_total_volume",
+    ]
+    results = [{key: total[key][0] for key in total_keys}]
+    errors = [{key: total[key][1] for key in total_keys}]
+
+    quadrants = [
+        (name, (slice(None), x, y))
+        for name, (x, y) in zip(QUADRANT_NAMES, _QUADRANT_SIDES)
+    ]
+    octants = [
+        (name, (slice(None), x, y, z))
+        for z in (0, 1)
+        for name, (x, y) in zip(OCTANT_NAMES[4 * z : 4 * z + 4], _QUADRANT_SIDES)
+    ]
+    region_keys = [
+        "free_volume",
+        "buried_volume",
+        "total_volume",
+        "percent_free_volume",
+        "percent_buried_volume",
+    ]
+    for regions in (quadrants, octants):
+        region_results = {key: {} for key in region_keys}
+        region_errors = {key: {} for key in region_keys}
+        for name, selection in regions:
+            buried = buried_counts[selection].reshape(len(buried_counts), -1).sum(1)
+            points = point_counts[selection].reshape(len(point_counts), -1).sum(1)
+            region = estimate(buried, points)
+            for key in region_keys:
+                region_results[key][name], region_errors[key][name] = region[key]
+        results.append(region_results)
+        errors.append(region_errors)
+
+    return results, errors
@@ -0,0 +1,173 @@
+"""
+Opt-in timing and resource instrumentation of the scanner stages.
+
+Every stage records its wall time, the CPU time of the calling thread, the
+CPU time of finished child processes (the sambvca21 executable) and the peak
+resident memory of the process. The records can be exported as a DataFrame,
+as JSON or in the Chrome trace-event format (chrome://tracing, Perfetto).
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+STAGE_COLUMNS = [
+    "stage",
+    "radius",
+    "start",
+    "wall_time",
+    "cpu_time",
+    "child_cpu_time",
+    "peak_rss_mb",
+    "thread",
+]
+
+
+def _children_cpu_time():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children in MB, None if unknown."""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return peak / scale
+
+
+class StageProfiler:
+    """
+    Collects the timings of the scanner stages, safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._records = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def __getstate__(self):
+        # scanners are sent to worker processes, the stages recorded there stay in the worker
+        return {"_origin": self._origin}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._origin = state["_origin"]
+
+    @contextmanager
+    def stage(self, name, radius=None):
+        """Record the enclosed code as stage name, optionally for a sphere radius."""
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        children_start = _children_cpu_time()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "radius": radius,
+                "start": start - self._origin,
+                "wall_time": time.perf_counter() - start,
+                "cpu_time": time.thread_time() - cpu_start,
+                # shared by all threads of the process, exact for serial runs
+                "child_cpu_time": _children_cpu_time() - children_start,
+                "peak_rss_mb": peak_rss_mb(),
+                "thread": threading.get_ident(),
+            }
+            with self._lock:
+                self._records.append(record)
+
+    def clear(self):
+        """Forget all records, e.g. before a new scan."""
+        with self._lock:
+            self._records = []
+            self._origin = time.perf_counter()
+
+    def records(self):
+        """Copy of the recorded stages as a list of dictionaries."""
+        with self._lock:
+            return list(self._records)
+
+    def to_frame(self):
+        """All records as a DataFrame with one row per stage and radius."""
+        import pandas as pd
+
+        return pd.DataFrame(self.records(), columns=STAGE_COLUMNS)
+
+    def summary(self):
+        """Total, mean and maximum times per stage.
+
+        Returns:
+            pandas.DataFrame: one row per stage, sorted by the total wall time.
+        """
+        df_records = self.to_frame()
+        df_summary = df_records.groupby("stage").agg(
+            calls=("wall_time", "size"),
+            wall_time=("wall_time", "sum"),
+            mean_wall_time=("wall_time", "mean"),
+            max_wall_time=("wall_time", "max"),
+            cpu_time=("cpu_time", "sum"),
+            child_cpu_time=("child_cpu_time", "sum"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+        )
+        return df_summary.sort_values("wall_time", ascending=False).reset_index()
+
+    def to_json(self, filename=None):
+        """Return the records as JSON and write them to filename if given."""
+        text = json.dumps(self.records())
+        if filename is not None:
+            with open(filename, "w") as file:
+                file.write(text)
+        return text
+
+    def to_chrome_trace(self, filename=None):
+        """Return the records in the Chrome trace-event format and write them to filename if given.
+
+        Returns:
+            dict: trace with one complete ("X") event per record.
+        """
+        pid = os.getpid()
+        events = []
+        for record in self.records():
+            args = {
+                key: record[key]
+                for key in ("radius", "cpu_time", "child_cpu_time", "peak_rss_mb")
+            }
+            events.append(
+                {
+                    "name": record["stage"],
+                    "cat": "scanner",
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["wall_time"] * 1e6,
+                    "pid": pid,
+                    "tid": record["thread"],
+                    "args": args,
+                }
+            )
+        trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if filename is not None:
+            with open(filename, "w") as file:
+                json.dump(trace, file)
+        return trace
+
+
+def profile_stage(profiler, name, radius=None):
+    """profiler.stage(name, radius) or a no-op context if profiling is disabled."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, radius)
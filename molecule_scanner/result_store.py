@@ -0,0 +1,209 @@
+"""
+Columnar on-disk store for scan and cavity results.
+
+Scan tables are written as Parquet or Arrow IPC files and steric map grids as
+compressed .npz files. Every write adds a new partition file and existing files
+are never changed, so long library screens can append results while they run.
+Readers only load the requested columns, Arrow IPC partitions are memory-mapped
+and the arrays of a grid partition are only decompressed when they are accessed.
+"""
+import glob
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the scan tables
+    pa = None
+
+TABLE_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+CAVITY_KEYS = ["x_axis", "y_axis", "z_top", "z_bottom"]
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError("Storing scan tables requires pyarrow, please install it.")
+
+
+def _partition_name():
+    # sorting the names gives the order of the writes
+    return f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+class ResultStore:
+    """
+    Append-only directory of scan and cavity result partitions.
+    """
+
+    def __init__(self, root, table_format="parquet"):
+        """
+        Args:
+        root (str): Directory of the store, e.g. next to the output_save_path of the app.
+        table_format (str): "parquet" or "arrow" (Arrow IPC) for new scan partitions,
+            both are read. (default "parquet")
+        """
+        if table_format not in TABLE_FORMATS:
+            raise ValueError(
+                f"Unknown table format '{table_format}', choose one of {', '.join(TABLE_FORMATS)}."
+            )
+        self.root = str(root)
+        self.table_format = table_format
+        self.scan_dir = os.path.join(self.root, "scans")
+        self.cavity_dir = os.path.join(self.root, "cavities")
+        os.makedirs(self.scan_dir, exist_ok=True)
+        os.makedirs(self.cavity_dir, exist_ok=True)
+
+    def _write(self, directory, extension, write):
+        # write to a temporary name first, so readers never see a partial partition
+        name = _partition_name()
+        path = os.path.join(directory, name + extension)
+        temporary_path = os.path.join(directory, f".{name}.tmp")
+        try:
+            write(temporary_path)
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return name
+
+    def append_scan(self, df_scan, **labels):
+        """Write a scan table as a new partition.
+
+        Args:
+            df_scan (pandas.DataFrame): Results, e.g. of MoleculeScanner.run_range or scan_library.
+            labels: Constant columns added to every row, e.g. molecule="mad25_p".
+
+        Returns:
+            str: name of the new partition.
+        """
+        _check_pyarrow()
+        table = pa.Table.from_pandas(df_scan, preserve_index=False)
+        for key, value in labels.items():
+            table = table.append_column(key, pa.array([value] * len(table)))
+
+        if self.table_format == "parquet":
+
+            def write(path):
+                pq.write_table(table, path)
+
+        else:
+
+            def write(path):
+                # uncompressed, so that readers can memory-map the columns
+                with pa.OSFile(path, "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+
+        return self._write(self.scan_dir, TABLE_FORMATS[self.table_format], write)
+
+    def scan_partitions(self):
+        """Paths of all scan partitions in the order they were written."""
+        paths = []
+        for extension in TABLE_FORMATS.values():
+            paths.extend(glob.glob(os.path.join(self.scan_dir, "part-*" + extension)))
+        return sorted(paths, key=os.path.basename)
+
+    def iter_scans(self, columns=None, **labels):
+        """Yield the scan partitions one at a time as pyarrow Tables.
+
+        Args:
+            columns (list): Columns to read, the other columns are not loaded. (default None, all)
+            labels: Only keep the rows with these column values, e.g. molecule="mad25_p".
+
+        Yields:
+            pyarrow.Table: the selected rows and columns of one partition.
+        """
+        _check_pyarrow()
+        for path in self.scan_partitions():
+            if path.endswith(TABLE_FORMATS["parquet"]):
+                names = pq.read_schema(path).names
+            else:
+                # the record batches point into the memory map, nothing is copied and
+                # the mapping stays alive with the table after the file is closed
+                with pa.memory_map(path, "r") as source:
+                    with pa.ipc.open_file(source) as reader:
+                        mapped_table = reader.read_all()
+                names = mapped_table.schema.names
+            if any(key not in names for key in labels):
+                continue
+            selected = names if columns is None else [c for c in columns if c in names]
+            needed = list(dict.fromkeys(selected + list(labels)))
+
+            if path.endswith(TABLE_FORMATS["parquet"]):
+                table = pq.read_table(path, columns=needed, memory_map=True)
+            else:
+                table = mapped_table.select(needed)
+            for key, value in labels.items():
+                table = table.filter(pc.equal(table[key], value))
+            yield table.select(selected)
+
+    def read_scans(self, columns=None, **labels):
+        """Read the scan partitions into one table.
+
+        Args:
+            columns (list): Columns to read (default None, all)
+            labels: Only keep the rows with these column values.
+
+        Returns:
+            pandas.DataFrame: the selected rows of all partitions, missing columns are NaN.
+        """
+        tables = list(self.iter_scans(columns, **labels))
+        if not tables:
+            return pd.DataFrame(columns=columns)
+        table = pa.concat_tables(tables, promote_options="default")
+        if columns is not None:
+            table = table.select([c for c in columns if c in table.column_names])
+        return table.to_pandas()
+
+    def append_cavity(self, cavity_map, **labels):
+        """Write a steric map as a new compressed partition.
+
+        Args:
+            cavity_map (tuple): x axis, y axis, top and bottom heights of MoleculeScanner.steric_map.
+            labels: JSON serializable metadata, e.g. molecule="mad25_p", sphere_radius=3.5.
+
+        Returns:
+            str: name of the new partition.
+        """
+        arrays = dict(zip(CAVITY_KEYS, cavity_map))
+
+        def write(path):
+            with open(path, "wb") as file:
+                np.savez_compressed(file, labels=json.dumps(labels), **arrays)
+
+        return self._write(self.cavity_dir, ".npz", write)
+
+    def cavity_partitions(self):
+        """Names and labels of all cavity partitions in the order they were written.
+
+        Returns:
+            list: (name, labels) tuples, only the labels are decompressed.
+        """
+        partitions = []
+        paths = glob.glob(os.path.join(self.cavity_dir, "part-*.npz"))
+        for path in sorted(paths, key=os.path.basename):
+            with np.load(path) as data:
+                labels = json.loads(str(data["labels"]))
+            partitions.append((os.path.basename(path)[: -len(".npz")], labels))
+        return partitions
+
+    def load_cavity(self, name, keys=None):
+        """Read the arrays of a cavity partition.
+
+        Args:
+            name (str): Partition name of append_cavity or cavity_partitions.
+            keys (list): Arrays to read, the others are not decompressed. (default None, all)
+
+        Returns:
+            tuple: the arrays in the order of keys, by default x axis, y axis, top and bottom heights.
+        """
+        keys = CAVITY_KEYS if keys is None else keys
+        with np.load(os.path.join(self.cavity_dir, name + ".npz")) as data:
+            return tuple(data[key] for key in keys)
@@ -1,13 +1,18 @@
 from molecule_scanner.paths import load_executable, locate_file
+from molecule_scanner import buried_volume, monte_carlo
+from molecule_scanner.cache import ResultCache, file_digest, make_key
+from molecule_scanner.execution import check_executor, get_n_workers, iter_jobs
+from molecule_scanner.profiling import StageProfiler, profile_stage
+from molecule_scanner.spatial_index import CellList
 import os
+import sys
+import time
 from tempfile import mkdtemp
 import numpy as np
-import pandas as pd
-from collections import defaultdict
 from py2sambvca import p2s
-from joblib import Parallel, delayed
-from dash import dcc, html, Input, Output, Dash
-import plotly.graph_objects as go
+
+# part of the cache keys, changed when the layout of the cached results changes
+RESULTS_LAYOUT = 2
 
 """
 displacement (float): Displacement of oriented molecule from sphere center in Angstrom (default 0.0)
@@ -18,6 +23,137 @@ displacement (float): Displacement of oriented molecule from sphere center in An
         """
 
 
+def adaptive_interval_errors(points):
+    """Estimate the linear interpolation error on every interval of a sampled curve.
+
+    The error at an interior point is its distance from the straight line through its
+    neighbours, an interval gets the larger error of its two end points.
+
+    Args:
+        points (list): (r, value) pairs sorted by r.
+
+    Returns:
+        numpy.ndarray: one error estimate per interval, len(points) - 1 values.
+    """
+    if len(points) < 2:
+        return np.zeros(0)
+    r, value = np.asarray(points, dtype=float).T
+    point_errors = np.zeros(len(r))
+    if len(r) > 2:
+        weight = (r[1:-1] - r[:-2]) / (r[2:] - r[:-2])
+        predicted = value[:-2] + weight * (value[2:] - value[:-2])
+        point_errors[1:-1] = np.abs(value[1:-1] - predicted)
+    return np.maximum(point_errors[:-1], point_errors[1:])
+
+
+def richardson_extrapolate(coarse_value, fine_value, refinement=2.0, order=2):
+    """Extrapolate two results on meshes refined by a constant factor to zero mesh size.
+
+    Args:
+        coarse_value (float): Result on the coarser mesh.
+        fine_value (float): Result on the mesh refined by the given factor.
+        refinement (float): Ratio of the coarse and the fine mesh size. (default 2.0)
+        order (float): Order of the discretization error in the mesh size. (default 2)
+
+    Returns:
+        tuple: the extrapolated value and the estimated error of the fine result.
+    """
+    correction = (fine_value - coarse_value) / (refinement**order - 1.0)
+    return fine_value + correction, abs(correction)
+
+
+def _run_converged_job(scanner, r_current, parameters):
+    # module level so that it can be sent to worker processes
+    convergence = scanner.run_single_converged(r_current, **parameters)
+    if convergence is None:
+        return None
+    metric = convergence["metric"]
+    return {
+        "r": r_current,
+        **convergence["results"][0],
+        f"extrapolated_{metric}": convergence["extrapolated_value"],
+        f"{metric}_error": convergence["error"],
+        "mesh_size": convergence["mesh_size"],
+        "converged": convergence["converged"],
+        "evaluations": len(convergence["history"]),
+    }
+
+
+RESULT_LEVELS = ["total", "quadrant", "octant"]
+RESULT_REGIONS = ["total"] + buried_volume.QUADRANT_NAMES + buried_volume.OCTANT_NAMES
+
+
+def results_to_long_rows(r_current, total_results, quadrant_results, octant_results):
+    """Flatten the three result dictionaries of one radius into (r, level, region, metric, value) rows."""
+    rows = [
+        (r_current, "total", "total", metric, value)
+        for metric, value in total_results.items()
+    ]
+    for level, results, regions in (
+        ("quadrant", quadrant_results, buried_volume.QUADRANT_NAMES),
+        ("octant", octant_results, buried_volume.OCTANT_NAMES),
+    ):
+        for metric, values in results.items():
+            rows.extend(
+                (r_current, level, region, metric, values[region]) for region in regions
+            )
+    return rows
+
+
+def _run_range_job(scanner, r_current, parameters, all_levels=False):
+    # module level so that it can be sent to worker processes
+    with scanner._stage("run_single", r_current):
+        results = scanner.run_single(sphere_radius=r_current, **parameters)
+    return _results_to_row(r_current, results, all_levels)
+
+
+def _select_regions(results, regions):
+    """Copy of region results with only the given regions of every metric."""
+    return {
+        metric: {region: values[region] for region in regions}
+        for metric, values in results.items()
+    }
+
+
+def _results_to_row(r_current, results, all_levels):
+    if results[0] is None:
+        return None
+    if all_levels:
+        return results_to_long_rows(r_current, *results)
+    return {"r": r_current, **results[0]}
+
+
+def rows_to_frame(rows, all_levels=False):
+    """Build the run_range table from the rows of the radii, None without results.
+
+    Args:
+        rows (list): Rows of _run_range_job, None for radii without results.
+        all_levels (bool): The rows are lists of long-format tuples. (default False)
+
+    Returns:
+        pandas.DataFrame: one row per radius, or the long format with all_levels.
+    """
+    # pandas is imported on demand, worker processes only running run_single do not need it
+    import pandas as pd
+
+    rows = [row for row in rows if row is not None]
+    if len(rows) == 0:
+        print("No results could be found.", file=sys.stderr)
+        return None
+    if not all_levels:
+        return pd.DataFrame(rows)
+
+    df_results = pd.DataFrame(
+        [long_row for job_rows in rows for long_row in job_rows],
+        columns=["r", "level", "region", "metric", "value"],
+    )
+    df_results["level"] = pd.Categorical(df_results["level"], RESULT_LEVELS)
+    df_results["region"] = pd.Categorical(df_results["region"], RESULT_REGIONS)
+    df_results["metric"] = df_results["metric"].astype("category")
+    df_results["value"] = df_results["value"].astype(float)
+    return df_results
+
+
 class MoleculeScanner:
     """
     Wrapper for the py2sambvca package
@@ -32,6 +168,9 @@ class MoleculeScanner:
         atoms_to_delete_ids=None,
         working_dir=None,
         verbose=1,
+        backend="sambvca",
+        cache_dir=None,
+        profile=False,
     ):
         """j
         This class serves as an intermediate between the py2sambvca package and the user.
@@ -46,6 +185,18 @@ class MoleculeScanner:
         atoms_to_delete_ids (list): ID of atoms to be deleted (default None)
 
         verbose (int): 0 for no output, 1 for some output, 2 for the most output
+        backend (str): "sambvca" to call the sambvca21 executable or "numpy" to calculate
+            the buried volume in-process (default "sambvca"). Both return the quadrant
+            and octant results as separate dictionaries of 4 and 8 regions and agree
+            within the 0.1 rounding. sambvca21 output is only accepted if every total
+            volume has two to four integer digits, so spheres with a volume below
+            10 Angs^3, e.g. r = 2.0 on a crowded center, give no results with sambvca
+            while numpy reports them.
+        cache_dir (str): Directory of a persistent result cache. Results are reused for
+            the same molecule, atom IDs and run parameters. None disables the cache (default None)
+        profile (bool): Record wall time, CPU time and peak memory of every stage in
+            self.profiler, see molecule_scanner.profiling. Stages running in worker
+            processes are not recorded. (default False)
         """
         self.xyz_filepath = locate_file(xyz_filepath)
         if atoms_to_delete_ids is not None:
@@ -63,11 +214,32 @@ class MoleculeScanner:
         self.n_xz_plane_atoms = len(xz_plane_atoms_ids)
         self.sambvca21_path = load_executable()
 
+        if backend not in ("sambvca", "numpy"):
+            raise ValueError(
+                f"Unknown backend '{backend}', choose either 'sambvca' or 'numpy'."
+            )
+        self.backend = backend
+        self.elements, self.coords = buried_volume.read_xyz(self.xyz_filepath)
+        self.xyz_digest = file_digest(self.xyz_filepath)
+
+        if cache_dir is not None:
+            self.cache = ResultCache(cache_dir)
+        else:
+            self.cache = None
+
         if working_dir is None:
             self.working_dir = mkdtemp()
         else:
             self.working_dir = working_dir
 
+        self.profiler = StageProfiler() if profile else None
+        # spatial index per orientation and atom selection, see _oriented_atoms
+        self._atom_indices = {}
+
+    def _stage(self, name, radius=None):
+        """Context manager recording a stage if profiling is enabled."""
+        return profile_stage(self.profiler, name, radius)
+
     def run_single(
         self,
         sphere_radius,
@@ -92,34 +264,99 @@ class MoleculeScanner:
         orient_z (bool): True/False Molecule oriented along negative/positive Z-axis (default True)
 
         write_surf_files (bool): True/False Do not write/write files for top and bottom surfaces (default True)
-        return_surface_files (bool): only for internal use. Parses .dat files to generate cavity function.
+        return_surface_files (bool): only for internal use. Returns the .dat surface files and the key of their
+            persisted arrays to generate the cavity function.
 
         Returns:
             list: a list of the three dictionaries for the total result, quadrant results and octant results.
         """
-        dir_name = str(
-            os.path.join(
-                self.working_dir,
-                str(
-                    abs(
-                        hash(
-                            (
-                                sphere_radius,
-                                displacement,
-                                mesh_size,
-                                remove_H,
-                                orient_z,
-                                write_surf_files,
-                                radii_table,
-                            )
-                        )
-                    )
-                ),
+        cache_key = self._cache_key(
+            method=self.backend,
+            sphere_radius=sphere_radius,
+            displacement=displacement,
+            mesh_size=mesh_size,
+            remove_H=remove_H,
+            orient_z=orient_z,
+            radii_table=radii_table,
+        )
+        use_cache = self.cache is not None and not return_surface_files
+        if use_cache:
+            with self._stage("cache_lookup", sphere_radius):
+                cached_results = self.cache.get(cache_key)
+            if cached_results is not None:
+                return tuple(cached_results)
+
+        # sambvca21 only accepts paths with up to 100 characters
+        dir_name = os.path.join(self.working_dir, cache_key[:16])
+        if return_surface_files:
+            # persisted arrays are named after the full key, so they match these parameters
+            surface_files = (
+                os.path.join(dir_name, buried_volume.TOP_SURFACE_FILE),
+                os.path.join(dir_name, buried_volume.BOTTOM_SURFACE_FILE),
+            )
+            if all(
+                os.path.exists(buried_volume.surface_array_path(filename, cache_key))
+                for filename in surface_files
+            ):
+                return surface_files + (cache_key,)
+
+        if self.backend == "numpy":
+            results = self._run_single_numpy(
+                dir_name,
+                sphere_radius,
+                displacement,
+                mesh_size,
+                remove_H,
+                orient_z,
+                write_surf_files,
+                return_surface_files,
+                radii_table,
+            )
+        else:
+            results = self._run_single_sambvca(
+                dir_name,
+                sphere_radius,
+                displacement,
+                mesh_size,
+                remove_H,
+                orient_z,
+                write_surf_files,
+                return_surface_files,
+                radii_table,
             )
+
+        if return_surface_files:
+            return tuple(results) + (cache_key,)
+        if use_cache:
+            with self._stage("cache_store", sphere_radius):
+                self.cache.set(cache_key, list(results))
+        return results
+
+    def _cache_key(self, **parameters):
+        """Digest of the molecule, the atom IDs and the given run parameters."""
+        return make_key(
+            xyz=self.xyz_digest,
+            sphere_center_atom_ids=self.sphere_center_atom_ids,
+            z_ax_atom_ids=self.z_ax_atom_ids,
+            xz_plane_atoms_ids=self.xz_plane_atoms_ids,
+            atoms_to_delete_ids=self.atoms_to_delete_ids,
+            layout=RESULTS_LAYOUT,
+            **parameters,
         )
-        if not os.path.isdir:
-            os.mkdir(dir_name)
 
+    def _run_single_sambvca(
+        self,
+        dir_name,
+        sphere_radius,
+        displacement,
+        mesh_size,
+        remove_H,
+        orient_z,
+        write_surf_files,
+        return_surface_files,
+        radii_table,
+    ):
+        """Same as run_single but calculated with the sambvca21 executable."""
         nhc_p2s = p2s(
             xyz_filepath=self.xyz_filepath,
             sphere_center_atom_ids=self.sphere_center_atom_ids,
@@ -136,24 +373,104 @@ class MoleculeScanner:
             path_to_sambvcax=self.sambvca21_path,
             working_dir=dir_name,
         )
-        nhc_p2s.write_input()
-        nhc_p2s.calc()
-        test_m = nhc_p2s.get_regex(
-            r"^[ ]{5,6}(\d*\.\d*)[ ]{5,6}(\d*\.\d*)[ ]{5,6}(\d*\.\d*)[ ]{5,6}(\d*\.\d*)$"
+        with self._stage("write_input", sphere_radius):
+            nhc_p2s.write_input()
+        with self._stage("sambvca21", sphere_radius):
+            nhc_p2s.calc()
+        if return_surface_files == True:
+            return os.path.join(dir_name, buried_volume.TOP_SURFACE_FILE), os.path.join(
+                dir_name, buried_volume.BOTTOM_SURFACE_FILE
+            )
+
+        # the check and the parsing are recorded as one stage, each radius counts once
+        with self._stage("parse_output", sphere_radius):
+            test_m = nhc_p2s.get_regex(
+                r"^[ ]{5,6}(\d*\.\d*)[ ]{5,6}(\d*\.\d*)[ ]{5,6}(\d*\.\d*)[ ]{5,6}(\d*\.\d*)$"
+            )
+            if test_m is not None:
+                total_results, region_results, _ = nhc_p2s.parse_output()
+                # py2sambvca returns one dictionary with the regions of both levels
+                return (
+                    total_results,
+                    _select_regions(region_results, buried_volume.QUADRANT_NAMES),
+                    _select_regions(region_results, buried_volume.OCTANT_NAMES),
+                )
+        print(
+            f"No volume could be found for r = {sphere_radius}, skipping output gathering.",
+            file=sys.stderr,
+        )
+        return None, None, None
+
+    def _prepare_atoms(self, displacement, remove_H, orient_z, radii_table):
+        """Orient the molecule and return the coordinates and radii of the atoms used for Vbur."""
+        oriented = buried_volume.orient_coordinates(
+            self.coords,
+            self.sphere_center_atom_ids,
+            self.z_ax_atom_ids,
+            self.xz_plane_atoms_ids,
+            orient_z=orient_z,
+            displacement=displacement,
+        )
+        mask = buried_volume.select_atoms(
+            self.elements, self.atoms_to_delete_ids, remove_H=remove_H
         )
+        radii = buried_volume.get_atom_radii(self.elements[mask], radii_table)
+        return oriented[mask], radii
 
-        if return_surface_files == True:
-            return os.path.join(
-                dir_name, "py2sambvca_input-TopSurface.dat"
-            ), os.path.join(dir_name, "py2sambvca_input-BotSurface.dat")
+    def _oriented_atoms(self, displacement, remove_H, orient_z, radii_table):
+        """Same as _prepare_atoms plus a spatial index of the atoms, built once per orientation."""
+        key = (float(displacement), bool(remove_H), bool(orient_z), radii_table)
+        if key not in self._atom_indices:
+            coords, radii = self._prepare_atoms(*key)
+            self._atom_indices[key] = (coords, radii, CellList(coords, radii))
+        return self._atom_indices[key]
 
-        if test_m is not None:
-            return nhc_p2s.parse_output()
-        else:
+    def _run_single_numpy(
+        self,
+        dir_name,
+        sphere_radius,
+        displacement,
+        mesh_size,
+        remove_H,
+        orient_z,
+        write_surf_files,
+        return_surface_files,
+        radii_table,
+    ):
+        """Same as run_single but calculated in-process with the numpy backend."""
+        with self._stage("prepare_atoms", sphere_radius):
+            coords, radii, index = self._oriented_atoms(
+                displacement, remove_H, orient_z, radii_table
+            )
+
+        write_surfaces = write_surf_files or return_surface_files
+        with self._stage("integrate", sphere_radius):
+            free, buried, exact_volume, *surfaces = buried_volume.integrate_sphere(
+                coords,
+                radii,
+                sphere_radius,
+                mesh_size,
+                return_surfaces=write_surfaces,
+                index=index,
+            )
+
+        if write_surfaces:
+            os.makedirs(dir_name, exist_ok=True)
+            top_file = os.path.join(dir_name, buried_volume.TOP_SURFACE_FILE)
+            bottom_file = os.path.join(dir_name, buried_volume.BOTTOM_SURFACE_FILE)
+            with self._stage("write_surfaces", sphere_radius):
+                buried_volume.write_surface_files(surfaces[0], top_file, bottom_file)
+            if return_surface_files == True:
+                return top_file, bottom_file
+
+        if free.sum() + buried.sum() == 0:
             print(
-                f"No volume could be found for r = {sphere_radius}, skipping output gathering."
+                f"No volume could be found for r = {sphere_radius}, skipping output gathering.",
+                file=sys.stderr,
             )
             return None, None, None
+        with self._stage("format_results", sphere_radius):
+            return buried_volume.format_results(free, buried, exact_volume)
 
     def run_range(
         self,
@@ -167,6 +484,9 @@ class MoleculeScanner:
         write_surf_files=True,
         n_threads=-1,
         radii_table="default",
+        sweep=False,
+        executor="threads",
+        all_levels=False,
     ):
         """
         This function is designed to scan a range of sphere_radii.
@@ -186,46 +506,574 @@ class MoleculeScanner:
 
             write_surf_files (bool): True/False Do not write/write files for top and bottom surfaces (default True)
 
-            n_threads (int): Sets the number of parallel threads used for calculation. -1 for unlimited. (default -1)
+            n_threads (int): Sets the number of parallel workers used for calculation.
+                Limited to the number of CPUs, -1 to use all CPUs. (default -1)
+
+            sweep (bool): Calculate all radii from a single voxel pass over the largest sphere
+                with the numpy engine instead of one calculation per radius. (default False)
+
+            executor (str): Run the radii in "threads", "processes" or "serial". (default "threads")
+
+            all_levels (bool): Also keep the quadrant and octant results. The DataFrame then has
+                one row per radius, level, region and metric with the columns
+                r, level, region, metric and value. (default False)
         Returns:
             pandas.DataFrame: A DateFrame object for easy access to the results.
         """
+        if sweep:
+            return self._run_range_sweep(
+                np.linspace(r_min, r_max, nsteps),
+                displacement,
+                mesh_size,
+                remove_H,
+                orient_z,
+                radii_table,
+                all_levels,
+            )
 
-        def _run_job(r_current):
-            total_results, quadrant_results, octant_results = self.run_single(
-                sphere_radius=r_current,
+        check_executor(executor)
+
+        sphere_radii = np.linspace(r_min, r_max, nsteps)
+        parameters = dict(
+            displacement=displacement,
+            mesh_size=mesh_size,
+            remove_H=remove_H,
+            orient_z=orient_z,
+            write_surf_files=write_surf_files,
+            radii_table=radii_table,
+        )
+
+        rows = self._run_jobs(sphere_radii, parameters, executor, n_threads, all_levels)
+        with self._stage("assemble_frame"):
+            return rows_to_frame(rows, all_levels)
+
+    def _run_jobs(
+        self, sphere_radii, parameters, executor, n_threads, all_levels=False
+    ):
+        """Run run_single for all radii and return one row (or None) per radius."""
+        n_workers = get_n_workers(n_threads, len(sphere_radii))
+        if executor == "serial" or n_workers == 1:
+            return [
+                _run_range_job(self, r, parameters, all_levels) for r in sphere_radii
+            ]
+        from joblib import Parallel, delayed
+
+        # every job returns its own row, joblib keeps them in radius order
+        return Parallel(
+            n_jobs=n_workers,
+            backend="threading" if executor == "threads" else "loky",
+        )(
+            delayed(_run_range_job)(self, r, parameters, all_levels)
+            for r in sphere_radii
+        )
+
+    def iter_range(
+        self,
+        r_min,
+        r_max,
+        nsteps=50,
+        displacement=0.0,
+        mesh_size=0.10,
+        remove_H=True,
+        orient_z=True,
+        write_surf_files=True,
+        n_threads=-1,
+        radii_table="default",
+        executor="threads",
+        all_levels=False,
+        ordered=False,
+        include_missing=False,
+        cancelled=None,
+    ):
+        """
+        Same as run_range, but the rows are yielded as soon as a radius has been calculated.
+        The remaining radii keep running in the background, closing the generator
+        cancels the radii which have not been started yet.
+        A failing radius is reported and skipped instead of stopping the scan.
+        Args:
+            ordered (bool): Yield the rows in order of the radius instead of the order of completion. (default False)
+            include_missing (bool): Yield None for radii without a result, e.g. to count the progress. (default False)
+            cancelled (callable): Checked before every radius is started, no further
+                radii are started once it returns True. (default None)
+            The remaining arguments are the same as for run_range.
+        Yields:
+            dict: the row of one radius as in run_range. With all_levels a list of
+            (r, level, region, metric, value) tuples.
+        """
+        parameters = dict(
+            displacement=displacement,
+            mesh_size=mesh_size,
+            remove_H=remove_H,
+            orient_z=orient_z,
+            write_surf_files=write_surf_files,
+            radii_table=radii_table,
+        )
+        jobs = [
+            (self, r_current, parameters, all_levels)
+            for r_current in np.linspace(r_min, r_max, nsteps)
+        ]
+        for job, row, error in iter_jobs(
+            _run_range_job, jobs, executor, n_threads, ordered, cancelled=cancelled
+        ):
+            if error is not None:
+                print(f"Calculation for r = {job[1]} failed: {error}", file=sys.stderr)
+            if row is not None or include_missing:
+                yield row
+
+    def run_range_adaptive(
+        self,
+        r_min,
+        r_max,
+        max_evaluations=50,
+        n_initial=9,
+        tolerance=0.5,
+        metric="percent_buried_volume",
+        displacement=0.0,
+        mesh_size=0.10,
+        remove_H=True,
+        orient_z=True,
+        write_surf_files=True,
+        n_threads=-1,
+        radii_table="default",
+        executor="threads",
+    ):
+        """
+        Scan a range of sphere radii with adaptive refinement.
+        The scan starts on a coarse grid and only bisects the intervals where the curve
+        of the chosen metric deviates from a straight line by more than the tolerance.
+        Args:
+            r_min (number): minimum radius
+            r_max (number): maximum radius
+            max_evaluations (int): Maximum number of calculated radii. (default 50)
+            n_initial (int): Number of radii of the initial grid. (default 9)
+            tolerance (float): Accepted deviation from linear interpolation in units of the metric. (default 0.5)
+            metric (str): Result column used to estimate the interpolation error. (default "percent_buried_volume")
+            The remaining arguments are the same as for run_range.
+        Returns:
+            pandas.DataFrame: A DateFrame object with the same columns as returned by run_range.
+        """
+        check_executor(executor)
+        parameters = dict(
+            displacement=displacement,
+            mesh_size=mesh_size,
+            remove_H=remove_H,
+            orient_z=orient_z,
+            write_surf_files=write_surf_files,
+            radii_table=radii_table,
+        )
+        # intervals below this width are not split any further
+        min_width = mesh_size / 10
+
+        radii = list(np.linspace(r_min, r_max, min(n_initial, max_evaluations)))
+        all_rows = self._run_jobs(radii, parameters, executor, n_threads)
+        n_evaluations = len(radii)
+
+        while n_evaluations < max_evaluations:
+            points = sorted(
+                (row["r"], row[metric]) for row in all_rows if row is not None
+            )
+            errors = adaptive_interval_errors(points)
+            candidates = sorted(
+                (
+                    (error, (points[i][0] + points[i + 1][0]) / 2)
+                    for i, error in enumerate(errors)
+                    if error > tolerance and points[i + 1][0] - points[i][0] > min_width
+                ),
+                reverse=True,
+            )
+            new_radii = [
+                r_current
+                for _, r_current in candidates[: max_evaluations - n_evaluations]
+            ]
+            if len(new_radii) == 0:
+                break
+            all_rows.extend(self._run_jobs(new_radii, parameters, executor, n_threads))
+            n_evaluations += len(new_radii)
+
+        df_results = rows_to_frame(all_rows)
+        if df_results is None:
+            return None
+        return df_results.sort_values(by=["r"]).reset_index(drop=True)
+
+    def run_single_converged(
+        self,
+        sphere_radius,
+        tolerance=0.1,
+        initial_mesh_size=0.2,
+        min_mesh_size=0.025,
+        refinement=2.0,
+        order=2,
+        metric="percent_buried_volume",
+        displacement=0.0,
+        remove_H=True,
+        orient_z=True,
+        radii_table="default",
+    ):
+        """
+        Calculate a single radius on progressively finer meshes until the metric converges.
+        The mesh size is divided by the refinement factor until the metric changes by less
+        than the tolerance between two meshes, or the minimum mesh size is reached.
+        The numpy backend compares the unrounded metric and combines the last two meshes by
+        Richardson extrapolation. sambvca21 only reports one decimal, so its values are
+        quantized to 0.1: a change up to the tolerance counts as converged, a tolerance
+        below 0.1 needs equal values, and the value of the finest mesh is reported with the
+        last change as its error instead of an extrapolation.
+        Args:
+            sphere_radius (float): The radius of the sphere.
+            tolerance (float): Accepted change of the metric between two meshes. (default 0.1)
+            initial_mesh_size (float): Coarsest mesh size. (default 0.2)
+            min_mesh_size (float): The mesh is not refined below this size. (default 0.025)
+            refinement (float): Factor between two successive mesh sizes. (default 2.0)
+            order (float): Assumed order of the mesh error for the extrapolation. (default 2)
+            metric (str): Key of the total results to converge. (default "percent_buried_volume")
+            The remaining arguments are the same as for run_single.
+        Returns:
+            dict: the metric, the value on the finest mesh, the extrapolated value, the estimated
+            error, the finest mesh size, whether the tolerance was met, the (mesh_size, value)
+            history and the three result dictionaries of the finest mesh.
+            None if no volume could be found.
+        """
+        if refinement <= 1:
+            raise ValueError("The refinement factor has to be larger than 1.")
+
+        mesh_size = initial_mesh_size
+        history = []
+        converged = False
+        extrapolated_value, error = None, None
+        while True:
+            results, value = self._converged_step(
+                sphere_radius,
+                mesh_size,
+                metric,
+                displacement,
+                remove_H,
+                orient_z,
+                radii_table,
+            )
+            if results[0] is None:
+                return None
+            history.append((mesh_size, value))
+
+            if len(history) > 1:
+                change = abs(history[-1][1] - history[-2][1])
+                if self.backend == "numpy":
+                    extrapolated_value, error = richardson_extrapolate(
+                        history[-2][1], history[-1][1], refinement, order
+                    )
+                    converged = change < tolerance
+                else:
+                    extrapolated_value, error = history[-1][1], change
+                    # margin for the binary representation of the one decimal values
+                    converged = change <= tolerance + 1e-9
+                if converged:
+                    break
+            # small margin for the rounding of repeated divisions
+            if mesh_size / refinement < min_mesh_size * (1 - 1e-9):
+                break
+            mesh_size = mesh_size / refinement
+
+        return {
+            "metric": metric,
+            "value": history[-1][1],
+            "extrapolated_value": extrapolated_value,
+            "error": error,
+            "mesh_size": mesh_size,
+            "converged": converged,
+            "history": history,
+            "results": results,
+        }
+
+    def _converged_step(
+        self,
+        sphere_radius,
+        mesh_size,
+        metric,
+        displacement,
+        remove_H,
+        orient_z,
+        radii_table,
+    ):
+        """Results of one mesh of run_single_converged and the metric to compare.
+
+        The numpy backend returns the unrounded metric of the integration, sambvca21
+        the rounded value of its output.
+        """
+        if self.backend != "numpy":
+            results = self.run_single(
+                sphere_radius,
                 displacement=displacement,
                 mesh_size=mesh_size,
                 remove_H=remove_H,
                 orient_z=orient_z,
-                write_surf_files=write_surf_files,
+                write_surf_files=False,
                 radii_table=radii_table,
             )
+            return results, None if results[0] is None else results[0][metric]
 
-            if total_results is not None:
-                dict_total_results["r"].append(r_current)
-                [
-                    dict_total_results[key].append(value)
-                    for key, value in total_results.items()
-                ]
+        with self._stage("prepare_atoms", sphere_radius):
+            coords, radii, index = self._oriented_atoms(
+                displacement, remove_H, orient_z, radii_table
+            )
+        with self._stage("integrate", sphere_radius):
+            free, buried, exact_volume = buried_volume.integrate_sphere(
+                coords, radii, sphere_radius, mesh_size, index=index
+            )
+        if free.sum() + buried.sum() == 0:
+            print(
+                f"No volume could be found for r = {sphere_radius}, skipping output gathering.",
+                file=sys.stderr,
+            )
+            return (None, None, None), None
+        with self._stage("format_results", sphere_radius):
+            results = buried_volume.format_results(free, buried, exact_volume)
+        return results, buried_volume.total_metrics(free, buried, exact_volume)[metric]
 
-        dict_total_results = defaultdict(list)
+    def run_range_converged(
+        self,
+        r_min,
+        r_max,
+        nsteps=50,
+        tolerance=0.1,
+        initial_mesh_size=0.2,
+        min_mesh_size=0.025,
+        metric="percent_buried_volume",
+        displacement=0.0,
+        remove_H=True,
+        orient_z=True,
+        n_threads=-1,
+        radii_table="default",
+        executor="threads",
+        **convergence,
+    ):
+        """
+        Same as run_range, but every radius is converged in the mesh size with run_single_converged.
+        Args:
+            tolerance, initial_mesh_size, min_mesh_size, metric: see run_single_converged.
+            convergence: further arguments for run_single_converged, e.g. refinement or order.
+            The remaining arguments are the same as for run_range.
+        Returns:
+            pandas.DataFrame: the columns of run_range for the finest mesh of every radius and
+            the extrapolated metric, its estimated error, the mesh size, whether the tolerance
+            was met and the number of meshes.
+        """
+        check_executor(executor)
+        parameters = dict(
+            tolerance=tolerance,
+            initial_mesh_size=initial_mesh_size,
+            min_mesh_size=min_mesh_size,
+            metric=metric,
+            displacement=displacement,
+            remove_H=remove_H,
+            orient_z=orient_z,
+            radii_table=radii_table,
+            **convergence,
+        )
+        jobs = [
+            (self, r_current, parameters)
+            for r_current in np.linspace(r_min, r_max, nsteps)
+        ]
+        rows = []
+        for job, row, error in iter_jobs(
+            _run_converged_job, jobs, executor, n_threads, ordered=True
+        ):
+            if error is not None:
+                print(f"Calculation for r = {job[1]} failed: {error}", file=sys.stderr)
+            rows.append(row)
+        return rows_to_frame(rows)
 
-        #:
-        Parallel(n_jobs=n_threads, prefer="threads", require="sharedmem")(
-            delayed(_run_job)(r) for r in np.linspace(r_min, r_max, nsteps)
+    def run_single_monte_carlo(
+        self,
+        sphere_radius,
+        n_samples=None,
+        time_budget=None,
+        sampling="random",
+        batch_size=monte_carlo.DEFAULT_BATCH_SIZE,
+        seed=None,
+        displacement=0.0,
+        remove_H=True,
+        orient_z=True,
+        radii_table="default",
+    ):
+        """
+        Estimate the buried volume of a single radius from points sampled inside the sphere.
+        Much faster than the mesh integration for a preview, the atoms are prepared like in
+        the numpy backend for either backend.
+        Args:
+            sphere_radius (float): The radius of the sphere.
+            n_samples (int): Sample budget (default None, 65536 if no time budget is given)
+            time_budget (float): Time budget in seconds, sampling stops after the first
+                batch exceeding it. (default None)
+            sampling (str): "random" or "sobol", Sobol sampling requires scipy. (default "random")
+            batch_size (int): Points per batch, the standard errors are estimated from the
+                spread of the batches. (default 1024)
+            seed (int): Seed of the random numbers (default None)
+            The remaining arguments are the same as for run_single.
+        Returns:
+            dict: the total, quadrant and octant results in the layout of run_single, their
+            standard errors in the same layout, the number of samples and the elapsed time.
+        """
+        start = time.perf_counter()
+        with self._stage("prepare_atoms", sphere_radius):
+            _, _, index = self._oriented_atoms(
+                displacement, remove_H, orient_z, radii_table
+            )
+        with self._stage("monte_carlo", sphere_radius):
+            buried_counts, point_counts = monte_carlo.sample_octant_counts(
+                index,
+                sphere_radius,
+                n_samples=n_samples,
+                time_budget=time_budget,
+                batch_size=batch_size,
+                sampling=sampling,
+                seed=seed,
+            )
+        results, errors = monte_carlo.format_monte_carlo_results(
+            buried_counts, point_counts, sphere_radius
         )
-        try:
-            df_total_results = (
-                pd.DataFrame(dict_total_results)
-                .reset_index(drop=True)
-                .sort_values(by=["r"])
+        return {
+            "results": results,
+            "standard_errors": errors,
+            "n_samples": int(point_counts.sum()),
+            "sampling": sampling,
+            "elapsed": time.perf_counter() - start,
+        }
+
+    def iter_range_monte_carlo(
+        self,
+        r_min,
+        r_max,
+        nsteps=50,
+        n_samples=None,
+        time_budget=None,
+        sampling="random",
+        seed=None,
+        **parameters,
+    ):
+        """
+        Same as run_range_monte_carlo, but yields the row of every radius as soon as it is estimated.
+        """
+        monte_carlo.check_sampling(sampling)
+        if seed is None:
+            # one seed for all radii keeps the curve smooth
+            seed = int(np.random.default_rng().integers(2**32))
+        if time_budget is not None:
+            time_budget = time_budget / nsteps
+        for r_current in np.linspace(r_min, r_max, nsteps):
+            estimate = self.run_single_monte_carlo(
+                r_current,
+                n_samples=n_samples,
+                time_budget=time_budget,
+                sampling=sampling,
+                seed=seed,
+                **parameters,
             )
-            # return original values
-        except KeyError:
-            print("No results could be found.")
-            df_total_results = None
-        return df_total_results
+            errors = estimate["standard_errors"][0]
+            yield {
+                "r": r_current,
+                **estimate["results"][0],
+                **{
+                    f"{metric}_error": errors[metric]
+                    for metric in monte_carlo.ERROR_METRICS
+                },
+                "n_samples": estimate["n_samples"],
+            }
+
+    def run_range_monte_carlo(
+        self,
+        r_min,
+        r_max,
+        nsteps=50,
+        n_samples=None,
+        time_budget=None,
+        sampling="random",
+        seed=None,
+        **parameters,
+    ):
+        """
+        Quick preview of run_range with Monte Carlo estimates instead of the mesh integration.
+        Args:
+            r_min, r_max, nsteps: Radii as in run_range.
+            n_samples (int): Sample budget per radius, see run_single_monte_carlo.
+            time_budget (float): Time budget in seconds for the whole range, split evenly over the radii.
+            sampling (str): "random" or "sobol" (default "random")
+            seed (int): Seed shared by all radii (default None, a random seed)
+            parameters: Further arguments for run_single_monte_carlo.
+        Returns:
+            pandas.DataFrame: the columns of run_range, the standard errors of the
+            volumes and percentages and the number of samples per radius.
+        """
+        import pandas as pd
+
+        rows = self.iter_range_monte_carlo(
+            r_min,
+            r_max,
+            nsteps,
+            n_samples=n_samples,
+            time_budget=time_budget,
+            sampling=sampling,
+            seed=seed,
+            **parameters,
+        )
+        return pd.DataFrame(list(rows))
+
+    def _run_range_sweep(
+        self,
+        sphere_radii,
+        displacement,
+        mesh_size,
+        remove_H,
+        orient_z,
+        radii_table,
+        all_levels=False,
+    ):
+        """Same as run_range but all radii are taken from one voxel pass."""
+        cache_keys = [
+            self._cache_key(
+                method="sweep",
+                sphere_radius=r_current,
+                displacement=displacement,
+                mesh_size=mesh_size,
+                remove_H=remove_H,
+                orient_z=orient_z,
+                radii_table=radii_table,
+            )
+            for r_current in sphere_radii
+        ]
+        all_results = [None] * len(sphere_radii)
+        if self.cache is not None:
+            with self._stage("cache_lookup"):
+                all_results = [self.cache.get(key) for key in cache_keys]
+
+        missing = [i for i, results in enumerate(all_results) if results is None]
+        if missing:
+            with self._stage("prepare_atoms"):
+                coords, radii, index = self._oriented_atoms(
+                    displacement, remove_H, orient_z, radii_table
+                )
+            with self._stage("integrate"):
+                free, buried, exact_volume = buried_volume.integrate_sphere_range(
+                    coords, radii, sphere_radii[missing], mesh_size, index=index
+                )
+            for i, r_free, r_buried, r_exact in zip(
+                missing, free, buried, exact_volume
+            ):
+                with self._stage("format_results", sphere_radii[i]):
+                    if r_free.sum() + r_buried.sum() == 0:
+                        all_results[i] = [None, None, None]
+                    else:
+                        all_results[i] = list(
+                            buried_volume.format_results(r_free, r_buried, r_exact)
+                        )
+                if self.cache is not None:
+                    with self._stage("cache_store", sphere_radii[i]):
+                        self.cache.set(cache_keys[i], all_results[i])
+
+        with self._stage("assemble_frame"):
+            rows = [
+                _results_to_row(r_current, results, all_levels)
+                for r_current, results in zip(sphere_radii, all_results)
+            ]
+            return rows_to_frame(rows, all_levels)
 
     def plot_graph(self, df):
         """Generate an interactive widget to plot the resulting cavity data against the sphere radius.
@@ -234,107 +1082,80 @@ class MoleculeScanner:
         :type df: pandas.DataFrame
 
         """
-        # parameter setup
-        plot_names = list(df.keys())
-        plot_names.remove("r")
-
-        margin = dict(l=65, r=50, b=65, t=90, pad=10)
-
-        width = 1000
-        height = 500
-        fontsize = 18
-        config = {
-            "toImageButtonOptions": {
-                "format": "png",  # one of png, svg, jpeg, webp
-                "filename": "Plot_Image",
-                "height": height * 4,
-                "width": width * 4,
-                "scale": 5,  # Multiply title/legend/axis/canvas sizes by this factor
-            }
-        }
-
-        # app setup
-        app = Dash(__name__)
-
-        app.layout = html.Div(
-            [
-                html.H4("PLY Object Explorer"),
-                html.P("Choose a feature to plot over r"),
-                dcc.Dropdown(
-                    id="dropdown",
-                    options=plot_names,
-                    value="percent_buried_volume",
-                    clearable=False,
-                ),
-                dcc.Graph(id="graph", config=config),
-            ]
-        )
-
-        # plot setup
-        @app.callback(Output("graph", "figure"), Input("dropdown", "value"))
-        def display_plot(name):
-            fig = go.Figure(
-                data=go.Scatter(
-                    x=df["r"].values, y=df[name].values, mode="lines", name=name
-                )
-            )
+        # the plotting packages are only needed here, headless runs do not load them
+        from molecule_scanner.visualization import plot_graph
 
-            fig.update_layout(
-                autosize=True,
-                width=width,
-                height=height,
-                margin=margin,
-                yaxis=dict(
-                    ticksuffix="   ",
-                    tickfont_size=fontsize,
-                    title_text=name.replace("_", " "),
-                ),
-                xaxis=dict(
-                    ticksuffix="   ", tickfont_size=fontsize, title_text="Sphere radius"
-                ),
-            )
-            return fig
-
-        # run server in jupyter notebook cell
-        app.run_server(
-            mode="inline",
-            port=8091,
-            dev_tools_ui=False,  # debug=True,
-            dev_tools_hot_reload=False,
-            threaded=True,
-        )
+        plot_graph(df)
 
     # Plotting the cavity
 
-    def generate_cavity(self, sphere_radius, mesh_size, **args):
+    def generate_cavity(self, sphere_radius, mesh_size, persist_arrays=False, **args):
         """
         Calculates and returns the cavity file data.
         uses same arguments as run_single.
+        persist_arrays (bool): Save the parsed surfaces as .npy beside the surface files,
+            generating the same cavity again skips the calculation and the parsing. (default False)
         """
-        top_file, bottom_file = self.run_single(
+        top_file, bottom_file, key = self.run_single(
             sphere_radius=sphere_radius,
             mesh_size=mesh_size,
             return_surface_files=True,
             **args,
         )
-        df_top = pd.read_table(top_file, sep="\s+", usecols=[0, 1, 2], header=None)
-        df_bottom = pd.read_table(
-            bottom_file, sep="\s+", usecols=[0, 1, 2], header=None
-        )
+        with self._stage("read_surfaces", sphere_radius):
+            x, y, z_top = buried_volume.read_surface_file(top_file, persist_arrays, key)
+            z_bottom = buried_volume.read_surface_file(
+                bottom_file, persist_arrays, key
+            )[2]
 
-        df_cavity = df_top[[0, 1]]
-        df_cavity["top"] = df_top[2]
-        df_cavity["bottom"] = df_bottom[2]
-        df_cavity["top"] = df_cavity["top"].replace(min(df_cavity["top"]), np.nan)
-        df_cavity["bottom"] = df_cavity["bottom"].replace(
-            max(df_cavity["bottom"]), np.nan
-        )
-        df_cavity["top+bottom"] = df_cavity["top"] + df_cavity["bottom"]
+        import pandas as pd
+
+        with self._stage("assemble_frame", sphere_radius):
+            X, Y = np.meshgrid(x, y, indexing="ij")
+            df_cavity = pd.DataFrame(
+                {
+                    0: X.ravel(),
+                    1: Y.ravel(),
+                    "top": z_top.ravel(),
+                    "bottom": z_bottom.ravel(),
+                }
+            )
+            df_cavity["top"] = df_cavity["top"].replace(min(df_cavity["top"]), np.nan)
+            df_cavity["bottom"] = df_cavity["bottom"].replace(
+                max(df_cavity["bottom"]), np.nan
+            )
+            df_cavity["top+bottom"] = df_cavity["top"] + df_cavity["bottom"]
 
         return df_cavity
 
+    def steric_map(
+        self,
+        sphere_radius,
+        mesh_size=0.10,
+        displacement=0.0,
+        remove_H=True,
+        orient_z=True,
+        radii_table="default",
+    ):
+        """
+        Calculates the top and bottom surface of the cavity in-process, independent of the backend.
+        Same arguments as run_single.
+        Returns:
+            tuple: x and y axis as 1-D arrays and the top and bottom surfaces as 2-D float32
+            arrays indexed by (x, y). Grid points without buried volume are NaN.
+        """
+        with self._stage("prepare_atoms", sphere_radius):
+            coords, radii, index = self._oriented_atoms(
+                displacement, remove_H, orient_z, radii_table
+            )
+        with self._stage("steric_map", sphere_radius):
+            axis, z_top, z_bottom = buried_volume.steric_map(
+                coords, radii, sphere_radius, mesh_size, index=index
+            )
+        return axis, axis.copy(), z_top, z_bottom
+
     def reshape_data(self, df_cavity):
-        x_y_len = len(np.unique(df_cavity[0]))
+        x_y_len = buried_volume.grid_shape(df_cavity[0].values)[0]
         x = df_cavity[0].values
         y = df_cavity[1].values
         z_top = df_cavity["top"].values
@@ -355,98 +1176,8 @@ class MoleculeScanner:
         """
         Generate a Top, Bottom and 3D view of the cavity.
         when saving the resolution is 4 times higher than in the notebook.
-
-        :param df_cavity: _description_
-        :type df_cavity: _type_
-        :return: _description_
-        :rtype: _type_
+        Same arguments as steric_map.
         """
+        from molecule_scanner.visualization import visualize_cavity
 
-        df_cavity = self.generate_cavity(sphere_radius, mesh_size, **args)
-        X, Y, Z_top, Z_bottom = self.reshape_data(df_cavity)
-
-        mesh_names = ["Top", "Bottom", "3D"]
-
-        # this changes the save properties
-        config = {
-            "toImageButtonOptions": {
-                "format": "png",  # one of png, svg, jpeg, webp
-                "filename": "custom_image",
-                "height": 2000,
-                "width": 2000,
-                "scale": 5,  # Multiply title/legend/axis/canvas sizes by this factor
-            }
-        }
-
-        app = Dash(__name__)
-
-        app.layout = html.Div(
-            [
-                html.H4("PLY Object Explorer"),
-                html.P("Choose a cavity visualisation:"),
-                dcc.Dropdown(
-                    id="dropdown", options=mesh_names, value="Top", clearable=False
-                ),
-                dcc.Graph(id="graph", config=config),
-            ]
-        )
-
-        margin = dict(l=65, r=50, b=65, t=90, pad=10)
-
-        contours_coloring = "heatmap"
-        width = 500
-        height = 500
-        fontsize = 18
-        line_smoothing = 0
-        # create the three different objects
-        @app.callback(Output("graph", "figure"), Input("dropdown", "value"))
-        def display_mesh(name):
-            if name == "Top":
-
-                fig = go.Figure(
-                    data=go.Contour(
-                        z=Z_top,
-                        x=np.unique(X),
-                        y=np.unique(Y),
-                        line_smoothing=line_smoothing,
-                        contours_coloring=contours_coloring,
-                    ),
-                )
-
-            elif name == "Bottom":
-                fig = go.Figure(
-                    data=go.Contour(
-                        z=Z_bottom,
-                        x=np.unique(X),
-                        y=np.unique(Y),
-                        line_smoothing=line_smoothing,
-                        contours_coloring=contours_coloring,
-                    )
-                )
-
-            elif name == "3D":
-                fig = go.Figure(
-                    data=[
-                        go.Surface(z=Z_top, x=X, y=Y),
-                        go.Surface(z=Z_bottom, x=X, y=Y, showscale=False),
-                    ]
-                )
-
-            fig.update_layout(
-                autosize=True,
-                width=width,
-                height=height,
-                margin=margin,
-                yaxis=dict(ticksuffix="   ", tickfont_size=fontsize),
-                xaxis=dict(ticksuffix="   ", tickfont_size=fontsize),
-            )
-            return fig
-
-        # run server in jupyter notebook cell
-        app.run_server(
-            mode="inline",
-            port=8090,
-            dev_tools_ui=False,  # debug=True,
-            dev_tools_hot_reload=False,
-            threaded=True,
-        )
+        visualize_cavity(self, sphere_radius, mesh_size, **args)
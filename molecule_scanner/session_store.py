@@ -0,0 +1,122 @@
+"""
+Server-side state of the Dash sessions.
+
+Every browser tab gets a random session ID and only this ID and the job IDs
+travel to the browser. The scanner, scan table and cavity arrays of a session
+stay on the server: the most recently used sessions in memory, older ones
+pickled to a spill directory, the oldest spilled sessions are dropped.
+"""
+import os
+import pickle
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from tempfile import mkdtemp
+
+_SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_session_id():
+    """Random ID of a new session."""
+    return uuid.uuid4().hex
+
+
+def check_session_id(session_id):
+    # session IDs come from the browser and are used as file names
+    if not isinstance(session_id, str) or not _SESSION_ID_PATTERN.match(session_id):
+        raise ValueError(f"Invalid session ID {session_id!r}.")
+
+
+class SessionStore:
+    """
+    LRU store of per-session values, kept in memory and spilled to disk, safe to use from several threads.
+    """
+
+    def __init__(self, spill_dir=None, max_sessions=16, max_spilled_sessions=256):
+        """
+        Args:
+        spill_dir (str): Directory for the sessions evicted from memory (default None, a new temporary directory)
+        max_sessions (int): Number of sessions kept in memory (default 16)
+        max_spilled_sessions (int): Number of sessions kept on disk, the least recently
+            used ones are deleted after that. (default 256)
+        """
+        self.spill_dir = mkdtemp() if spill_dir is None else spill_dir
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.max_sessions = max_sessions
+        self.max_spilled_sessions = max_spilled_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.pkl")
+
+    def _session(self, session_id, create=False):
+        """Values of a session, loaded from disk if it was spilled. None if unknown."""
+        check_session_id(session_id)
+        if session_id in self._sessions:
+            self._sessions.move_to_end(session_id)
+            return self._sessions[session_id]
+
+        spill_path = self._spill_path(session_id)
+        if os.path.exists(spill_path):
+            with open(spill_path, "rb") as file:
+                values = pickle.load(file)
+            os.remove(spill_path)
+        elif create:
+            values = {}
+        else:
+            return None
+        self._sessions[session_id] = values
+        self._evict()
+        return values
+
+    def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            session_id, values = self._sessions.popitem(last=False)
+            with open(self._spill_path(session_id), "wb") as file:
+                pickle.dump(values, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        spilled = [
+            os.path.join(self.spill_dir, name)
+            for name in os.listdir(self.spill_dir)
+            if name.endswith(".pkl")
+        ]
+        if len(spilled) > self.max_spilled_sessions:
+            spilled.sort(key=os.path.getmtime)
+            for path in spilled[: len(spilled) - self.max_spilled_sessions]:
+                os.remove(path)
+
+    def get(self, session_id, key, default=None):
+        """Value stored under key for the session, default if the session or key is unknown."""
+        with self._lock:
+            values = self._session(session_id)
+            if values is None:
+                return default
+            return values.get(key, default)
+
+    def set(self, session_id, key, value):
+        """Store a picklable value under key for the session."""
+        with self._lock:
+            self._session(session_id, create=True)[key] = value
+
+    def update(self, session_id, **values):
+        """Store several values for the session at once."""
+        with self._lock:
+            self._session(session_id, create=True).update(values)
+
+    def remove(self, session_id):
+        """Forget all values of the session."""
+        with self._lock:
+            check_session_id(session_id)
+            self._sessions.pop(session_id, None)
+            spill_path = self._spill_path(session_id)
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions or (
+                _SESSION_ID_PATTERN.match(str(session_id)) is not None
+                and os.path.exists(self._spill_path(session_id))
+            )
@@ -0,0 +1,157 @@
+"""
+Uniform cell list over atom spheres for batched overlap queries.
+
+Every atom is registered in all cells its bounding box touches, so a query
+point or a block of the voxel mesh only has to be tested against the atoms of
+the cells it covers. Building the index is linear in the number of atoms and a
+query is linear in the number of points, independent of the size of the molecule.
+"""
+import numpy as np
+
+from molecule_scanner.buried_volume import mark_buried
+
+# cell size in units of the largest atom radius
+_DEFAULT_CELL_SCALE = 1.0
+
+
+class CellList:
+    """
+    Spatial index answering whether points lie inside any atom sphere.
+    """
+
+    def __init__(self, coords, radii, cell_size=None):
+        """
+        Args:
+        coords (numpy.ndarray): (n_atoms, 3) atom coordinates.
+        radii (numpy.ndarray): Atom radii.
+        cell_size (float): Edge length of the cubic cells
+            (default None, the largest radius)
+        """
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+        self.radii = np.asarray(radii, dtype=float).reshape(-1)
+        self.radii2 = self.radii * self.radii
+        if cell_size is None:
+            cell_size = _DEFAULT_CELL_SCALE * (
+                self.radii.max() if len(self.radii) else 1.0
+            )
+        self.cell_size = float(cell_size)
+
+        if len(self.radii) == 0:
+            self.origin = np.zeros(3)
+            self.shape = np.ones(3, dtype=int)
+            self._starts = np.zeros(2, dtype=int)
+            self._atoms = np.zeros(0, dtype=int)
+            return
+
+        lower = self.coords - self.radii[:, None]
+        upper = self.coords + self.radii[:, None]
+        self.origin = lower.min(axis=0)
+        self.shape = (
+            np.floor((upper.max(axis=0) - self.origin) / self.cell_size).astype(int) + 1
+        )
+
+        # every combination of atom and cell inside the atom's bounding box
+        first = self._cell_coordinates(lower)
+        span = self._cell_coordinates(upper) - first + 1
+        max_span = span.max(axis=0)
+        offsets = np.stack(
+            np.meshgrid(*[np.arange(n) for n in max_span], indexing="ij"), -1
+        ).reshape(-1, 3)
+        valid = (offsets[None, :, :] < span[:, None, :]).all(axis=2)
+        atom_ids, offset_ids = np.nonzero(valid)
+        cells = self._flat_index(first[atom_ids] + offsets[offset_ids])
+
+        # compressed lists: the atoms of cell c are _atoms[_starts[c]:_starts[c + 1]]
+        order = np.argsort(cells, kind="stable")
+        self._atoms = atom_ids[order]
+        counts = np.bincount(cells, minlength=self.n_cells)
+        self._starts = np.concatenate([[0], np.cumsum(counts)])
+
+    @property
+    def n_cells(self):
+        return int(np.prod(self.shape))
+
+    def _cell_coordinates(self, points):
+        cell = np.floor((points - self.origin) / self.cell_size).astype(int)
+        return np.clip(cell, 0, self.shape - 1)
+
+    def _flat_index(self, cell):
+        return np.ravel_multi_index(cell.T, self.shape)
+
+    def cell_atoms(self, cell):
+        """IDs of the atoms registered in the cell with the given flat index."""
+        return self._atoms[self._starts[cell] : self._starts[cell + 1]]
+
+    def _outside(self, points):
+        upper = self.origin + self.shape * self.cell_size
+        return ((points < self.origin) | (points >= upper)).any(axis=-1)
+
+    def inside_any(self, points):
+        """Test a batch of points against all atom spheres.
+
+        Args:
+            points (numpy.ndarray): (n_points, 3) coordinates.
+
+        Returns:
+            numpy.ndarray: boolean mask, True for points inside any atom sphere.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        inside = np.zeros(len(points), dtype=bool)
+        candidates = np.flatnonzero(~self._outside(points))
+        if len(candidates) == 0 or len(self._atoms) == 0:
+            return inside
+
+        cells = self._flat_index(self._cell_coordinates(points[candidates]))
+        order = np.argsort(cells, kind="stable")
+        cells = cells[order]
+        candidates = candidates[order]
+        bounds = np.flatnonzero(np.diff(cells)) + 1
+        for group in np.split(np.arange(len(cells)), bounds):
+            atoms = self.cell_atoms(cells[group[0]])
+            if len(atoms) == 0:
+                continue
+            point_ids = candidates[group]
+            inside[point_ids] = self._test(points[point_ids], atoms)
+        return inside
+
+    def _test(self, points, atoms):
+        delta = points[:, None, :] - self.coords[atoms][None, :, :]
+        dist2 = np.einsum("pad,pad->pa", delta, delta)
+        return (dist2 < self.radii2[atoms]).any(axis=1)
+
+    def atoms_in_box(self, lower, upper):
+        """IDs of the atoms whose bounding box may intersect the box from lower to upper."""
+        lower = np.asarray(lower, dtype=float)
+        upper = np.asarray(upper, dtype=float)
+        if len(self._atoms) == 0 or (
+            (upper < self.origin).any()
+            or (lower >= self.origin + self.shape * self.cell_size).any()
+        ):
+            return np.zeros(0, dtype=int)
+        first = self._cell_coordinates(lower)
+        last = self._cell_coordinates(upper)
+        cells = np.ravel_multi_index(
+            np.meshgrid(
+                *[np.arange(a, b + 1) for a, b in zip(first, last)], indexing="ij"
+            ),
+            self.shape,
+        ).ravel()
+        atoms = [self.cell_atoms(cell) for cell in cells]
+        return np.unique(np.concatenate(atoms))
+
+    def mark_block(self, buried, x_axis, y_axis, z_axis):
+        """Flag all grid points of a block that lie inside any atom sphere.
+
+        Only the atoms registered in the cells covered by the block are tested,
+        each of them against the grid points inside its bounding box.
+
+        Args:
+            buried (numpy.ndarray): Boolean array of shape (len(x_axis), len(y_axis), len(z_axis)), updated in place.
+            x_axis, y_axis, z_axis (numpy.ndarray): Sorted grid coordinates of the block.
+        """
+        atoms = self.atoms_in_box(
+            [x_axis[0], y_axis[0], z_axis[0]], [x_axis[-1], y_axis[-1], z_axis[-1]]
+        )
+        mark_buried(
+            buried, x_axis, y_axis, z_axis, self.coords[atoms], self.radii[atoms]
+        )
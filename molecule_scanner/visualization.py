@@ -0,0 +1,206 @@
+"""
+Interactive notebook widgets for scan results and cavities.
+
+Dash and plotly are only imported with this module, so the scanner and the
+worker processes running it start without them.
+"""
+from dash import dcc, html, Input, Output, Dash
+import numpy as np
+import plotly.graph_objects as go
+
+MARGIN = dict(l=65, r=50, b=65, t=90, pad=10)
+FONTSIZE = 18
+CAVITY_VIEWS = ["Top", "Bottom", "3D"]
+
+
+def scan_plot_figure(df, name, width=1000, height=500):
+    """Figure of one result column of a scan against the sphere radius.
+
+    Args:
+        df (pandas.DataFrame): Results of MoleculeScanner.run_range.
+        name (str): Column to plot.
+
+    Returns:
+        plotly.graph_objects.Figure: the line plot.
+    """
+    fig = go.Figure(
+        data=go.Scatter(x=df["r"].values, y=df[name].values, mode="lines", name=name)
+    )
+
+    fig.update_layout(
+        autosize=True,
+        width=width,
+        height=height,
+        margin=MARGIN,
+        yaxis=dict(
+            ticksuffix="   ",
+            tickfont_size=FONTSIZE,
+            title_text=name.replace("_", " "),
+        ),
+        xaxis=dict(
+            ticksuffix="   ", tickfont_size=FONTSIZE, title_text="Sphere radius"
+        ),
+    )
+    return fig
+
+
+def cavity_plot_figure(cavity_map, name, width=500, height=500):
+    """Figure of a view of the cavity.
+
+    Args:
+        cavity_map (tuple): x axis, y axis, top and bottom heights of MoleculeScanner.steric_map.
+        name (str): "Top" or "Bottom" contour plot, or "3D" for both surfaces.
+
+    Returns:
+        plotly.graph_objects.Figure: the view of the cavity.
+    """
+    x, y, Z_top, Z_bottom = cavity_map
+    contours_coloring = "heatmap"
+    line_smoothing = 0
+    if name == "Top":
+        fig = go.Figure(
+            data=go.Contour(
+                z=Z_top,
+                x=x,
+                y=y,
+                line_smoothing=line_smoothing,
+                contours_coloring=contours_coloring,
+            ),
+        )
+
+    elif name == "Bottom":
+        fig = go.Figure(
+            data=go.Contour(
+                z=Z_bottom,
+                x=x,
+                y=y,
+                line_smoothing=line_smoothing,
+                contours_coloring=contours_coloring,
+            )
+        )
+
+    elif name == "3D":
+        X, Y = np.meshgrid(x, y, indexing="ij")
+        fig = go.Figure(
+            data=[
+                go.Surface(z=Z_top, x=X, y=Y),
+                go.Surface(z=Z_bottom, x=X, y=Y, showscale=False),
+            ]
+        )
+
+    else:
+        raise ValueError(
+            f"Unknown cavity view '{name}', choose one of {', '.join(CAVITY_VIEWS)}."
+        )
+
+    fig.update_layout(
+        autosize=True,
+        width=width,
+        height=height,
+        margin=MARGIN,
+        yaxis=dict(ticksuffix="   ", tickfont_size=FONTSIZE),
+        xaxis=dict(ticksuffix="   ", tickfont_size=FONTSIZE),
+    )
+    return fig
+
+
+def _run_inline(app, port):
+    # run server in jupyter notebook cell
+    app.run(
+        jupyter_mode="inline",
+        port=port,
+        dev_tools_ui=False,  # debug=True,
+        dev_tools_hot_reload=False,
+        threaded=True,
+    )
+
+
+def plot_graph(df):
+    """Generate an interactive widget to plot the resulting cavity data against the sphere radius.
+
+    :param df: A DataFrame object generated by the `run_range` function.
+    :type df: pandas.DataFrame
+
+    """
+    # parameter setup
+    plot_names = list(df.keys())
+    plot_names.remove("r")
+
+    width = 1000
+    height = 500
+    config = {
+        "toImageButtonOptions": {
+            "format": "png",  # one of png, svg, jpeg, webp
+            "filename": "Plot_Image",
+            "height": height * 4,
+            "width": width * 4,
+            "scale": 5,  # Multiply title/legend/axis/canvas sizes by this factor
+        }
+    }
+
+    # app setup
+    app = Dash(__name__)
+
+    app.layout = html.Div(
+        [
+            html.H4("PLY Object Explorer"),
+            html.P("Choose a feature to plot over r"),
+            dcc.Dropdown(
+                id="dropdown",
+                options=plot_names,
+                value="percent_buried_volume",
+                clearable=False,
+            ),
+            dcc.Graph(id="graph", config=config),
+        ]
+    )
+
+    # plot setup
+    @app.callback(Output("graph", "figure"), Input("dropdown", "value"))
+    def display_plot(name):
+        return scan_plot_figure(df, name, width, height)
+
+    _run_inline(app, 8091)
+
+
+def visualize_cavity(scanner, sphere_radius, mesh_size, **args):
+    """
+    Generate a Top, Bottom and 3D view of the cavity.
+    when saving the resolution is 4 times higher than in the notebook.
+
+    :param scanner: The MoleculeScanner of the molecule.
+    :type scanner: MoleculeScanner
+    Further arguments as for MoleculeScanner.steric_map.
+    """
+    cavity_map = scanner.steric_map(sphere_radius, mesh_size, **args)
+
+    # this changes the save properties
+    config = {
+        "toImageButtonOptions": {
+            "format": "png",  # one of png, svg, jpeg, webp
+            "filename": "custom_image",
+            "height": 2000,
+            "width": 2000,
+            "scale": 5,  # Multiply title/legend/axis/canvas sizes by this factor
+        }
+    }
+
+    app = Dash(__name__)
+
+    app.layout = html.Div(
+        [
+            html.H4("PLY Object Explorer"),
+            html.P("Choose a cavity visualisation:"),
+            dcc.Dropdown(
+                id="dropdown", options=CAVITY_VIEWS, value="Top", clearable=False
+            ),
+            dcc.Graph(id="graph", config=config),
+        ]
+    )
+
+    # create the three different objects
+    @app.callback(Output("graph", "figure"), Input("dropdown", "value"))
+    def display_mesh(name):
+        return cavity_plot_figure(cavity_map, name)
+
+    _run_inline(app, 8090)
@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import xyz_py as xyzp
+
+from molecule_scanner.bonds import element_symbol, find_bonds
+from molecule_scanner.buried_volume import read_xyz
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+@pytest.mark.parametrize("molecule", ["mad25_p.xyz", "GC1.xyz", "nhc.xyz"])
+def test_find_bonds(molecule):
+    xyz_filepath = os.path.join(DATA_DIR, molecule)
+    elements, coords = read_xyz(xyz_filepath)
+
+    labels, xyz_coords = xyzp.load_xyz(xyz_filepath, add_indices=True)
+    expected = sorted(
+        tuple(sorted(bond))
+        for bond in xyzp.find_bonds(labels, xyz_coords, style="indices")[0]
+    )
+    assert find_bonds(elements, coords).tolist() == [list(bond) for bond in expected]
+
+
+def test_find_bonds_small():
+    assert find_bonds(["C"], [[0, 0, 0]]).shape == (0, 2)
+    bonds = find_bonds(["C", "H", "H"], [[0, 0, 0], [1.0, 0, 0], [10.0, 0, 0]])
+    assert bonds.tolist() == [[0, 1]]
+    assert element_symbol("Ru01") == "Ru"
+    with pytest.raises(ValueError):
+        find_bonds(["C", "Xx"], [[0, 0, 0], [1.0, 0, 0]])
+
+
+def test_viewer_model_memoized(tmp_path):
+    dash_app = pytest.importorskip("molecule_scanner.dash_app")
+    xyz_filepath = os.path.join(DATA_DIR, "nhc.xyz")
+    copied = str(tmp_path / "uploaded.xyz")
+    shutil.copy(xyz_filepath, copied)
+
+    data_3d, styles = dash_app.get_viewer_model(xyz_filepath)
+    assert len(data_3d["atoms"]) == 72
+    assert len(data_3d["bonds"]) == 74
+    assert len(styles) == 72
+    # same content, same model without rebuilding it
+    assert dash_app.get_viewer_model(copied)[0] is data_3d
@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from molecule_scanner.cli import main
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+ATOM_ARGS = ["--center", "1", "--z-axis", "2", "--xz-plane", "1,3,9", "--delete", "1"]
+
+
+def test_cli_does_not_import_plotting():
+    code = (
+        "import sys, molecule_scanner.cli; "
+        "print([m for m in sys.modules if m.split('.')[0] in ('dash', 'plotly', 'dash_bio')])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_cli_scan_and_cavity(tmp_path):
+    xyz_filepath = os.path.join(DATA_DIR, "mad25_p.xyz")
+    output = tmp_path / "scan.json"
+    exit_code = main(
+        ["scan", xyz_filepath, *ATOM_ARGS, "--r-min", "3", "--r-max", "3.5"]
+        + ["--steps", "2", "--backend", "numpy", "-j", "1", "-o", str(output)]
+    )
+    assert exit_code == 0
+    df_scan = pd.read_json(output)
+    assert list(df_scan["r"]) == [3.0, 3.5]
+    assert df_scan["percent_buried_volume"].iloc[1] == pytest.approx(69.0, abs=0.11)
+
+    output = tmp_path / "cavity.npz"
+    exit_code = main(
+        ["cavity", xyz_filepath, *ATOM_ARGS, "--radius", "3.5", "--mesh-size", "0.2"]
+        + ["-o", str(output)]
+    )
+    assert exit_code == 0
+    with np.load(output) as cavity_map:
+        assert cavity_map["z_top"].shape == (
+            len(cavity_map["x_axis"]),
+            len(cavity_map["y_axis"]),
+        )
+
+    # unknown output formats are reported instead of raising
+    exit_code = main(
+        ["scan", xyz_filepath, *ATOM_ARGS, "--r-min", "3", "--r-max", "3.5"]
+        + ["-o", str(tmp_path / "scan.txt")]
+    )
+    assert exit_code == 2
+
+    # only the radii tables of py2sambvca are accepted
+    with pytest.raises(SystemExit):
+        main(["scan", xyz_filepath, *ATOM_ARGS, "--radii-table", "bondi"])
+
+    # the cavity is calculated in-process, scan options are rejected instead of ignored
+    for option in [["--workers", "2"], ["--backend", "sambvca"], ["--sweep"]]:
+        with pytest.raises(SystemExit):
+            main(["cavity", xyz_filepath, *ATOM_ARGS, "--radius", "3.5", *option])
+
+
+def test_cli_stdout_is_csv(capsys):
+    # no volume is found at r = 2.0 with sambvca21, the message must not end up in the csv
+    xyz_filepath = os.path.join(DATA_DIR, "GC1.xyz")
+    exit_code = main(
+        ["scan", xyz_filepath, *ATOM_ARGS, "--r-min", "2", "--r-max", "3.5"]
+        + ["--steps", "2", "--backend", "sambvca", "-j", "1"]
+    )
+    assert exit_code == 0
+    captured = capsys.readouterr()
+    df_scan = pd.read_csv(io.StringIO(captured.out))
+    assert list(df_scan["r"]) == [3.5]
+    assert "percent_buried_volume" in df_scan.columns
+    assert "No volume could be found for r = 2.0" in captured.err
+
+
+def test_cli_batch(tmp_path, capsys):
+    manifest = tmp_path / "manifest.json"
+    with open(manifest, "w") as file:
+        json.dump(
+            [
+                {
+                    "xyz_filepath": os.path.join(DATA_DIR, "mad25_p.xyz"),
+                    "sphere_center_atom_ids": [1],
+                    "z_ax_atom_ids": [2],
+                    "xz_plane_atoms_ids": [1, 3, 9],
+                    "atoms_to_delete_ids": [1],
+                }
+            ],
+            file,
+        )
+    exit_code = main(["batch", str(manifest), "--radii", "3.5", "--backend", "numpy"])
+    assert exit_code == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "molecule,r,metric,value"
+    assert len(lines) == 1 + 7
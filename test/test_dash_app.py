@@ -0,0 +1,185 @@
+import base64
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from molecule_scanner.scanner import MoleculeScanner as msc
+from molecule_scanner.session_store import new_session_id
+
+dash_app = pytest.importorskip("molecule_scanner.dash_app")
+from dash.exceptions import PreventUpdate  # noqa: E402
+
+
+@pytest.fixture
+def cavity_map():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    return dash_app.freeze_arrays(msc_test.steric_map(3.5, 0.2))
+
+
+def test_cavity_figures_memoized(cavity_map):
+    dash_app._figures.clear()
+    figures = {
+        name: dash_app.get_figure(
+            ("cavity", "job", name), dash_app.build_cavity_figure, cavity_map, name
+        )
+        for name in ["Top", "Bottom", "Top+Bottom", "3D"]
+    }
+    for name, fig in figures.items():
+        again = dash_app.get_figure(
+            ("cavity", "job", name), dash_app.build_cavity_figure, cavity_map, name
+        )
+        assert again is fig
+
+    # the arrays are read-only, so repeated views can not change them
+    with pytest.raises(ValueError):
+        cavity_map[2][0, 0] = 0.0
+    assert figures["Top"].data[0].z == pytest.approx(cavity_map[2], nan_ok=True)
+
+    dash_app.clear_figures("cavity")
+    assert len(dash_app._figures) == 0
+
+
+def test_scan_figures_memoized():
+    dash_app._figures.clear()
+    df_scan = pd.DataFrame({"r": [1.0, 2.0], "percent_buried_volume": [50.0, 60.0]})
+    key = ("scan", "job", len(df_scan), "percent_buried_volume")
+    fig = dash_app.get_figure(
+        key, dash_app.build_scan_figure, df_scan, "percent_buried_volume"
+    )
+    assert dash_app.get_figure(key, None) is fig
+
+    dash_app.get_figure(("cavity", "job", "Top"), lambda: "cavity")
+    dash_app.clear_figures("scan")
+    assert list(dash_app._figures) == [("cavity", "job", "Top")]
+
+    for i in range(dash_app.MAX_FIGURES + 5):
+        dash_app.get_figure(("scan", "job", i, "r"), lambda: i)
+    assert len(dash_app._figures) == dash_app.MAX_FIGURES
+    dash_app._figures.clear()
+
+
+def test_figures_thread_safe():
+    dash_app._figures.clear()
+    errors = []
+
+    def request(worker):
+        try:
+            for i in range(200):
+                key = ("scan", "job", (worker + i) % (2 * dash_app.MAX_FIGURES), "r")
+                assert dash_app.get_figure(key, lambda: key) == key
+                if i % 50 == 0:
+                    dash_app.clear_figures("scan", "job")
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=request, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(dash_app._figures) <= dash_app.MAX_FIGURES
+    dash_app._figures.clear()
+
+
+def test_viewer_models_thread_safe(monkeypatch):
+    # a single slot, so every request for another molecule evicts the last one
+    monkeypatch.setattr(dash_app, "MAX_VIEWER_MODELS", 1)
+    dash_app._viewer_models.clear()
+    filenames = [f"test/data/{name}.xyz" for name in ["mad25_p", "GC1", "nhc"]]
+    errors = []
+
+    def request(worker):
+        try:
+            for i in range(30):
+                data_3d, _ = dash_app.get_viewer_model(filenames[(worker + i) % 3])
+                assert data_3d["atoms"]
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=request, args=(worker,)) for worker in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(dash_app._viewer_models) == 1
+    dash_app._viewer_models.clear()
+
+
+def test_sessions_are_separated():
+    sessions = [new_session_id(), new_session_id()]
+    with open("test/data/mad25_p.xyz", "rb") as file:
+        content = "data:chemical/x-xyz;base64," + base64.b64encode(file.read()).decode()
+    dash_app.update_upload_label("mad25_p.xyz", content, sessions[0])
+    dash_app.start_init(1, "mad25_p.xyz", "0", "1", "0,2,8", "0", "", sessions[0])
+    assert dash_app.session_store.get(sessions[0], "scanner") is not None
+    assert dash_app.session_store.get(sessions[1], "scanner") is None
+
+    _, job_id = dash_app.run_scan(
+        1, 3, 4, 3, 0.2, ["remove H atoms"], "default", [], None, sessions[0]
+    )
+    job = dash_app.job_manager.get(job_id)
+    while not job.finished_running:
+        time.sleep(0.01)
+
+    _, table_data, plot_names, _ = dash_app.update_scan_progress(1, job_id, sessions[0])
+    # the new rows are appended to the table in the browser
+    (operation,) = table_data.to_plotly_json()["operations"]
+    assert operation["operation"] == "Extend"
+    assert len(operation["params"]["value"]) == 3
+    assert "percent_buried_volume" in plot_names
+    assert len(dash_app.session_store.get(sessions[0], "df_scan")) == 3
+    # nothing is sent again on the next poll
+    _, table_data, _, _ = dash_app.update_scan_progress(2, job_id, sessions[0])
+    assert table_data is dash_app.no_update
+    # another session can not read the results of the job
+    with pytest.raises(PreventUpdate):
+        dash_app.update_scan_progress(1, job_id, sessions[1])
+    with pytest.raises(PreventUpdate):
+        dash_app.scan_figure(sessions[1], job_id, "percent_buried_volume")
+    fig = dash_app.scan_figure(sessions[0], job_id, "percent_buried_volume")
+    assert len(fig.data[0].x) == 3
+
+
+def test_level_of_detail(cavity_map):
+    # 100000 radii are reduced to the min/max of the buckets and drawn with WebGL
+    r = np.linspace(1, 10, 100000)
+    df_scan = pd.DataFrame({"r": r, "percent_buried_volume": np.sin(10 * r)})
+    fig = dash_app.build_scan_figure(df_scan, "percent_buried_volume")
+    assert fig.data[0].type == "scattergl"
+    assert len(fig.data[0].x) <= dash_app.MAX_LINE_POINTS + 2
+    assert fig.data[0].y.max() == pytest.approx(1, abs=1e-6)
+    assert fig.data[0].y.dtype == np.float32
+    assert '"bdata"' in fig.to_json()
+
+    zoomed = dash_app.build_scan_figure(df_scan, "percent_buried_volume", (2, 2.5))
+    assert zoomed.data[0].x.min() < 2 and zoomed.data[0].x.max() > 2.5
+    assert np.diff(zoomed.data[0].x).max() < np.diff(fig.data[0].x).max()
+
+    small = pd.DataFrame({"r": [1.0, 2.0], "percent_buried_volume": [50.0, 60.0]})
+    assert dash_app.build_scan_figure(small, "percent_buried_volume").data[0].type == (
+        "scatter"
+    )
+
+    x_axis, _, z_top, _ = cavity_map
+    fig = dash_app.build_cavity_figure(cavity_map, "3D")
+    assert fig.data[0].z.dtype == np.float32
+    # surfaces expect the rows along y
+    assert fig.data[0].z.T == pytest.approx(z_top, nan_ok=True)
+
+    ranges = {"x": (-1.0, 1.0), "y": None}
+    fig = dash_app.build_cavity_figure(cavity_map, "Top", ranges)
+    assert fig.data[0].z.shape == (len(x_axis), len(fig.data[0].x))
+    assert len(fig.data[0].x) < len(x_axis)
+    assert list(fig.layout.xaxis.range) == [-1.0, 1.0]
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from molecule_scanner import buried_volume
+from molecule_scanner.ensemble import (
+    EnsembleScanner,
+    boltzmann_weights,
+    parse_energy,
+)
+from molecule_scanner.execution import iter_jobs
+from molecule_scanner.scanner import MoleculeScanner as msc
+
+ATOM_IDS = dict(
+    sphere_center_atom_ids=[1],
+    z_ax_atom_ids=[2],
+    xz_plane_atoms_ids=[1, 3, 9],
+    atoms_to_delete_ids=[1],
+)
+
+
+@pytest.fixture
+def ensemble_file(tmp_path):
+    elements, coords = buried_volume.read_xyz("test/data/mad25_p.xyz")
+    rng = np.random.default_rng(0)
+    filename = tmp_path / "ensemble.xyz"
+    with open(filename, "w") as file:
+        for energy in [-1.0, -1.001, -0.99]:
+            frame = coords + rng.normal(scale=0.05, size=coords.shape)
+            file.write(f"{len(elements)}\n energy: {energy} gnorm: 0.0001\n")
+            for element, (x, y, z) in zip(elements, frame):
+                file.write(f"{element} {x:.6f} {y:.6f} {z:.6f}\n")
+    return str(filename)
+
+
+def test_iter_xyz_frames(ensemble_file):
+    frames = list(buried_volume.iter_xyz_frames(ensemble_file))
+    assert len(frames) == 3
+    elements, coords, comment = frames[1]
+    assert coords.shape == (257, 3)
+    assert parse_energy(comment) == -1.001
+    assert parse_energy("TITL mad25 in P2(1)/n") is None
+    assert parse_energy("Ru01 SCF Done: -3672.22033654 A.U.") == -3672.22033654
+    assert parse_energy("conformer 2 E=-1.5e-1") == -0.15
+    # numbers without an energy key are not taken for the energy
+    assert parse_energy("step 12 gnorm: 0.0004") is None
+    assert parse_energy(" -45.12 0.0004", pattern=r"^\s*(\S+)") == -45.12
+
+
+def test_ensemble_run(ensemble_file):
+    ensemble = EnsembleScanner(ensemble_file, backend="numpy", **ATOM_IDS)
+    df_frames, df_statistics = ensemble.run([3.0, 3.5], executor="threads")
+
+    assert len(df_frames) == 6
+    assert list(df_frames["frame"].unique()) == [0, 1, 2]
+    first = df_frames[(df_frames["frame"] == 0) & (df_frames["r"] == 3.5)]
+    elements, coords, comment = next(buried_volume.iter_xyz_frames(ensemble_file))
+    frame_file = f"{ensemble.working_dir}/first.xyz"
+    buried_volume.write_xyz(frame_file, elements, coords, comment)
+    reference = msc(frame_file, backend="numpy", **ATOM_IDS).run_single(
+        3.5, write_surf_files=False
+    )[0]
+    assert first["percent_buried_volume"].item() == reference["percent_buried_volume"]
+
+    mean = df_statistics.set_index(["r", "metric"])["mean"]
+    expected = df_frames.groupby("r")["percent_buried_volume"].mean()
+    for r_current in [3.0, 3.5]:
+        assert mean[r_current, "percent_buried_volume"] == pytest.approx(
+            expected[r_current]
+        )
+    assert (df_statistics["n_frames"] == 3).all()
+
+    # the lowest energy frame dominates at low temperature
+    df_frames, df_statistics = ensemble.run(
+        3.5, weighting="boltzmann", temperature=10, executor="serial"
+    )
+    assert df_frames["weight"].idxmax() == 1
+    mean = df_statistics.set_index("metric")["mean"]
+    assert mean["percent_buried_volume"] == pytest.approx(
+        df_frames.loc[1, "percent_buried_volume"]
+    )
+
+    with pytest.raises(ValueError):
+        ensemble.run(3.5, weighting="energy")
+
+
+def test_ensemble_mismatched_frames(tmp_path):
+    filename = tmp_path / "mixed.xyz"
+    with open(filename, "w") as file:
+        file.write("2\n\nH 0 0 0\nH 0 0 0.7\n2\n\nH 0 0 0\nCl 0 0 1.3\n")
+    ensemble = EnsembleScanner(filename, [1], [2], [1, 2], backend="numpy")
+    with pytest.raises(ValueError):
+        list(ensemble.iter_frames())
+
+
+def test_boltzmann_weights():
+    weights = boltzmann_weights([0.0, 0.0, 100.0], energy_unit="kJ/mol")
+    assert weights == pytest.approx([0.5, 0.5, 0.0])
+    with pytest.raises(ValueError):
+        boltzmann_weights([0.0], energy_unit="kcal")
+
+
+def test_iter_jobs_streaming(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 4)
+    consumed = []
+
+    def jobs():
+        for i in range(20):
+            consumed.append(i)
+            yield (i,)
+
+    results = iter_jobs(abs, jobs(), "threads", 4, ordered=True, max_pending=3)
+    next(results)
+    assert len(consumed) == 3
+    assert [result for _, result, _ in results] == list(range(1, 20))
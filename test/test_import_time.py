@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from molecule_scanner.scanner import MoleculeScanner as msc
+
+LAZY_PACKAGES = ["dash", "dash_bio", "plotly", "pandas", "joblib", "scipy"]
+
+
+def test_scanner_import_is_lazy():
+    code = (
+        "import sys, molecule_scanner.scanner; "
+        "print(','.join(sorted({name.split('.')[0] for name in sys.modules})))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    loaded = process.stdout.strip().split(",")
+    assert "molecule_scanner" in loaded
+    assert [name for name in LAZY_PACKAGES if name in loaded] == []
+
+
+def test_visualization_helpers(monkeypatch):
+    pytest.importorskip("dash")
+    # the helpers still work where the plotting packages are installed
+    from molecule_scanner import visualization
+
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    df_scan = msc_test.run_range(r_min=3, r_max=4, nsteps=2, write_surf_files=False)
+    fig = visualization.scan_plot_figure(df_scan, "percent_buried_volume")
+    assert list(fig.data[0].x) == [3.0, 4.0]
+    assert list(fig.data[0].y) == list(df_scan["percent_buried_volume"])
+    assert fig.layout.yaxis.title.text == "percent buried volume"
+
+    cavity_map = msc_test.steric_map(3.5, 0.2)
+    x, y, z_top, z_bottom = cavity_map
+    top = visualization.cavity_plot_figure(cavity_map, "Top")
+    assert np.array_equal(top.data[0].z, z_top, equal_nan=True)
+    assert np.array_equal(top.data[0].x, x)
+    bottom = visualization.cavity_plot_figure(cavity_map, "Bottom")
+    assert np.array_equal(bottom.data[0].z, z_bottom, equal_nan=True)
+    surfaces = visualization.cavity_plot_figure(cavity_map, "3D").data
+    assert [trace.type for trace in surfaces] == ["surface", "surface"]
+    assert np.array_equal(surfaces[1].z, z_bottom, equal_nan=True)
+    with pytest.raises(ValueError):
+        visualization.cavity_plot_figure(cavity_map, "Side")
+
+    # the widgets build their apps without starting a server here
+    apps = []
+    monkeypatch.setattr(
+        visualization, "_run_inline", lambda app, port: apps.append((app, port))
+    )
+    msc_test.plot_graph(df_scan)
+    msc_test.visualize_cavity(3.5, 0.2)
+    assert [port for _, port in apps] == [8091, 8090]
+    dropdown = apps[0][0].layout.children[2]
+    assert "percent_buried_volume" in dropdown.options and "r" not in dropdown.options
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from molecule_scanner.execution import iter_jobs
+from molecule_scanner.jobs import JobManager
+from molecule_scanner.scanner import MoleculeScanner as msc
+
+
+def _wait(job, timeout=60):
+    start = time.perf_counter()
+    while not job.finished_running:
+        assert time.perf_counter() - start < timeout
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def msc_test():
+    return msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+
+
+def test_scan_job(msc_test):
+    df_scan = msc_test.run_range(r_min=3, r_max=5, nsteps=6, n_threads=1)
+
+    manager = JobManager()
+    job = manager.get(manager.submit_scan(msc_test, r_min=3, r_max=5, nsteps=6))
+    _wait(job)
+
+    assert job.status == "done"
+    assert job.progress()["done"] == job.total == 6
+    assert job.progress()["eta"] is None
+    assert job.result.equals(df_scan)
+    manager.shutdown()
+
+
+def test_cancel_scan_job(msc_test):
+    run_single = msc_test.run_single
+    release = threading.Event()
+
+    def slow_run_single(sphere_radius, **kwargs):
+        if sphere_radius > 3:
+            release.wait(10)
+        return run_single(sphere_radius, **kwargs)
+
+    msc_test.run_single = slow_run_single
+
+    manager = JobManager()
+    job_id = manager.submit_scan(
+        msc_test, r_min=3, r_max=5, nsteps=3, n_threads=1, ordered=True
+    )
+    job = manager.get(job_id)
+    while job.done == 0:
+        time.sleep(0.01)
+
+    # the partial results are available while the job is running
+    assert list(job.frame()["r"]) == [3]
+    assert job.eta() is not None
+
+    manager.cancel(job_id)
+    release.set()
+    _wait(job)
+    assert job.status == "cancelled"
+    assert job.done < 3
+    manager.shutdown()
+
+
+def test_cancel_before_submit(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    started = []
+    cancel = threading.Event()
+
+    def job(i):
+        started.append(i)
+        if i == 1:
+            cancel.set()
+        return i
+
+    results = list(
+        iter_jobs(job, [(i,) for i in range(10)], "threads", 2, cancelled=cancel.is_set)
+    )
+    # the jobs in flight when the cancel came are finished, no further job is started
+    assert len(started) <= 3
+    assert sorted(result for _, result, _ in results) == sorted(started)
+
+
+def test_rows_since(msc_test):
+    manager = JobManager()
+    job = manager.get(manager.submit_scan(msc_test, r_min=3, r_max=5, nsteps=4))
+    _wait(job)
+    rows, offset = job.rows_since(0)
+    assert len(rows) == offset == 4
+    assert job.rows_since(offset) == ([], 4)
+    assert job.rows_since(2)[0] == job.rows()[2:]
+    manager.shutdown()
+
+
+def test_call_job(msc_test):
+    manager = JobManager()
+    job = manager.get(manager.submit(msc_test.run_single, 3.5))
+    _wait(job)
+    assert job.status == "done"
+    assert job.result == msc_test.run_single(3.5)
+
+    job = manager.get(manager.submit(msc_test.run_single, "no radius"))
+    _wait(job)
+    assert job.status == "failed"
+    assert job.error is not None
+    manager.shutdown()
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from molecule_scanner.cli import main
+from molecule_scanner.ledger import JobLedger, run_ledger, work, worker_id
+from molecule_scanner.scanner import MoleculeScanner as msc
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MOLECULE = dict(
+    xyz_filepath=os.path.join(DATA_DIR, "mad25_p.xyz"),
+    sphere_center_atom_ids=[1],
+    z_ax_atom_ids=[2],
+    xz_plane_atoms_ids=[1, 3, 9],
+    atoms_to_delete_ids=[1],
+    backend="numpy",
+)
+PARAMETERS = dict(mesh_size=0.2, remove_H=True)
+
+
+def test_ledger_run(tmp_path):
+    ledger = JobLedger(tmp_path / "ledger.sqlite")
+    assert ledger.add_molecule(MOLECULE, [3.0, 3.5, 4.0], **PARAMETERS) == 3
+    # adding the same tasks again does not repeat them
+    assert ledger.add_molecule(MOLECULE, [3.5, 4.0, 4.5], **PARAMETERS) == 1
+    assert ledger.counts()["pending"] == 4
+
+    assert work(ledger.path, max_tasks=2) == 2
+    assert ledger.counts() == {"pending": 2, "running": 0, "done": 2, "failed": 0}
+
+    counts = run_ledger(ledger.path)
+    assert counts == {"pending": 0, "running": 0, "done": 4, "failed": 0}
+    df_results = ledger.results("mad25_p")
+    assert sorted(df_results["r"].unique()) == [3.0, 3.5, 4.0, 4.5]
+
+    reference = msc(**MOLECULE).run_single(3.5, write_surf_files=False, **PARAMETERS)[0]
+    buried = df_results[
+        (df_results["r"] == 3.5) & (df_results["metric"] == "percent_buried_volume")
+    ]
+    assert buried["value"].item() == reference["percent_buried_volume"]
+
+    # a finished sweep has nothing left to run
+    assert work(ledger.path) == 0
+
+
+def test_ledger_recovery(tmp_path):
+    ledger = JobLedger(tmp_path / "ledger.sqlite")
+    ledger.add_molecule(MOLECULE, [3.0, 3.5], **PARAMETERS)
+    ledger.add_molecule(MOLECULE, [3.0], mesh_size=0.2, radii_table="unknown")
+
+    # a worker of this machine which died and a worker of another machine
+    host = worker_id().rpartition(":")[0]
+    first = ledger.claim(worker=f"{host}:999999999")
+    second = ledger.claim(worker="other-host:1")
+    assert first["id"] != second["id"]
+    assert first["parameters"]["mesh_size"] == 0.2
+    assert ledger.recover() == 1
+    assert ledger.counts()["running"] == 1
+
+    counts = run_ledger(ledger.path)
+    assert counts == {"pending": 0, "running": 1, "done": 1, "failed": 1}
+    ((_, r_failed, error),) = ledger.errors()
+    assert r_failed == 3.0 and "KeyError" in error
+
+    # an expired lease is claimed again, failed tasks only on request
+    counts = run_ledger(ledger.path, lease_timeout=0, retry_failed=True)
+    assert counts == {"pending": 0, "running": 0, "done": 2, "failed": 1}
+    with sqlite3.connect(ledger.path) as connection:
+        attempts = dict(connection.execute("SELECT id, attempts FROM tasks"))
+    assert attempts[second["id"]] == 2
+
+    with pytest.raises(ValueError):
+        ledger.reset(["finished"])
+
+
+def test_ledger_stale_claim(tmp_path):
+    ledger = JobLedger(tmp_path / "ledger.sqlite")
+    ledger.add_molecule(MOLECULE, [3.0], **PARAMETERS)
+
+    # the lease of the first worker expires and the task is claimed again
+    stale = ledger.claim(worker="other-host:1")
+    current = ledger.claim(worker="other-host:2", lease_timeout=0)
+    assert stale["id"] == current["id"] and stale["claim"] != current["claim"]
+
+    assert ledger.complete(current["id"], current["claim"], [{"value": 1.0}])
+    assert not ledger.fail(stale["id"], stale["claim"], "late failure")
+    assert not ledger.complete(stale["id"], stale["claim"], [{"value": 2.0}])
+    assert ledger.counts()["done"] == 1
+    assert ledger.results()["value"].tolist() == [1.0]
+
+
+def test_ledger_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    ledger = JobLedger(tmp_path / "ledger.sqlite")
+    ledger.add_molecule(MOLECULE, [3.0, 3.25, 3.5, 3.75, 4.0], **PARAMETERS)
+    counts = run_ledger(ledger.path, n_workers=2)
+    assert counts["done"] == 5
+    with sqlite3.connect(ledger.path) as connection:
+        attempts = [row[0] for row in connection.execute("SELECT attempts FROM tasks")]
+    # every task was claimed by exactly one worker
+    assert attempts == [1] * 5
+
+
+def test_cli_ledger(tmp_path):
+    ledger_path = str(tmp_path / "scan.sqlite")
+    arguments = (
+        ["scan", MOLECULE["xyz_filepath"], "--center", "1", "--z-axis", "2"]
+        + ["--xz-plane", "1,3,9", "--delete", "1", "--r-min", "3", "--r-max", "3.5"]
+        + ["--steps", "2", "--mesh-size", "0.2", "--backend", "numpy"]
+        + ["--ledger", ledger_path, "-o", str(tmp_path / "scan.csv")]
+    )
+    assert main(arguments) == 0
+    # a rerun only collects the finished tasks
+    assert main(arguments) == 0
+    ledger = JobLedger(ledger_path)
+    assert ledger.counts()["done"] == 2
+    with sqlite3.connect(ledger_path) as connection:
+        assert connection.execute("SELECT MAX(attempts) FROM tasks").fetchone()[0] == 1
+
+    df_scan = pd.read_csv(tmp_path / "scan.csv")
+    assert list(df_scan["r"]) == [3.0, 3.5]
+    assert df_scan.columns[1] == "free_volume"
@@ -0,0 +1,50 @@
+import numpy as np
+
+from molecule_scanner.level_of_detail import (
+    axis_indices,
+    decimate_grid,
+    minmax_indices,
+    relayout_ranges,
+)
+
+
+def test_decimate_grid():
+    axis = np.linspace(-5, 5, 1001)
+    z = np.add.outer(axis, 2 * axis)
+    x, y, z_small = decimate_grid(axis, axis, z, 100)
+    assert len(x) <= 101 and len(y) <= 101
+    assert x[0] == -5 and x[-1] == 5
+    assert z_small.dtype == np.float32
+    assert np.allclose(z_small, np.add.outer(x, 2 * y), atol=1e-5)
+
+    x, y, z_zoom = decimate_grid(axis, axis, z, 100, x_range=(1, 2), y_range=(2, -3))
+    assert x[0] < 1 < 2 < x[-1] and y[0] < -3 < 2 < y[-1]
+    assert z_zoom.shape == (len(x), len(y))
+    assert list(axis_indices(axis, (1, 2))) == list(range(599, 702))
+
+
+def test_minmax_indices():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=100000)
+    values[1234] = 10.0
+    values[5678] = np.nan
+    indices = minmax_indices(values, 500)
+    assert len(indices) <= 1002
+    assert np.all(np.diff(indices) > 0)
+    assert 1234 in indices
+    assert indices[0] == 0 and indices[-1] == len(values) - 1
+    assert not np.isnan(values[indices[1:-1]]).any()
+    assert list(minmax_indices(values[:10], 500)) == list(range(10))
+
+
+def test_relayout_ranges():
+    assert relayout_ranges(None) is None
+    assert relayout_ranges({"scene.camera": {}}) is None
+    assert relayout_ranges({"xaxis.range[0]": 1, "xaxis.range[1]": 2}) == {
+        "x": (1.0, 2.0),
+        "y": None,
+    }
+    assert relayout_ranges({"xaxis.autorange": True, "yaxis.autorange": True}) == {
+        "x": None,
+        "y": None,
+    }
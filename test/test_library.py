@@ -0,0 +1,113 @@
+import importlib.util
+import json
+import os
+import pytest
+import pandas as pd
+from molecule_scanner import library
+from molecule_scanner.library import load_manifest, scan_library
+from molecule_scanner.result_store import ResultStore
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def test_load_manifest(tmp_path):
+    manifest = tmp_path / "manifest.csv"
+    pd.DataFrame(
+        {
+            "xyz_filepath": [
+                os.path.join(DATA_DIR, "mad25_p.xyz"),
+                os.path.join(DATA_DIR, "nhc.xyz"),
+            ],
+            "sphere_center_atom_ids": ["1", "1"],
+            "z_ax_atom_ids": ["2", "2"],
+            "xz_plane_atoms_ids": ["1,3,9", "1 3 9"],
+            "atoms_to_delete_ids": ["1", ""],
+        }
+    ).to_csv(manifest, index=False)
+
+    molecules = load_manifest(str(manifest))
+    assert [molecule["name"] for molecule in molecules] == ["mad25_p", "nhc"]
+    assert molecules[0]["xz_plane_atoms_ids"] == [1, 3, 9]
+    assert molecules[1]["xz_plane_atoms_ids"] == [1, 3, 9]
+    assert molecules[1]["atoms_to_delete_ids"] is None
+
+    with pytest.raises(ValueError):
+        load_manifest([{"xyz_filepath": "nhc.xyz"}])
+
+
+def test_scan_library(tmp_path):
+    manifest = tmp_path / "manifest.json"
+    with open(manifest, "w") as file:
+        json.dump(
+            [
+                {
+                    "name": name,
+                    "xyz_filepath": os.path.join(DATA_DIR, f"{name}.xyz"),
+                    "sphere_center_atom_ids": [1],
+                    "z_ax_atom_ids": [2],
+                    "xz_plane_atoms_ids": [1, 3, 9],
+                    "atoms_to_delete_ids": [1],
+                }
+                for name in ["mad25_p", "GC1"]
+            ],
+            file,
+        )
+
+    output_file = tmp_path / "results.csv"
+    store = None
+    if importlib.util.find_spec("pyarrow") is not None:
+        store = ResultStore(tmp_path / "results")
+    df_results = scan_library(
+        str(manifest),
+        [3.0, 3.5],
+        backend="numpy",
+        output_file=str(output_file),
+        store=store,
+    )
+    assert len(df_results) == 2 * 2 * 7
+    assert set(df_results["molecule"]) == {"mad25_p", "GC1"}
+    assert len(pd.read_csv(output_file)) == len(df_results)
+    if store is not None:
+        df_stored = store.read_scans(columns=["molecule", "value"])
+        assert len(df_stored) == len(df_results)
+
+    buried = df_results[
+        (df_results["molecule"] == "mad25_p")
+        & (df_results["r"] == 3.5)
+        & (df_results["metric"] == "percent_buried_volume")
+    ]
+    assert buried["value"].iloc[0] == pytest.approx(69.0, abs=0.11)
+
+    # a rerun replaces the rows of the earlier screen
+    scan_library(str(manifest), [3.0], backend="numpy", output_file=str(output_file))
+    assert len(pd.read_csv(output_file)) == 2 * 7
+
+
+def test_iter_library_streaming(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    created = []
+    original_init = library.MoleculeScanner.__init__
+
+    def init(self, *args, **kwargs):
+        created.append(kwargs.get("xyz_filepath", args[0] if args else None))
+        original_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(library.MoleculeScanner, "__init__", init)
+    molecule = {
+        "xyz_filepath": os.path.join(DATA_DIR, "mad25_p.xyz"),
+        "sphere_center_atom_ids": [1],
+        "z_ax_atom_ids": [2],
+        "xz_plane_atoms_ids": [1, 3, 9],
+        "atoms_to_delete_ids": [1],
+    }
+    manifest = [dict(molecule, name=f"copy_{i}") for i in range(4)]
+    results = library.iter_library(
+        manifest, [3.0], n_workers=1, backend="numpy", max_pending=1
+    )
+    next(results)
+    # only the scanners of the submitted jobs exist
+    assert len(created) <= 2
+    assert len(list(results)) == 3
+
+    with pytest.raises(ValueError, match="copy_0"):
+        library.iter_library(manifest + [dict(molecule, name="copy_0")], [3.0])
@@ -1,5 +1,13 @@
+import os
 import pytest
-from molecule_scanner.scanner import MoleculeScanner as msc
+from molecule_scanner.scanner import (
+    MoleculeScanner as msc,
+    adaptive_interval_errors,
+    get_n_workers,
+    richardson_extrapolate,
+)
+from molecule_scanner.cache import ResultCache
+from molecule_scanner import buried_volume
 import numpy as np
 import pandas as pd
 
@@ -82,3 +90,486 @@ def test_run_range():
 
     df_scan_1_63 = msc_test.run_range(r_min=3, r_max=5, nsteps=40, n_threads=-1)
     assert len(df_scan_1_63) == 40
+
+
+@pytest.mark.parametrize(
+    "xyz_filepath", ["test/data/mad25_p.xyz", "test/data/GC1.xyz", "test/data/nhc.xyz"]
+)
+def test_numpy_backend(xyz_filepath):
+    scanners = [
+        msc(
+            xyz_filepath=xyz_filepath,
+            sphere_center_atom_ids=[1],
+            z_ax_atom_ids=[2],
+            xz_plane_atoms_ids=[1, 3, 9],
+            atoms_to_delete_ids=[1],
+            backend=backend,
+        )
+        for backend in ["sambvca", "numpy"]
+    ]
+    for args in [(3.5,), (4.1, 1, 0.2, False, False, False)]:
+        sambvca_results, numpy_results = [
+            scanner.run_single(*args) for scanner in scanners
+        ]
+        for key, value in sambvca_results[0].items():
+            assert numpy_results[0][key] == pytest.approx(value, abs=0.11)
+        # both backends return 4 quadrant and 8 octant regions per metric
+        for level, names in [
+            (1, buried_volume.QUADRANT_NAMES),
+            (2, buried_volume.OCTANT_NAMES),
+        ]:
+            assert sambvca_results[level].keys() == numpy_results[level].keys()
+            for key, regions in numpy_results[level].items():
+                assert list(sambvca_results[level][key]) == list(regions) == names
+                for region, value in regions.items():
+                    assert sambvca_results[level][key][region] == pytest.approx(
+                        value, abs=0.11
+                    )
+
+    with pytest.raises(ValueError):
+        msc(
+            xyz_filepath=xyz_filepath,
+            sphere_center_atom_ids=[1],
+            z_ax_atom_ids=[2],
+            xz_plane_atoms_ids=[1, 3, 9],
+            backend="fortran",
+        )
+
+
+def test_backends_small_volume():
+    # sambvca21 output with a total volume below 10 Angs^3 is not accepted
+    sambvca, numpy = [
+        msc(
+            xyz_filepath="test/data/GC1.xyz",
+            sphere_center_atom_ids=[1],
+            z_ax_atom_ids=[2],
+            xz_plane_atoms_ids=[1, 3, 9],
+            atoms_to_delete_ids=[1],
+            backend=backend,
+        ).run_single(2.0, write_surf_files=False)
+        for backend in ["sambvca", "numpy"]
+    ]
+    assert sambvca == (None, None, None)
+    assert numpy[0]["free_volume"] < 10
+    assert numpy[0]["percent_buried_volume"] == pytest.approx(99.7, abs=0.11)
+
+
+def test_run_range_sweep():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+
+    df_scan = msc_test.run_range(r_min=2, r_max=5, nsteps=31, n_threads=1)
+    df_sweep = msc_test.run_range(r_min=2, r_max=5, nsteps=31, sweep=True)
+    assert len(df_sweep) == 31
+    assert list(df_sweep.columns) == list(df_scan.columns)
+    assert np.allclose(
+        df_sweep.values, df_scan.reset_index(drop=True).values, atol=0.11
+    )
+
+
+def test_result_cache(tmp_path):
+    def make_scanner():
+        return msc(
+            xyz_filepath="test/data/mad25_p.xyz",
+            sphere_center_atom_ids=[1],
+            z_ax_atom_ids=[2],
+            xz_plane_atoms_ids=[1, 3, 9],
+            atoms_to_delete_ids=[1],
+            backend="numpy",
+            cache_dir=str(tmp_path),
+        )
+
+    results = make_scanner().run_single(sphere_radius=3.5)
+    # a new scanner in a fresh session reads the stored result
+    msc_test = make_scanner()
+    assert len(msc_test.cache) == 1
+    assert msc_test.run_single(sphere_radius=3.5) == results
+
+    msc_test.run_range(r_min=3, r_max=4, nsteps=3, n_threads=1)
+    assert len(msc_test.cache) == 3
+
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=3)
+    for i in range(5):
+        cache.set(str(i), [i])
+    cache.get("2")
+    cache.set("5", [5])
+    assert len(cache) == 3
+    assert "2" in cache
+    assert "3" not in cache
+
+
+def test_run_range_executors():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    df_serial = msc_test.run_range(r_min=3, r_max=5, nsteps=8, executor="serial")
+    assert list(df_serial["r"]) == list(np.linspace(3, 5, 8))
+    for executor in ["threads", "processes"]:
+        df_scan = msc_test.run_range(
+            r_min=3, r_max=5, nsteps=8, executor=executor, n_threads=2
+        )
+        assert df_scan.equals(df_serial)
+
+    with pytest.raises(ValueError):
+        msc_test.run_range(r_min=3, r_max=5, nsteps=8, executor="mpi")
+
+    assert get_n_workers(-1, 1000) == os.cpu_count()
+    assert get_n_workers(1000, 1000) <= os.cpu_count()
+    assert get_n_workers(4, 2) <= 2
+
+
+def test_run_range_adaptive():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    df_adaptive = msc_test.run_range_adaptive(
+        r_min=1.5, r_max=6, max_evaluations=20, n_initial=5, n_threads=1
+    )
+    df_reference = msc_test.run_range(r_min=1.5, r_max=6, nsteps=200, sweep=True)
+
+    assert 5 < len(df_adaptive) <= 20
+    assert list(df_adaptive.columns) == list(df_reference.columns)
+    assert df_adaptive["r"].is_monotonic_increasing
+    interpolated = np.interp(
+        df_reference["r"], df_adaptive["r"], df_adaptive["percent_buried_volume"]
+    )
+    assert np.max(np.abs(interpolated - df_reference["percent_buried_volume"])) < 2
+
+    assert list(adaptive_interval_errors([(0, 0), (1, 1), (2, 4)])) == [1, 1]
+    assert list(adaptive_interval_errors([(0, 0), (1, 1), (2, 2)])) == [0, 0]
+
+
+def test_run_converged():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    convergence = msc_test.run_single_converged(2.0, min_mesh_size=0.05)
+    meshes = [mesh for mesh, _ in convergence["history"]]
+    assert meshes[0] == 0.2
+    assert convergence["mesh_size"] == meshes[-1] >= 0.05
+    # the unrounded metric is compared, the results are rounded as usual
+    assert convergence["value"] == pytest.approx(
+        convergence["results"][0]["percent_buried_volume"], abs=0.05
+    )
+    assert abs(
+        convergence["extrapolated_value"] - convergence["value"]
+    ) == pytest.approx(convergence["error"])
+
+    # never refined below the minimum mesh size
+    strict = msc_test.run_single_converged(2.0, tolerance=0, min_mesh_size=0.05)
+    assert not strict["converged"]
+    assert strict["mesh_size"] == pytest.approx(0.05)
+    assert len(strict["history"]) == 3
+
+    # sambvca21 values are quantized to 0.1, the change is reported instead of an extrapolation
+    sambvca = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+    ).run_single_converged(2.0, tolerance=0.1, min_mesh_size=0.1)
+    (_, coarse), (_, fine) = sambvca["history"]
+    assert sambvca["value"] == sambvca["extrapolated_value"] == fine
+    assert sambvca["error"] == abs(fine - coarse)
+    assert sambvca["converged"] == (sambvca["error"] <= 0.1 + 1e-9)
+
+    df_converged = msc_test.run_range_converged(2, 4, 3, n_threads=1)
+    assert list(df_converged["r"]) == [2, 3, 4]
+    assert df_converged["converged"].all()
+    assert (df_converged["percent_buried_volume_error"] < 0.1).all()
+
+    extrapolated, error = richardson_extrapolate(1.0, 2.0)
+    assert extrapolated == pytest.approx(2 + 1 / 3)
+    assert error == pytest.approx(1 / 3)
+
+
+@pytest.mark.parametrize("sampling", ["random", "sobol"])
+def test_run_monte_carlo(sampling):
+    if sampling == "sobol":
+        pytest.importorskip("scipy")
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    reference = msc_test.run_single(3.5, write_surf_files=False)
+    estimate = msc_test.run_single_monte_carlo(
+        3.5, n_samples=32768, sampling=sampling, seed=0
+    )
+    assert estimate["n_samples"] == 32768
+    for level in range(3):
+        assert estimate["results"][level].keys() == reference[level].keys()
+        assert estimate["standard_errors"][level].keys() == reference[level].keys()
+
+    def check(value, error, expected):
+        # the mesh reference is rounded to 0.1
+        assert 0 < error < 2
+        assert abs(value - expected) < 5 * error + 0.1
+
+    check(
+        estimate["results"][0]["percent_buried_volume"],
+        estimate["standard_errors"][0]["percent_buried_volume"],
+        reference[0]["percent_buried_volume"],
+    )
+    for name, expected in reference[2]["percent_buried_volume"].items():
+        check(
+            estimate["results"][2]["percent_buried_volume"][name],
+            estimate["standard_errors"][2]["percent_buried_volume"][name],
+            expected,
+        )
+    assert sum(estimate["results"][1]["buried_volume"].values()) == pytest.approx(
+        estimate["results"][0]["buried_volume"]
+    )
+
+    df_preview = msc_test.run_range_monte_carlo(
+        3, 4, 3, time_budget=0.01, sampling=sampling, seed=0
+    )
+    assert list(df_preview["r"]) == [3, 3.5, 4]
+    assert (df_preview["n_samples"] > 0).all()
+    assert "percent_buried_volume_error" in df_preview
+
+    with pytest.raises(ValueError):
+        msc_test.run_single_monte_carlo(3.5, sampling="halton")
+
+
+@pytest.mark.parametrize("backend,sweep", [("sambvca", False), ("numpy", True)])
+def test_run_range_all_levels(backend, sweep):
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend=backend,
+    )
+    df_levels = msc_test.run_range(
+        r_min=3, r_max=4, nsteps=3, sweep=sweep, all_levels=True
+    )
+    assert list(df_levels.columns) == ["r", "level", "region", "metric", "value"]
+    assert len(df_levels) == 3 * (7 + 4 * 5 + 8 * 5)
+    assert df_levels["level"].dtype == "category"
+    assert df_levels["value"].dtype == float
+
+    df_total = msc_test.run_range(r_min=3, r_max=4, nsteps=3, sweep=sweep)
+    df_buried = df_levels[
+        (df_levels["level"] == "total")
+        & (df_levels["metric"] == "percent_buried_volume")
+    ]
+    assert list(df_buried["value"]) == list(df_total["percent_buried_volume"])
+
+    # the quadrants add up to the total buried volume
+    df_pivot = df_levels[df_levels["metric"] == "buried_volume"].pivot_table(
+        index="r", columns="level", values="value", aggfunc="sum", observed=True
+    )
+    assert np.allclose(df_pivot["quadrant"], df_pivot["total"], atol=0.3)
+    assert np.allclose(df_pivot["octant"], df_pivot["total"], atol=0.5)
+
+
+def test_iter_range():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    df_scan = msc_test.run_range(r_min=3, r_max=5, nsteps=6, n_threads=1)
+
+    rows = list(msc_test.iter_range(r_min=3, r_max=5, nsteps=6, ordered=True))
+    assert pd.DataFrame(rows).equals(df_scan)
+
+    rows = list(msc_test.iter_range(r_min=3, r_max=5, nsteps=6, executor="threads"))
+    assert sorted(row["r"] for row in rows) == list(df_scan["r"])
+
+    # stopping early is possible at any time
+    rows = msc_test.iter_range(r_min=3, r_max=5, nsteps=6, ordered=True)
+    assert next(rows)["r"] == 3
+    rows.close()
+
+
+def test_iter_range_failed_radius(monkeypatch):
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+    )
+    run_single = msc_test.run_single
+
+    def failing_run_single(sphere_radius, **kwargs):
+        if sphere_radius == 4:
+            raise RuntimeError("sambvca21 did not terminate normally")
+        return run_single(sphere_radius, **kwargs)
+
+    monkeypatch.setattr(msc_test, "run_single", failing_run_single)
+    rows = list(msc_test.iter_range(r_min=3, r_max=5, nsteps=3, ordered=True))
+    assert [row["r"] for row in rows] == [3, 5]
+
+
+@pytest.mark.parametrize("backend", ["numpy", "sambvca"])
+def test_steric_map(backend):
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend=backend,
+    )
+    x, y, z_top, z_bottom = msc_test.steric_map(3.5, mesh_size=0.2)
+    assert z_top.dtype == np.float32 and z_bottom.dtype == np.float32
+    assert z_top.shape == z_bottom.shape == (len(x), len(y))
+    assert np.array_equal(np.isnan(z_top), np.isnan(z_bottom))
+    assert np.all(z_top[~np.isnan(z_top)] >= z_bottom[~np.isnan(z_bottom)])
+
+    # same surfaces as the files written by the backend
+    X, Y, Z_top, Z_bottom, _ = msc_test.reshape_data(msc_test.generate_cavity(3.5, 0.2))
+    assert np.allclose(X[:, 0], x, atol=0.005)
+    assert np.allclose(Y[0], y, atol=0.005)
+    assert np.allclose(Z_top, z_top, atol=0.006, equal_nan=True)
+    assert np.allclose(Z_bottom, z_bottom, atol=0.006, equal_nan=True)
+
+
+def test_read_surface_file():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+    )
+    top_file, _, key = msc_test.run_single(
+        3.5, mesh_size=0.2, return_surface_files=True
+    )
+    df_top = pd.read_csv(top_file, sep=r"\s+", header=None)
+
+    x, y, z_top = buried_volume.read_surface_file(top_file)
+    assert z_top.shape == (len(x), len(y)) == (36, 36)
+    assert np.array_equal(np.repeat(x, len(y)), df_top[0].values)
+    assert np.array_equal(np.tile(y, len(x)), df_top[1].values)
+    assert np.array_equal(z_top.ravel(), df_top[2].values)
+    assert not os.path.exists(buried_volume.surface_array_path(top_file, key))
+
+    df_cavity = msc_test.generate_cavity(3.5, 0.2, persist_arrays=True)
+    assert os.path.exists(buried_volume.surface_array_path(top_file, key))
+    # arrays of other parameters are not picked up
+    assert not os.path.exists(buried_volume.surface_array_path(top_file))
+    assert not os.path.exists(buried_volume.surface_array_path(top_file, "other"))
+
+    # the persisted arrays are used without running sambvca again
+    os.remove(top_file)
+    assert msc_test.generate_cavity(3.5, 0.2).equals(df_cavity)
+    assert not os.path.exists(top_file)
+
+    with pytest.raises(ValueError):
+        buried_volume.grid_shape(np.array([0.0, 0.0, 1.0, 1.0, 2.0]))
+
+
+def test_profiling(tmp_path):
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        backend="numpy",
+        profile=True,
+    )
+    msc_test.run_range(r_min=3, r_max=5, nsteps=3, write_surf_files=False)
+
+    df_records = msc_test.profiler.to_frame()
+    assert set(df_records["stage"]) == {
+        "run_single",
+        "prepare_atoms",
+        "integrate",
+        "format_results",
+        "assemble_frame",
+    }
+    assert sorted(df_records.loc[df_records["stage"] == "integrate", "radius"]) == [
+        3,
+        4,
+        5,
+    ]
+    assert (df_records["wall_time"] >= 0).all()
+
+    df_summary = msc_test.profiler.summary()
+    assert df_summary.set_index("stage").loc["run_single", "calls"] == 3
+
+    trace_file = str(tmp_path / "trace.json")
+    trace = msc_test.profiler.to_chrome_trace(trace_file)
+    assert len(trace["traceEvents"]) == len(df_records)
+    assert {event["ph"] for event in trace["traceEvents"]} == {"X"}
+    assert os.path.exists(trace_file)
+
+    # profiled scanners can still be sent to worker processes
+    df_scan = msc_test.run_range(r_min=3, r_max=5, nsteps=3, executor="processes")
+    assert len(df_scan) == 3
+
+    msc_test.profiler.clear()
+    assert len(msc_test.profiler.to_frame()) == 0
+    assert (
+        msc(
+            xyz_filepath="test/data/mad25_p.xyz",
+            sphere_center_atom_ids=[1],
+            z_ax_atom_ids=[2],
+            xz_plane_atoms_ids=[1, 3, 9],
+        ).profiler
+        is None
+    )
+
+
+def test_profiling_sambvca():
+    msc_test = msc(
+        xyz_filepath="test/data/mad25_p.xyz",
+        sphere_center_atom_ids=[1],
+        z_ax_atom_ids=[2],
+        xz_plane_atoms_ids=[1, 3, 9],
+        atoms_to_delete_ids=[1],
+        profile=True,
+    )
+    msc_test.run_single(3.5, write_surf_files=False)
+
+    calls = msc_test.profiler.summary().set_index("stage")["calls"]
+    assert calls["sambvca21"] == calls["parse_output"] == 1
+
+
+def test_parse_surface_file(tmp_path):
+    fixed = tmp_path / "fixed.dat"
+    fixed.write_text("  -12.25  100.50   -0.05\n    1.00    0.00 -999.99\n")
+    free = tmp_path / "free.dat"
+    free.write_text("1 2 3 4\n-4.5 6 7 8\n")
+    for filename in (fixed, free):
+        assert np.array_equal(
+            buried_volume.parse_surface_file(str(filename)),
+            np.loadtxt(filename, usecols=(0, 1, 2)),
+        )
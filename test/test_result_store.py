@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from molecule_scanner.result_store import ResultStore
+
+pytest.importorskip("pyarrow")
+
+
+def scan_frame(r_values):
+    return pd.DataFrame(
+        {
+            "r": r_values,
+            "percent_buried_volume": [10.0 * r for r in r_values],
+            "free_volume": [1.0 for _ in r_values],
+        }
+    )
+
+
+@pytest.mark.parametrize("table_format", ["parquet", "arrow"])
+def test_append_scans(tmp_path, table_format):
+    store = ResultStore(tmp_path / "results", table_format=table_format)
+    store.append_scan(scan_frame([3.0, 3.5]), molecule="mad25_p")
+    store.append_scan(scan_frame([4.0]), molecule="GC1")
+    assert len(store.scan_partitions()) == 2
+
+    df_scans = store.read_scans()
+    assert list(df_scans["r"]) == [3.0, 3.5, 4.0]
+    assert list(df_scans["molecule"]) == ["mad25_p", "mad25_p", "GC1"]
+
+    # only the requested columns and rows are read
+    df_scans = store.read_scans(columns=["r"], molecule="GC1")
+    assert list(df_scans.columns) == ["r"]
+    assert list(df_scans["r"]) == [4.0]
+
+    # a store written in one format can be read when appending in the other
+    other = ResultStore(tmp_path / "results", table_format="parquet")
+    other.append_scan(scan_frame([5.0]))
+    df_scans = other.read_scans(columns=["r", "molecule"])
+    assert list(df_scans["r"]) == [3.0, 3.5, 4.0, 5.0]
+    assert df_scans["molecule"].isna().sum() == 1
+
+    with pytest.raises(ValueError):
+        ResultStore(tmp_path / "results", table_format="csv")
+
+
+def test_append_cavities(tmp_path):
+    store = ResultStore(tmp_path / "results")
+    axis = np.linspace(-3, 3, 61)
+    z_top = np.outer(axis, axis)
+    name = store.append_cavity(
+        (axis, axis.copy(), z_top, -z_top), molecule="mad25_p", sphere_radius=3.0
+    )
+    store.append_cavity((axis, axis, z_top, z_top), molecule="GC1", sphere_radius=3.5)
+
+    partitions = store.cavity_partitions()
+    assert [labels["molecule"] for _, labels in partitions] == ["mad25_p", "GC1"]
+    assert partitions[0][0] == name
+
+    x_axis, y_axis, top, bottom = store.load_cavity(name)
+    assert np.array_equal(top, z_top) and np.array_equal(bottom, -z_top)
+    (top,) = store.load_cavity(name, keys=["z_top"])
+    assert np.array_equal(top, z_top)
+    # no temporary files are left behind
+    assert len(list((tmp_path / "results" / "cavities").iterdir())) == 2
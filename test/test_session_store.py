@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import pytest
+
+from molecule_scanner.session_store import SessionStore, new_session_id
+
+
+def test_session_store_spill(tmp_path):
+    store = SessionStore(spill_dir=tmp_path, max_sessions=2, max_spilled_sessions=2)
+    sessions = [new_session_id() for _ in range(5)]
+    for i, session_id in enumerate(sessions):
+        store.update(session_id, value=i, array=np.arange(i))
+
+    # the three oldest sessions were spilled, the oldest one was dropped from disk
+    assert len(os.listdir(tmp_path)) == 2
+    assert sessions[0] not in store
+    assert store.get(sessions[0], "value") is None
+    assert store.get(sessions[1], "value") == 1
+    assert store.get(sessions[2], "array").tolist() == [0, 1]
+    assert store.get(sessions[4], "value") == 4
+    assert store.get(sessions[4], "missing", "default") == "default"
+
+    store.set(sessions[4], "value", 40)
+    assert store.get(sessions[4], "value") == 40
+    store.remove(sessions[4])
+    assert sessions[4] not in store
+
+
+def test_session_store_invalid_id(tmp_path):
+    store = SessionStore(spill_dir=tmp_path)
+    with pytest.raises(ValueError):
+        store.get("../../etc/passwd", "scanner")
+    with pytest.raises(ValueError):
+        store.set(None, "scanner", 1)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from molecule_scanner import buried_volume
+from molecule_scanner.spatial_index import CellList
+
+
+@pytest.fixture
+def atoms():
+    rng = np.random.default_rng(0)
+    coords = rng.uniform(-5, 5, (200, 3))
+    radii = rng.uniform(1.0, 2.2, 200)
+    return coords, radii
+
+
+@pytest.mark.parametrize("cell_size", [None, 0.7, 3.0])
+def test_inside_any(atoms, cell_size):
+    coords, radii = atoms
+    index = CellList(coords, radii, cell_size=cell_size)
+    points = np.random.default_rng(1).uniform(-8, 8, (5000, 3))
+
+    dist2 = ((points[:, None, :] - coords[None, :, :]) ** 2).sum(axis=2)
+    assert np.array_equal(index.inside_any(points), (dist2 < radii**2).any(axis=1))
+
+
+def test_mark_block(atoms):
+    coords, radii = atoms
+    index = CellList(coords, radii)
+    axis = buried_volume.mesh_axis(6.0, 0.2)
+
+    expected = np.zeros((len(axis),) * 3, dtype=bool)
+    buried_volume.mark_buried(expected, axis, axis, axis, coords, radii)
+    buried = np.zeros_like(expected)
+    for start in range(0, len(axis), 7):
+        index.mark_block(buried[start : start + 7], axis[start : start + 7], axis, axis)
+    assert np.array_equal(buried, expected)
+
+    # blocks far away from all atoms have no candidates
+    assert len(index.atoms_in_box([20, 20, 20], [21, 21, 21])) == 0
+    assert set(index.atoms_in_box([-10] * 3, [10] * 3)) == set(range(len(radii)))
+
+
+def test_empty_index():
+    index = CellList(np.zeros((0, 3)), np.zeros(0))
+    assert not index.inside_any(np.zeros((3, 3))).any()
+    buried = np.zeros((2, 2, 2), dtype=bool)
+    index.mark_block(buried, np.arange(2.0), np.arange(2.0), np.arange(2.0))
+    assert not buried.any()